@@ -7,7 +7,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_display = ['title', 'appointment_type', 'agent', 'client', 'start_time', 'status', 'priority']
     list_filter = ['appointment_type', 'status', 'priority', 'is_virtual', 'start_time']
     search_fields = ['title', 'description', 'location', 'notes']
-    readonly_fields = ['created_at', 'updated_at', 'reminder_sent_at']
+    readonly_fields = ['created_at', 'updated_at', 'reminder_sent_at', 'recurrence_end', 'last_reminded_occurrence']
     date_hierarchy = 'start_time'
 
     fieldsets = (
@@ -23,6 +23,9 @@ class AppointmentAdmin(admin.ModelAdmin):
         ('Scheduling', {
             'fields': ('start_time', 'end_time', 'duration_minutes')
         }),
+        ('Recurrence', {
+            'fields': ('recurrence_rule', 'recurrence_end', 'series', 'original_start_time')
+        }),
         ('Location', {
             'fields': ('location', 'meeting_link', 'is_virtual')
         }),
@@ -30,7 +33,7 @@ class AppointmentAdmin(admin.ModelAdmin):
             'fields': ('status', 'priority')
         }),
         ('Reminders', {
-            'fields': ('send_reminder', 'reminder_sent', 'reminder_sent_at')
+            'fields': ('send_reminder', 'reminder_sent', 'reminder_sent_at', 'last_reminded_occurrence')
         }),
         ('Notes', {
             'fields': ('notes', 'client_notes')
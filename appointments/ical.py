@@ -0,0 +1,165 @@
+"""
+iCalendar (RFC 5545) feed generation and incremental sync helpers
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import AppointmentTombstone
+
+PRODID = '-//RIVERHEDGE PARTNERS LIMITED//Real Estate Platform//EN'
+
+# Sync tokens stay this far behind the latest change seen, so rows saved by
+# transactions still open during a sync (updated_at is set before commit)
+# are picked up by the next one
+SYNC_OVERLAP = timedelta(minutes=5)
+
+ICAL_STATUS = {
+    'scheduled': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'rescheduled': 'TENTATIVE',
+    'cancelled': 'CANCELLED',
+}
+
+
+def encode_sync_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_sync_token(token):
+    """Datetime encoded in a sync token, or None if it is malformed"""
+    try:
+        return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def calendar_etag(queryset, user):
+    """
+    ETag for a user's calendar from the latest change, the row count and the
+    latest tombstone, computed without loading any appointment
+    """
+    state = queryset.order_by().aggregate(last_change=Max('updated_at'), count=Count('id'))
+    last_removal = AppointmentTombstone.objects.filter(user=user).aggregate(
+        last=Max('deleted_at')
+    )['last']
+    raw = f"{state['last_change']}|{state['count']}|{last_removal}"
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line):
+    """Fold content lines longer than 75 octets"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Never split inside a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _event_lines(appointment, host):
+    # Series exceptions share their series' UID and name the occurrence they replace
+    uid = appointment.series_id or appointment.pk
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{uid}@{host}',
+        f'DTSTAMP:{_format_datetime(appointment.updated_at)}',
+        f'LAST-MODIFIED:{_format_datetime(appointment.updated_at)}',
+        f'DTSTART:{_format_datetime(appointment.start_time)}',
+        f'DTEND:{_format_datetime(appointment.end_time)}',
+        f'SUMMARY:{_escape(appointment.title)}',
+        f'STATUS:{ICAL_STATUS.get(appointment.status, "CONFIRMED")}',
+    ]
+    if appointment.recurrence_rule:
+        rule = appointment.recurrence_rule
+        lines.append(rule if rule.upper().startswith('RRULE:') else f'RRULE:{rule}')
+    if appointment.series_id and appointment.original_start_time:
+        lines.append(f'RECURRENCE-ID:{_format_datetime(appointment.original_start_time)}')
+    description = appointment.client_notes or appointment.description
+    if description:
+        lines.append(f'DESCRIPTION:{_escape(description)}')
+    if appointment.is_virtual and appointment.meeting_link:
+        lines.append(f'LOCATION:{_escape(appointment.meeting_link)}')
+        lines.append(f'URL:{appointment.meeting_link}')
+    elif appointment.location:
+        lines.append(f'LOCATION:{_escape(appointment.location)}')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def render_calendar(appointments, host, name='Appointments'):
+    """Render appointments as an iCalendar document"""
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+    ]
+    for appointment in appointments:
+        lines.extend(_event_lines(appointment, host))
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def _next_sync_token(since, now, *latest):
+    """
+    Token trailing the latest change returned (now if none) by
+    ``SYNC_OVERLAP``, never going back past ``since``
+    """
+    seen = [moment for moment in latest if moment is not None]
+    next_since = min(max(seen) if seen else now, now) - SYNC_OVERLAP
+    return encode_sync_token(max(next_since, since) if since else next_since)
+
+
+def delta_since(queryset, user, since):
+    """
+    Appointments changed and ids removed since ``since`` (None for a full
+    sync), the token to use next time, and whether this is a full sync.
+
+    The next sync may repeat some of the changes and removals returned
+    (see ``SYNC_OVERLAP``); clients apply them idempotently. Tokens older
+    than the tombstone retention get a full sync, as the removals before it
+    are forgotten.
+    """
+    now = timezone.now()
+    if since is not None and since < AppointmentTombstone.horizon(now):
+        since = None
+
+    if since is None:
+        latest = queryset.order_by().aggregate(last=Max('updated_at'))['last']
+        return queryset, [], _next_sync_token(None, now, latest), True
+
+    changed = queryset.filter(updated_at__gt=since)
+    tombstones = AppointmentTombstone.objects.filter(user=user, deleted_at__gt=since)
+    deleted = list(tombstones.values_list('appointment_id', flat=True).distinct())
+    token = _next_sync_token(
+        since, now,
+        changed.order_by().aggregate(last=Max('updated_at'))['last'],
+        tombstones.order_by().aggregate(last=Max('deleted_at'))['last'],
+    )
+    return changed, deleted, token, False
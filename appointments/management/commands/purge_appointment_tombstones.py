@@ -0,0 +1,14 @@
+"""
+Management command to delete appointment tombstones past their retention
+Usage: python manage.py purge_appointment_tombstones
+"""
+from django.core.management.base import BaseCommand
+from appointments.models import AppointmentTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete removal records older than the sync retention; older sync tokens get a full sync'
+
+    def handle(self, *args, **options):
+        count = AppointmentTombstone.purge()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} tombstone(s)'))
@@ -0,0 +1,35 @@
+"""
+Management command to send due appointment reminders
+Usage: python manage.py send_appointment_reminders [--batch-size N] [--lead-hours H] [--loop]
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from appointments.reminders import dispatch_due_reminders, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Send reminders for appointments starting soon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Appointments claimed per batch')
+        parser.add_argument('--lead-hours', type=float, default=24,
+                            help='Remind appointments starting within this many hours')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking for due reminders every --interval seconds')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds between checks when running with --loop')
+
+    def handle(self, *args, **options):
+        lead_time = timedelta(hours=options['lead_hours'])
+
+        while True:
+            sent = dispatch_due_reminders(batch_size=options['batch_size'], lead_time=lead_time)
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Sent reminders for {sent} appointment(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
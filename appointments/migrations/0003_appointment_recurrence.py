@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_tombstone'),
+        ('properties', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='last_reminded_occurrence',
+            field=models.DateTimeField(blank=True, help_text='Start of the latest series occurrence a reminder was sent for', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='original_start_time',
+            field=models.DateTimeField(blank=True, help_text='Start of the series occurrence this appointment replaces', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='recurrence_end',
+            field=models.DateTimeField(blank=True, help_text='End of the last occurrence (empty for open-ended series)', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='recurrence_rule',
+            field=models.TextField(blank=True, help_text='RRULE for a recurring series, e.g. FREQ=WEEKLY;COUNT=52', null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='series',
+            field=models.ForeignKey(blank=True, help_text='Recurring series this appointment replaces one occurrence of', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='appointments.appointment'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('series', 'original_start_time'), name='unique_series_exception'),
+        ),
+    ]
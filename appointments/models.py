@@ -1,6 +1,51 @@
+import copy
+import secrets
+from datetime import timedelta
+
 from django.db import models
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
+from .recurrence import parse_rule, series_end, occurrence_times
+
+
+class AppointmentQuerySet(models.QuerySet):
+
+    def singles(self):
+        """One-off appointments and series exceptions (rows that do not recur)"""
+        return self.filter(recurrence_rule__isnull=True)
+
+    def series_overlapping(self, window_start, window_end):
+        """Recurring series that may have occurrences in [window_start, window_end)"""
+        return self.filter(
+            recurrence_rule__isnull=False,
+            start_time__lt=window_end,
+        ).filter(Q(recurrence_end__isnull=True) | Q(recurrence_end__gt=window_start))
+
+    def exception_starts(self, series_ids):
+        """Original start times replaced by exception rows, per series id"""
+        starts = {}
+        if series_ids:
+            rows = self.model._default_manager.filter(series_id__in=series_ids).values_list(
+                'series_id', 'original_start_time'
+            )
+            for series_id, original_start in rows:
+                starts.setdefault(series_id, set()).add(original_start)
+        return starts
+
+    def occurrences(self, window_start, window_end):
+        """
+        Occurrences of the series in this queryset overlapping the window, as
+        unsaved copies of their series; occurrences replaced by an exception
+        row are left out (the exception rows are ordinary single rows)
+        """
+        series_list = list(self.series_overlapping(window_start, window_end))
+        skipped = self.exception_starts([series.pk for series in series_list])
+        return [
+            series.as_occurrence(start, end)
+            for series in series_list
+            for start, end in series.occurrences(window_start, window_end, skipped.get(series.pk, ()))
+        ]
 
 
 class Appointment(models.Model):
@@ -90,10 +135,40 @@ class Appointment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium')
 
+    # Recurrence
+    recurrence_rule = models.TextField(
+        blank=True,
+        null=True,
+        help_text='RRULE for a recurring series, e.g. FREQ=WEEKLY;COUNT=52'
+    )
+    recurrence_end = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='End of the last occurrence (empty for open-ended series)'
+    )
+    series = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='exceptions',
+        help_text='Recurring series this appointment replaces one occurrence of'
+    )
+    original_start_time = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Start of the series occurrence this appointment replaces'
+    )
+
     # Reminders
     send_reminder = models.BooleanField(default=True)
     reminder_sent = models.BooleanField(default=False)
     reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    last_reminded_occurrence = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text='Start of the latest series occurrence a reminder was sent for'
+    )
 
     # Notes
     notes = models.TextField(blank=True, null=True, help_text='Internal notes')
@@ -109,6 +184,8 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AppointmentQuerySet.as_manager()
+
     class Meta:
         db_table = 'appointments'
         ordering = ['start_time']
@@ -119,6 +196,12 @@ class Appointment(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['appointment_type']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['series', 'original_start_time'],
+                name='unique_series_exception'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
@@ -148,6 +231,34 @@ class Appointment(models.Model):
             return f"{hours}h {minutes}m" if minutes > 0 else f"{hours}h"
         return f"{minutes}m"
 
+    @property
+    def is_recurring(self):
+        return bool(self.recurrence_rule)
+
+    def recurrence(self):
+        """The series' dateutil rrule, or None for a single appointment"""
+        if not self.recurrence_rule:
+            return None
+        return parse_rule(self.recurrence_rule, self.start_time)
+
+    def occurrences(self, window_start, window_end, skip=()):
+        """(start, end) of the occurrences overlapping [window_start, window_end)"""
+        if not self.recurrence_rule:
+            if self.start_time < window_end and self.end_time > window_start:
+                return [(self.start_time, self.end_time)]
+            return []
+        return occurrence_times(
+            self.recurrence(), self.end_time - self.start_time, window_start, window_end, skip
+        )
+
+    def as_occurrence(self, start_time, end_time):
+        """Unsaved copy of this series standing in for one of its occurrences"""
+        occurrence = copy.copy(self)
+        occurrence.start_time = start_time
+        occurrence.end_time = end_time
+        occurrence.original_start_time = start_time
+        return occurrence
+
     def save(self, *args, **kwargs):
         # Calculate duration if not set
         if not self.duration_minutes and self.start_time and self.end_time:
@@ -158,4 +269,103 @@ class Appointment(models.Model):
         if not self.end_time and self.start_time and self.duration_minutes:
             self.end_time = self.start_time + timezone.timedelta(minutes=self.duration_minutes)
 
+        # Keep the series bound in sync with its rule for window queries
+        self.recurrence_rule = (self.recurrence_rule or '').strip() or None
+        if self.recurrence_rule:
+            self.recurrence_end = series_end(
+                self.recurrence_rule, self.recurrence(), self.end_time - self.start_time
+            )
+        else:
+            self.recurrence_end = None
+
         super().save(*args, **kwargs)
+
+
+class AppointmentTombstone(models.Model):
+    """
+    Record that an appointment left a user's calendar (deleted, or the user
+    is no longer a participant), so delta sync can report the removal
+    """
+
+    # Removals older than this are forgotten, see purge()
+    RETENTION = timedelta(days=60)
+
+    appointment_id = models.BigIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='appointment_tombstones'
+    )
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'appointment_tombstones'
+        ordering = ['-deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id} removed for user {self.user_id}"
+
+    @classmethod
+    def record(cls, appointment_id, user_ids):
+        """Create tombstones for the given users in one insert"""
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(appointment_id=appointment_id, user_id=user_id, deleted_at=now)
+            for user_id in set(user_ids) if user_id
+        ])
+
+    @classmethod
+    def horizon(cls, now=None):
+        """Oldest moment removals are still known from; older sync tokens need a full sync"""
+        return (now or timezone.now()) - cls.RETENTION
+
+    @classmethod
+    def purge(cls, now=None):
+        """Delete tombstones past the retention period; returns how many"""
+        deleted, _ = cls.objects.filter(deleted_at__lt=cls.horizon(now)).delete()
+        return deleted
+
+
+class CalendarFeed(models.Model):
+    """
+    Secret naming a user's private iCalendar feed. Calendar apps cannot send
+    headers, so the secret in the feed URL is its only credential: random,
+    unrelated to the user's id, and rotated to cut off a leaked URL.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='calendar_feed'
+    )
+    secret = models.CharField(max_length=64, unique=True)
+    rotated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'appointment_calendar_feeds'
+
+    def __str__(self):
+        return f"Calendar feed of user {self.user_id}"
+
+    @staticmethod
+    def _new_secret():
+        return secrets.token_urlsafe(32)
+
+    @classmethod
+    def for_user(cls, user):
+        feed, _ = cls.objects.get_or_create(user=user, defaults={'secret': cls._new_secret()})
+        return feed
+
+    @classmethod
+    def user_for(cls, secret):
+        """Active user owning the feed secret, or None"""
+        feed = cls.objects.filter(secret=secret, user__is_active=True).select_related('user').first()
+        return feed.user if feed else None
+
+    def rotate(self):
+        """Replace the secret; the previous feed URL stops working"""
+        self.secret = self._new_secret()
+        self.save(update_fields=['secret', 'rotated_at'])
@@ -0,0 +1,70 @@
+"""
+Recurring appointment series.
+
+A series is a single Appointment row carrying an RRULE (RFC 5545); its own
+start and end times are the first occurrence and later occurrences are
+generated on demand for whatever window is being looked at. Occurrences that
+are moved, edited or cancelled are stored as exception rows pointing at the
+series together with the original start time they replace, so storage grows
+with the number of changes rather than with the length of the series.
+"""
+import re
+from itertools import islice
+
+from dateutil.rrule import rrule, rrulestr
+from django.utils import timezone
+
+_BOUNDED_RULE = re.compile(r'(^|;)\s*(COUNT|UNTIL)\s*=', re.IGNORECASE)
+
+# Bounded series longer than this are treated as open-ended when computing
+# their end, rather than walking every occurrence
+MAX_COUNTED_OCCURRENCES = 10000
+
+
+def parse_rule(rule, dtstart):
+    """
+    Build the recurrence for an RRULE anchored at ``dtstart``.
+    The anchor is taken in local time so occurrences keep their wall-clock
+    time across DST changes. Raises ValueError for invalid rules.
+    """
+    rule = rule.strip()
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    if not rule.upper().startswith('FREQ=') and ';FREQ=' not in rule.upper():
+        raise ValueError('Recurrence rule must define FREQ')
+    recurrence = rrulestr(rule, dtstart=timezone.localtime(dtstart))
+    if not isinstance(recurrence, rrule):
+        raise ValueError('Only a single RRULE is supported')
+    return recurrence
+
+
+def is_bounded(rule):
+    """Whether an RRULE ends (COUNT or UNTIL) rather than repeating forever"""
+    return bool(_BOUNDED_RULE.search(rule))
+
+
+def series_end(rule, recurrence, duration):
+    """End of the last occurrence of a bounded series, None if open-ended"""
+    if not is_bounded(rule):
+        return None
+    occurrences = list(islice(recurrence, MAX_COUNTED_OCCURRENCES + 1))
+    if not occurrences or len(occurrences) > MAX_COUNTED_OCCURRENCES:
+        return None
+    return occurrences[-1] + duration
+
+
+def occurrence_times(recurrence, duration, window_start, window_end, skip=()):
+    """
+    (start, end) pairs of occurrences overlapping [window_start, window_end),
+    leaving out occurrences whose start is in ``skip``
+    """
+    return [
+        (start, start + duration)
+        for start in recurrence.between(window_start - duration, window_end)
+        if start not in skip
+    ]
+
+
+def is_occurrence(recurrence, moment):
+    """Whether ``moment`` is the start of one of the occurrences"""
+    return recurrence.after(moment, inc=True) == moment
@@ -0,0 +1,195 @@
+"""
+Batched appointment reminder dispatch.
+
+Due reminders are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so
+several workers can run side by side, marked as sent with one UPDATE per
+batch and turned into in-app notifications with one INSERT. Emails go out
+over a single connection after the batch commits.
+
+Recurring series are claimed the same way and reminded about their next
+occurrence; the start of the last occurrence reminded is kept on the series
+row, so no per-occurrence rows are needed.
+"""
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+from notifications.email_utils import build_appointment_reminder_email
+from notifications.models import Notification
+from notifications.realtime import publish, user_channel
+from notifications.serializers import NotificationSerializer
+from .models import Appointment
+
+REMINDER_STATUSES = ['scheduled', 'confirmed']
+DEFAULT_LEAD_TIME = timedelta(hours=24)
+DEFAULT_BATCH_SIZE = 500
+
+
+def due_reminders(now, lead_time=DEFAULT_LEAD_TIME):
+    """Appointments starting within ``lead_time`` that still need a reminder"""
+    return Appointment.objects.singles().filter(
+        send_reminder=True,
+        reminder_sent=False,
+        status__in=REMINDER_STATUSES,
+        start_time__gt=now,
+        start_time__lte=now + lead_time,
+    )
+
+
+def due_series_reminders(now, lead_time=DEFAULT_LEAD_TIME):
+    """Recurring series that may have an occurrence starting within ``lead_time``"""
+    return Appointment.objects.series_overlapping(now, now + lead_time).filter(
+        send_reminder=True,
+        status__in=REMINDER_STATUSES,
+    )
+
+
+def _recipients(appointment):
+    recipients = [appointment.agent, appointment.client, *appointment.attendees.all()]
+    seen = set()
+    for user in recipients:
+        if user is not None and user.id not in seen:
+            seen.add(user.id)
+            yield user
+
+
+def _load_claimed(claimed_ids):
+    return list(
+        Appointment.objects.filter(id__in=claimed_ids)
+        .select_related('agent', 'client', 'related_property')
+        .prefetch_related('attendees')
+    )
+
+
+def _create_reminders(appointments):
+    """
+    Insert the notifications for a batch of appointments (or occurrences)
+    and return the reminder emails to send once the batch commits
+    """
+    notifications = []
+    emails = []
+    for appointment in appointments:
+        for user in _recipients(appointment):
+            notifications.append(Notification(
+                user=user,
+                type='appointment',
+                title=f'Upcoming: {appointment.title}',
+                message=f'{appointment.get_appointment_type_display()} on '
+                        f'{timezone.localtime(appointment.start_time):%b %d at %H:%M}',
+                priority='high' if appointment.priority in ['high', 'urgent'] else 'medium',
+                related_id=appointment.id,
+                related_type='appointment'
+            ))
+            if user.email:
+                emails.append(build_appointment_reminder_email(appointment, user))
+
+    created = Notification.objects.bulk_create(notifications)
+
+    # bulk_create skips post_save, so push the new notifications here, once
+    # they are committed; the configured broker relays them from this
+    # process to the web workers holding the streams
+    def push():
+        for notification in created:
+            if notification.pk:
+                publish([user_channel(notification.user_id)], 'notification',
+                        NotificationSerializer(notification).data)
+    transaction.on_commit(push)
+    return emails
+
+
+def _send_emails(emails):
+    if emails:
+        try:
+            get_connection().send_messages(emails)
+        except Exception as e:
+            print(f"Failed to send appointment reminder emails: {e}")
+
+
+def dispatch_reminder_batch(batch_size=DEFAULT_BATCH_SIZE, lead_time=DEFAULT_LEAD_TIME, now=None):
+    """
+    Claim and process one batch of due reminders.
+    Returns the number of appointments reminded.
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        claimed_ids = list(
+            due_reminders(now, lead_time)
+            .select_for_update(skip_locked=True)
+            .order_by('start_time')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not claimed_ids:
+            return 0
+
+        appointments = _load_claimed(claimed_ids)
+        emails = _create_reminders(appointments)
+        Appointment.objects.filter(id__in=claimed_ids).update(
+            reminder_sent=True,
+            reminder_sent_at=now
+        )
+
+    _send_emails(emails)
+    return len(appointments)
+
+
+def dispatch_series_reminder_batch(batch_size=DEFAULT_BATCH_SIZE, lead_time=DEFAULT_LEAD_TIME,
+                                   now=None, after_id=0):
+    """
+    Claim one batch of recurring series (in id order, after ``after_id``)
+    and remind each about its next occurrence within ``lead_time`` that has
+    not been reminded yet.
+    Returns (series claimed, last claimed id, occurrences reminded).
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        claimed_ids = list(
+            due_series_reminders(now, lead_time)
+            .filter(id__gt=after_id)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not claimed_ids:
+            return 0, after_id, 0
+
+        skipped = Appointment.objects.exception_starts(claimed_ids)
+        reminded = []
+        occurrences = []
+        for series in _load_claimed(claimed_ids):
+            upcoming = [
+                (start, end)
+                for start, end in series.occurrences(now, now + lead_time, skipped.get(series.pk, ()))
+                if now < start <= now + lead_time
+                and (series.last_reminded_occurrence is None or start > series.last_reminded_occurrence)
+            ]
+            if upcoming:
+                occurrences.append(series.as_occurrence(*upcoming[0]))
+                series.last_reminded_occurrence = upcoming[0][0]
+                series.reminder_sent_at = now
+                reminded.append(series)
+
+        emails = _create_reminders(occurrences)
+        Appointment.objects.bulk_update(reminded, ['last_reminded_occurrence', 'reminder_sent_at'])
+
+    _send_emails(emails)
+    return len(claimed_ids), claimed_ids[-1], len(occurrences)
+
+
+def dispatch_due_reminders(batch_size=DEFAULT_BATCH_SIZE, lead_time=DEFAULT_LEAD_TIME, now=None):
+    """Process batches until no due reminders are left; returns the total sent"""
+    total = 0
+    while True:
+        sent = dispatch_reminder_batch(batch_size, lead_time, now)
+        total += sent
+        if sent < batch_size:
+            break
+
+    after_id = 0
+    while True:
+        claimed, after_id, sent = dispatch_series_reminder_batch(batch_size, lead_time, now, after_id)
+        total += sent
+        if claimed < batch_size:
+            return total
@@ -0,0 +1,337 @@
+"""
+In-memory scheduling index for agent availability and conflict detection.
+
+Each agent's active appointments are kept as a list of intervals sorted by
+start time, with a running maximum of end times so overlap queries can stop
+scanning as soon as no earlier interval can reach the requested range.
+Recurring series are kept as their rule and expanded only for the range
+being queried. Schedules are loaded lazily (many agents in one query), updated in place
+when appointments are saved or deleted, and reloaded when another process
+has bumped the agent's schedule version in the shared cache.
+
+The index answers availability searches and may briefly lag other
+processes; bookings are checked against the database with
+``booking_conflict``, under a lock on the agent.
+"""
+import bisect
+import threading
+from datetime import datetime, time, timedelta
+from time import time_ns
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from .recurrence import parse_rule, occurrence_times
+
+# Appointments in these statuses occupy the agent's time
+ACTIVE_STATUSES = ('scheduled', 'confirmed', 'rescheduled')
+
+DEFAULT_WORK_START = time(9, 0)
+DEFAULT_WORK_END = time(18, 0)
+
+# How far ahead series occurrences are checked for double bookings
+DOUBLE_BOOKING_HORIZON = timedelta(days=90)
+
+
+def _version_key(agent_id):
+    return f'appointments:schedule_version:{agent_id}'
+
+
+class SeriesSchedule:
+    """Occurrence generator of one recurring series"""
+
+    def __init__(self, recurrence, duration, skip=()):
+        self.recurrence = recurrence
+        self.duration = duration
+        self.skip = set(skip)
+
+    def occurrences(self, start, end):
+        return occurrence_times(self.recurrence, self.duration, start, end, self.skip)
+
+
+class AgentSchedule:
+    """Sorted busy intervals and recurring series of a single agent"""
+
+    def __init__(self, intervals=(), series=None):
+        # Entries are (start_time, end_time, appointment_id)
+        self.intervals = sorted(intervals)
+        # Series id -> SeriesSchedule
+        self.series = dict(series or {})
+        self._reindex()
+
+    def _reindex(self):
+        self.starts = [interval[0] for interval in self.intervals]
+        self.max_ends = []
+        running = None
+        for _, end, _ in self.intervals:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+
+    def add(self, start, end, appointment_id):
+        bisect.insort(self.intervals, (start, end, appointment_id))
+        self._reindex()
+
+    def remove(self, appointment_id):
+        self.series.pop(appointment_id, None)
+        self.intervals = [interval for interval in self.intervals if interval[2] != appointment_id]
+        self._reindex()
+
+    def overlapping(self, start, end):
+        """Intervals and series occurrences intersecting [start, end), in start order"""
+        found = []
+        i = bisect.bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_ends[i] > start:
+            interval = self.intervals[i]
+            if interval[1] > start:
+                found.append(interval)
+            i -= 1
+        for series_id, series in self.series.items():
+            found.extend(
+                (occurrence_start, occurrence_end, series_id)
+                for occurrence_start, occurrence_end in series.occurrences(start, end)
+            )
+        found.sort()
+        return found
+
+    def free_gaps(self, window_start, window_end, duration):
+        """Free sub-ranges of [window_start, window_end) lasting at least ``duration``"""
+        gaps = []
+        cursor = window_start
+        for busy_start, busy_end, _ in self.overlapping(window_start, window_end):
+            if busy_start - cursor >= duration:
+                gaps.append((cursor, busy_start))
+            if busy_end > cursor:
+                cursor = busy_end
+        if window_end - cursor >= duration:
+            gaps.append((cursor, window_end))
+        return gaps
+
+    def double_bookings(self, until=None):
+        """
+        Pairs of overlapping appointment ids; series occurrences are checked
+        from now until ``until``
+        """
+        entries = self.intervals
+        if self.series and until:
+            now = timezone.now()
+            entries = sorted(entries + [
+                (occurrence_start, occurrence_end, series_id)
+                for series_id, series in self.series.items()
+                for occurrence_start, occurrence_end in series.occurrences(now, until)
+            ])
+
+        pairs = {}
+        for index, (start, end, appointment_id) in enumerate(entries):
+            for other_start, _, other_id in entries[index + 1:]:
+                if other_start >= end:
+                    break
+                if other_id != appointment_id:
+                    pairs[(appointment_id, other_id)] = None
+        return list(pairs)
+
+
+def load_schedules(agent_ids, window_start=None, window_end=None):
+    """
+    Intervals and series per agent: one query, plus one for series
+    exceptions. With a window, only appointments that can reach it are read.
+    """
+    from .models import Appointment
+
+    intervals = {agent_id: [] for agent_id in agent_ids}
+    series = {agent_id: {} for agent_id in agent_ids}
+    series_rows = []
+    rows = Appointment.objects.filter(agent_id__in=agent_ids, status__in=ACTIVE_STATUSES)
+    if window_start is not None and window_end is not None:
+        rows = rows.filter(start_time__lt=window_end).filter(
+            Q(recurrence_rule__isnull=True, end_time__gt=window_start)
+            | Q(recurrence_rule__isnull=False, recurrence_end__isnull=True)
+            | Q(recurrence_rule__isnull=False, recurrence_end__gt=window_start)
+        )
+    rows = rows.values_list('agent_id', 'start_time', 'end_time', 'id', 'recurrence_rule')
+    for agent_id, start, end, appointment_id, rule in rows:
+        if rule:
+            series_rows.append((agent_id, start, end, appointment_id, rule))
+        else:
+            intervals[agent_id].append((start, end, appointment_id))
+
+    skipped = Appointment.objects.exception_starts([row[3] for row in series_rows])
+    for agent_id, start, end, appointment_id, rule in series_rows:
+        series[agent_id][appointment_id] = SeriesSchedule(
+            parse_rule(rule, start), end - start, skipped.get(appointment_id, ())
+        )
+    return {agent_id: (intervals[agent_id], series[agent_id]) for agent_id in agent_ids}
+
+
+def booking_conflict(agent_id, spans, exclude_ids=()):
+    """
+    First (start, end) of ``spans`` overlapping the agent's active
+    appointments, or None, read from the database rather than the index.
+
+    The agent's row is locked until the transaction ends, so bookings for
+    one agent are checked and saved one after the other: call it inside
+    ``transaction.atomic()`` and save in the same transaction.
+    """
+    from users.models import User
+
+    spans = list(spans)
+    list(User.objects.select_for_update().filter(pk=agent_id).values_list('pk', flat=True))
+    if not spans:
+        return None
+    window_start = min(start for start, _ in spans)
+    window_end = max(end for _, end in spans)
+    intervals, series = load_schedules([agent_id], window_start, window_end)[agent_id]
+    schedule = AgentSchedule(intervals, series)
+    for start, end in spans:
+        if any(entry[2] not in exclude_ids for entry in schedule.overlapping(start, end)):
+            return start, end
+    return None
+
+
+class ScheduleIndex:
+    """Process-wide map of agent id to AgentSchedule"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._schedules = {}
+        self._versions = {}
+        self._owners = {}  # appointment id -> agent id
+
+    def clear(self):
+        with self._lock:
+            self._schedules.clear()
+            self._versions.clear()
+            self._owners.clear()
+
+    def _load(self, agent_ids):
+        return load_schedules(agent_ids)
+
+    def schedules(self, agent_ids):
+        """Schedules for the given agents, loading stale or missing ones in one query"""
+        agent_ids = list(dict.fromkeys(agent_ids))
+        versions = cache.get_many([_version_key(agent_id) for agent_id in agent_ids])
+        with self._lock:
+            stale = [
+                agent_id for agent_id in agent_ids
+                if agent_id not in self._schedules
+                or self._versions.get(agent_id) != versions.get(_version_key(agent_id))
+            ]
+            if stale:
+                for agent_id, (intervals, series) in self._load(stale).items():
+                    for appointment_id, owner in list(self._owners.items()):
+                        if owner == agent_id:
+                            del self._owners[appointment_id]
+                    for _, _, appointment_id in intervals:
+                        self._owners[appointment_id] = agent_id
+                    for appointment_id in series:
+                        self._owners[appointment_id] = agent_id
+                    self._schedules[agent_id] = AgentSchedule(intervals, series)
+                    self._versions[agent_id] = versions.get(_version_key(agent_id))
+            return {agent_id: self._schedules[agent_id] for agent_id in agent_ids}
+
+    def update(self, appointment_id, agent_id=None, start_time=None, end_time=None, active=False,
+               reload_agents=()):
+        """
+        Apply a saved (``active`` if it still occupies the agent) or deleted
+        appointment to the loaded schedules. Schedules of ``reload_agents``
+        are dropped and reloaded on next use instead, which is how changes
+        to recurring series and their exceptions are applied.
+        """
+        reload_agents = set(reload_agents) - {None}
+        with self._lock:
+            previous_agent = self._owners.pop(appointment_id, None)
+            touched = {agent_id, previous_agent, *reload_agents} - {None}
+            if previous_agent in self._schedules:
+                self._schedules[previous_agent].remove(appointment_id)
+
+            if active and agent_id in self._schedules and agent_id not in reload_agents:
+                self._schedules[agent_id].add(start_time, end_time, appointment_id)
+                self._owners[appointment_id] = agent_id
+
+            for touched_agent in touched:
+                version = self._bump_version(touched_agent)
+                if touched_agent in reload_agents:
+                    self._schedules.pop(touched_agent, None)
+                elif touched_agent in self._schedules:
+                    self._versions[touched_agent] = version
+
+    @staticmethod
+    def _bump_version(agent_id):
+        # add() and incr() are each atomic, so concurrent bumps get distinct
+        # versions; a version evicted from the cache restarts above every
+        # value it could have reached
+        key = _version_key(agent_id)
+        while True:
+            cache.add(key, time_ns(), None)
+            try:
+                return cache.incr(key)
+            except ValueError:
+                continue
+
+    def conflicts(self, agent_id, start, end, exclude_id=None):
+        """Ids of the agent's active appointments overlapping [start, end)"""
+        schedule = self.schedules([agent_id])[agent_id]
+        return [
+            appointment_id for _, _, appointment_id in schedule.overlapping(start, end)
+            if appointment_id != exclude_id
+        ]
+
+    def free_slots(self, agent_ids, window_start, window_end, duration,
+                   work_start=DEFAULT_WORK_START, work_end=DEFAULT_WORK_END):
+        """
+        Free intervals of at least ``duration`` per agent, limited to working
+        hours (in the current time zone) within [window_start, window_end)
+        """
+        schedules = self.schedules(agent_ids)
+        working_windows = list(_working_windows(window_start, window_end, work_start, work_end))
+        return {
+            agent_id: [
+                gap
+                for day_start, day_end in working_windows
+                for gap in schedule.free_gaps(day_start, day_end, duration)
+            ]
+            for agent_id, schedule in schedules.items()
+        }
+
+    def first_available(self, agent_ids, after, duration, search_days=14,
+                        work_start=DEFAULT_WORK_START, work_end=DEFAULT_WORK_END):
+        """
+        Earliest ``(agent_id, start, end)`` slot of ``duration`` among the
+        agents, or None if nobody is free within ``search_days``
+        """
+        schedules = self.schedules(agent_ids)
+        for day_start, day_end in _working_windows(after, after + timedelta(days=search_days),
+                                                   work_start, work_end):
+            best = None
+            for agent_id, schedule in schedules.items():
+                gaps = schedule.free_gaps(day_start, day_end, duration)
+                if gaps and (best is None or gaps[0][0] < best[1]):
+                    best = (agent_id, gaps[0][0], gaps[0][0] + duration)
+            if best:
+                return best
+        return None
+
+    def double_bookings(self, agent_ids, horizon=DOUBLE_BOOKING_HORIZON):
+        """Overlapping appointment id pairs per agent (agents without any are omitted)"""
+        report = {}
+        until = timezone.now() + horizon
+        for agent_id, schedule in self.schedules(agent_ids).items():
+            pairs = schedule.double_bookings(until)
+            if pairs:
+                report[agent_id] = pairs
+        return report
+
+
+def _working_windows(window_start, window_end, work_start, work_end):
+    """Yield per-day working-hour ranges clipped to [window_start, window_end)"""
+    tz = timezone.get_current_timezone()
+    day = timezone.localtime(window_start, tz).date()
+    last_day = timezone.localtime(window_end, tz).date()
+    while day <= last_day:
+        day_start = max(window_start, timezone.make_aware(datetime.combine(day, work_start), tz))
+        day_end = min(window_end, timezone.make_aware(datetime.combine(day, work_end), tz))
+        if day_end > day_start:
+            yield day_start, day_end
+        day += timedelta(days=1)
+
+
+schedule_index = ScheduleIndex()
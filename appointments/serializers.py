@@ -1,8 +1,15 @@
+from datetime import timedelta
+from django.db import transaction
 from rest_framework import serializers
 from .models import Appointment
+from .scheduling import booking_conflict, ACTIVE_STATUSES
+from .recurrence import parse_rule, occurrence_times
 from users.serializers import UserSerializer
 from properties.serializers import PropertyListSerializer
 
+# How far ahead a new or changed series is checked for conflicts
+SERIES_CONFLICT_HORIZON = timedelta(days=365)
+
 
 class AppointmentSerializer(serializers.ModelSerializer):
     agent_name = serializers.CharField(source='agent.full_name', read_only=True)
@@ -26,12 +33,16 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'start_time', 'end_time', 'duration_minutes', 'duration_display',
             'location', 'meeting_link', 'is_virtual',
             'status', 'status_display', 'priority', 'priority_display',
+            'recurrence_rule', 'recurrence_end', 'series', 'original_start_time',
             'send_reminder', 'reminder_sent', 'reminder_sent_at',
             'notes', 'client_notes',
             'is_past', 'is_upcoming', 'is_today',
             'created_by', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_by', 'created_at', 'updated_at', 'reminder_sent', 'reminder_sent_at']
+        read_only_fields = [
+            'created_by', 'created_at', 'updated_at', 'reminder_sent', 'reminder_sent_at',
+            'recurrence_end', 'series', 'original_start_time'
+        ]
 
 
 class AppointmentCreateSerializer(serializers.ModelSerializer):
@@ -42,7 +53,7 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
             'agent', 'client', 'related_property', 'related_transaction',
             'start_time', 'end_time', 'duration_minutes',
             'location', 'meeting_link', 'is_virtual',
-            'status', 'priority', 'send_reminder',
+            'status', 'priority', 'send_reminder', 'recurrence_rule',
             'notes', 'client_notes'
         ]
     
@@ -56,22 +67,57 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
             if end_time <= start_time:
                 raise serializers.ValidationError("End time must be after start time")
         
-        # Check for conflicts (optional - can be enabled)
-        # agent = data.get('agent')
-        # if agent and start_time and end_time:
-        #     conflicts = Appointment.objects.filter(
-        #         agent=agent,
-        #         status__in=['scheduled', 'confirmed'],
-        #         start_time__lt=end_time,
-        #         end_time__gt=start_time
-        #     )
-        #     if self.instance:
-        #         conflicts = conflicts.exclude(pk=self.instance.pk)
-        #     if conflicts.exists():
-        #         raise serializers.ValidationError("Agent has a conflicting appointment")
+        # Conflicts are checked against the database when saving
+        instance = self.instance
+        agent = data.get('agent')
+        agent_id = agent.id if agent else (instance.agent_id if instance else None)
+        status = data.get('status', instance.status if instance else 'scheduled')
+        start_time = start_time or (instance.start_time if instance else None)
+        end_time = end_time or (instance.end_time if instance else None)
+        if not end_time and start_time and data.get('duration_minutes'):
+            end_time = start_time + timedelta(minutes=data['duration_minutes'])
+
+        # Recurring series are checked occurrence by occurrence
+        rule = data.get('recurrence_rule', instance.recurrence_rule if instance else None)
+        spans = [(start_time, end_time)]
+        if rule and start_time and end_time:
+            if instance and instance.series_id:
+                raise serializers.ValidationError({'recurrence_rule': 'A series exception cannot recur'})
+            try:
+                recurrence = parse_rule(rule, start_time)
+            except ValueError as e:
+                raise serializers.ValidationError({'recurrence_rule': f'Invalid recurrence rule: {e}'})
+            spans = occurrence_times(
+                recurrence, end_time - start_time, start_time, start_time + SERIES_CONFLICT_HORIZON
+            )
+
+        self._booking = None
+        if agent_id and start_time and end_time and status in ACTIVE_STATUSES:
+            exclude_ids = {instance.pk, instance.series_id} - {None} if instance else set()
+            self._booking = (agent_id, spans, exclude_ids)
         
         return data
 
+    def _check_booking(self):
+        """Refuse the save if the agent is busy; call inside the saving transaction"""
+        if not getattr(self, '_booking', None):
+            return
+        conflict = booking_conflict(*self._booking)
+        if conflict:
+            raise serializers.ValidationError(
+                f"Agent has a conflicting appointment on {conflict[0]:%Y-%m-%d %H:%M}"
+            )
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            self._check_booking()
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self._check_booking()
+            return super().update(instance, validated_data)
+
 
 class AppointmentCalendarSerializer(serializers.ModelSerializer):
     """Simplified serializer for calendar view"""
@@ -85,10 +131,16 @@ class AppointmentCalendarSerializer(serializers.ModelSerializer):
             'id', 'title', 'appointment_type', 'status', 'priority',
             'agent', 'agent_name', 'client', 'client_name',
             'property_title', 'start_time', 'end_time',
-            'location', 'is_virtual'
+            'location', 'is_virtual',
+            'recurrence_rule', 'series', 'original_start_time'
         ]
 
 
+class OccurrenceExceptionSerializer(serializers.Serializer):
+    """Identifies the series occurrence an edit or cancellation applies to"""
+    original_start = serializers.DateTimeField()
+
+
 class AppointmentStatsSerializer(serializers.Serializer):
     """Serializer for appointment statistics"""
     total_appointments = serializers.IntegerField()
@@ -101,3 +153,17 @@ class AppointmentStatsSerializer(serializers.Serializer):
     by_type = serializers.ListField()
     by_agent = serializers.ListField()
 
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """Query parameters for availability searches"""
+    agents = serializers.CharField(required=False, help_text='Comma-separated agent ids (default: all agents)')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    duration = serializers.IntegerField(required=False, default=60, min_value=5, max_value=24 * 60)
+
+    def validate_agents(self, value):
+        try:
+            return [int(agent_id) for agent_id in value.split(',') if agent_id.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Agents must be a comma-separated list of ids')
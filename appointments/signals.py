@@ -0,0 +1,114 @@
+"""
+Django signals keeping the in-memory scheduling index, cached statistics
+and calendar sync tombstones current
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from real_estate_platform.response_cache import invalidate_on_change, invalidate_tags
+from .models import Appointment, AppointmentTombstone
+from .scheduling import schedule_index, ACTIVE_STATUSES
+
+STATS_VERSION_KEY = 'appointments:stats_version'
+
+invalidate_on_change(Appointment, 'appointments')
+
+
+def stats_version():
+    """Version stamp included in stats cache keys; bumped on every change"""
+    return cache.get_or_set(STATS_VERSION_KEY, 1, None)
+
+
+def bump_stats_version():
+    try:
+        cache.incr(STATS_VERSION_KEY)
+    except ValueError:
+        cache.set(STATS_VERSION_KEY, 1, None)
+
+
+def _series_agents(instance):
+    """
+    Agents whose schedules must be reloaded after a series or one of its
+    exceptions changes (exceptions alter which occurrences the series keeps)
+    """
+    if instance.recurrence_rule:
+        return {instance.agent_id}
+    if instance.series_id:
+        series_agent = Appointment.objects.filter(
+            pk=instance.series_id
+        ).values_list('agent_id', flat=True).first()
+        return {instance.agent_id, series_agent}
+    return set()
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    appointment_id, agent_id = instance.pk, instance.agent_id
+    start_time, end_time = instance.start_time, instance.end_time
+    active = instance.status in ACTIVE_STATUSES
+    reload_agents = _series_agents(instance)
+    transaction.on_commit(lambda: schedule_index.update(
+        appointment_id, agent_id, start_time, end_time, active=active, reload_agents=reload_agents
+    ))
+    transaction.on_commit(bump_stats_version)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    appointment_id, agent_id = instance.pk, instance.agent_id
+    reload_agents = _series_agents(instance)
+    transaction.on_commit(lambda: schedule_index.update(
+        appointment_id, agent_id, reload_agents=reload_agents
+    ))
+    transaction.on_commit(bump_stats_version)
+
+
+@receiver(m2m_changed, sender=Appointment.attendees.through)
+def appointment_attendees_changed(sender, instance, action, pk_set, reverse, **kwargs):
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        transaction.on_commit(bump_stats_version)
+        transaction.on_commit(lambda: invalidate_tags('appointments'))
+
+    if reverse or not isinstance(instance, Appointment):
+        return
+
+    # Removed attendees lose the appointment from their calendar
+    if action == 'pre_clear':
+        instance._cleared_attendee_ids = list(instance.attendees.values_list('id', flat=True))
+    elif action in ['post_remove', 'post_clear']:
+        removed = pk_set if action == 'post_remove' else getattr(instance, '_cleared_attendee_ids', [])
+        AppointmentTombstone.record(
+            instance.pk, set(removed) - {instance.agent_id, instance.client_id}
+        )
+
+    # Membership changes count as a change for delta sync
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        Appointment.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Appointment)
+def appointment_participants_changed(sender, instance, **kwargs):
+    """Tombstone the appointment for an agent or client who was replaced"""
+    if not instance.pk:
+        return
+    previous = Appointment.objects.filter(pk=instance.pk).values('agent_id', 'client_id').first()
+    if previous:
+        removed = {previous['agent_id'], previous['client_id']} - {instance.agent_id, instance.client_id, None}
+        if removed:
+            removed -= set(instance.attendees.values_list('id', flat=True))
+            AppointmentTombstone.record(instance.pk, removed)
+
+
+@receiver(pre_delete, sender=Appointment)
+def appointment_deleting(sender, instance, **kwargs):
+    """Tombstone the appointment for everyone who could see it"""
+    admin_ids = get_user_model().objects.filter(role='admin').values_list('id', flat=True)
+    AppointmentTombstone.record(instance.pk, [
+        instance.agent_id,
+        instance.client_id,
+        *instance.attendees.values_list('id', flat=True),
+        *admin_ids,
+    ])
@@ -1,3 +1,475 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from notifications.models import Notification
+from users.models import User
+from . import ical
+from .models import Appointment, AppointmentTombstone, CalendarFeed
+from .recurrence import is_occurrence, parse_rule
+from .reminders import dispatch_due_reminders, due_reminders
+from .scheduling import ScheduleIndex, booking_conflict, schedule_index
 
-# Create your tests here.
+
+def next_monday(hour, weeks=1):
+    """Aware datetime at ``hour`` on a Monday at least ``weeks`` weeks ahead"""
+    today = timezone.localdate()
+    day = today + timedelta(days=7 * weeks - today.weekday())
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+class ScheduleIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        schedule_index.clear()
+        self.index = ScheduleIndex()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.other_agent = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='agent'
+        )
+        self.day_start = next_monday(9)
+        self.day_end = next_monday(18)
+
+    def book(self, agent, start_hour, end_hour, **fields):
+        return Appointment.objects.create(
+            title='Viewing', agent=agent,
+            start_time=next_monday(start_hour), end_time=next_monday(end_hour), **fields
+        )
+
+    def test_free_slots_skip_busy_time(self):
+        self.book(self.agent, 10, 11)
+        self.book(self.agent, 13, 15)
+        self.book(self.agent, 16, 17, status='cancelled')
+
+        slots = self.index.free_slots([self.agent.id], self.day_start, self.day_end, timedelta(hours=1))
+
+        self.assertEqual(slots[self.agent.id], [
+            (next_monday(9), next_monday(10)),
+            (next_monday(11), next_monday(13)),
+            (next_monday(15), next_monday(18)),
+        ])
+
+    def test_free_slots_include_series_occurrences(self):
+        self.book(self.agent, 10, 12, recurrence_rule='FREQ=WEEKLY;COUNT=4')
+        week_later = next_monday(9, weeks=2)
+
+        slots = self.index.free_slots(
+            [self.agent.id], week_later, week_later + timedelta(hours=9), timedelta(hours=2)
+        )
+
+        self.assertEqual(slots[self.agent.id], [
+            (next_monday(12, weeks=2), next_monday(18, weeks=2)),
+        ])
+
+    def test_first_available_picks_earliest_agent(self):
+        self.book(self.agent, 9, 12)
+        self.book(self.other_agent, 9, 10)
+
+        slot = self.index.first_available(
+            [self.agent.id, self.other_agent.id], self.day_start, timedelta(hours=1)
+        )
+
+        self.assertEqual(slot, (self.other_agent.id, next_monday(10), next_monday(11)))
+
+    def test_first_available_none_when_fully_booked(self):
+        self.book(self.agent, 9, 18)
+        slot = self.index.first_available(
+            [self.agent.id], self.day_start, timedelta(hours=1), search_days=0
+        )
+        self.assertIsNone(slot)
+
+    def test_double_bookings(self):
+        first = self.book(self.agent, 10, 12)
+        second = self.book(self.agent, 11, 13)
+        self.book(self.agent, 13, 14)
+        self.book(self.other_agent, 10, 12)
+
+        report = self.index.double_bookings([self.agent.id, self.other_agent.id])
+
+        self.assertEqual(report, {self.agent.id: [(first.id, second.id)]})
+
+    def test_saves_update_loaded_schedule(self):
+        self.index = schedule_index
+        self.index.schedules([self.agent.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = self.book(self.agent, 10, 11)
+        self.assertEqual(self.index.conflicts(self.agent.id, next_monday(10), next_monday(11)), [appointment.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertEqual(self.index.conflicts(self.agent.id, next_monday(10), next_monday(11)), [])
+
+    def test_version_bumps_are_distinct(self):
+        versions = {ScheduleIndex._bump_version(self.agent.id) for _ in range(3)}
+        self.assertEqual(len(versions), 3)
+        cache.clear()
+        self.assertNotIn(ScheduleIndex._bump_version(self.agent.id), versions)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BookingConflictTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        schedule_index.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def post(self, start_hour, end_hour, **fields):
+        return self.api.post('/api/appointments/', {
+            'title': 'Viewing', 'agent': self.agent.id,
+            'start_time': next_monday(start_hour).isoformat(),
+            'end_time': next_monday(end_hour).isoformat(),
+            **fields,
+        }, format='json')
+
+    def test_overlap_is_refused(self):
+        self.assertEqual(self.post(10, 11).status_code, 201)
+        response = self.post(10, 12)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('conflicting appointment', str(response.data))
+        self.assertEqual(self.post(11, 12).status_code, 201)
+
+    def test_conflict_check_does_not_trust_a_stale_index(self):
+        # Loaded before the booking, and never told about it (no on_commit)
+        schedule_index.schedules([self.agent.id])
+        Appointment.objects.create(
+            title='Elsewhere', agent=self.agent,
+            start_time=next_monday(10), end_time=next_monday(11)
+        )
+        self.assertEqual(schedule_index.conflicts(self.agent.id, next_monday(10), next_monday(11)), [])
+
+        self.assertEqual(self.post(10, 11).status_code, 400)
+
+    def test_series_conflicts_with_later_occurrence(self):
+        Appointment.objects.create(
+            title='Later', agent=self.agent,
+            start_time=next_monday(10, weeks=3), end_time=next_monday(11, weeks=3)
+        )
+        response = self.post(10, 11, recurrence_rule='FREQ=WEEKLY;COUNT=5')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_does_not_conflict_with_itself(self):
+        self.post(10, 11)
+        appointment = Appointment.objects.get()
+        response = self.api.patch(f'/api/appointments/{appointment.id}/', {
+            'end_time': next_monday(12).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_booking_conflict_ignores_excluded_and_inactive(self):
+        booked = Appointment.objects.create(
+            title='Booked', agent=self.agent, start_time=next_monday(10), end_time=next_monday(11)
+        )
+        Appointment.objects.create(
+            title='Cancelled', agent=self.agent, status='cancelled',
+            start_time=next_monday(12), end_time=next_monday(13)
+        )
+        span = (next_monday(10), next_monday(11))
+        self.assertEqual(booking_conflict(self.agent.id, [span]), span)
+        self.assertIsNone(booking_conflict(self.agent.id, [span], {booked.id}))
+        self.assertIsNone(booking_conflict(self.agent.id, [(next_monday(12), next_monday(13))]))
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.client_user = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.now = next_monday(8)
+
+    def book(self, starts_in, **fields):
+        start = self.now + starts_in
+        return Appointment.objects.create(
+            title='Viewing', agent=self.agent, client=self.client_user,
+            start_time=start, end_time=start + timedelta(hours=1), **fields
+        )
+
+    def test_window_selection(self):
+        due = self.book(timedelta(hours=2))
+        self.book(timedelta(hours=30))
+        self.book(-timedelta(hours=1))
+        self.book(timedelta(hours=3), status='cancelled')
+        self.book(timedelta(hours=4), send_reminder=False)
+        self.book(timedelta(hours=5), reminder_sent=True)
+
+        self.assertEqual(list(due_reminders(self.now).values_list('id', flat=True)), [due.id])
+
+    @override_settings(TIME_ZONE='Africa/Douala')
+    def test_reminders_sent_once_with_local_time(self):
+        appointment = self.book(timedelta(hours=2))
+        mail.outbox.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(dispatch_due_reminders(now=self.now), 1)
+        self.assertEqual(dispatch_due_reminders(now=self.now), 0)
+
+        appointment.refresh_from_db()
+        self.assertTrue(appointment.reminder_sent)
+        self.assertEqual(Notification.objects.filter(related_id=appointment.id).count(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        local_start = timezone.localtime(appointment.start_time)
+        self.assertIn(f'{local_start:%b %d, %H:%M}', mail.outbox[0].subject)
+        self.assertNotEqual(local_start.hour, appointment.start_time.hour)
+
+    def test_series_occurrence_reminded_once(self):
+        series = self.book(timedelta(hours=2), recurrence_rule='FREQ=DAILY;COUNT=5')
+
+        self.assertEqual(dispatch_due_reminders(now=self.now), 1)
+        self.assertEqual(dispatch_due_reminders(now=self.now + timedelta(hours=1)), 0)
+        series.refresh_from_db()
+        self.assertEqual(series.last_reminded_occurrence, series.start_time)
+
+        # The next day's occurrence comes into the window
+        self.assertEqual(dispatch_due_reminders(now=self.now + timedelta(hours=20)), 1)
+        series.refresh_from_db()
+        self.assertEqual(series.last_reminded_occurrence, series.start_time + timedelta(days=1))
+        self.assertEqual(Notification.objects.filter(related_id=series.id, user=self.client_user).count(), 2)
+
+    def test_cancelled_occurrence_is_not_reminded(self):
+        series = self.book(timedelta(hours=2), recurrence_rule='FREQ=DAILY;COUNT=5')
+        Appointment.objects.create(
+            title='Viewing', agent=self.agent, client=self.client_user, series=series,
+            original_start_time=series.start_time, status='cancelled',
+            start_time=series.start_time, end_time=series.end_time
+        )
+
+        self.assertEqual(dispatch_due_reminders(now=self.now), 0)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, TIME_ZONE='Africa/Douala')
+class AppointmentStatsTests(TestCase):
+    def test_upcoming_today_uses_local_date(self):
+        cache.clear()
+        agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        # 23:30 UTC is already the next day in Douala (UTC+1)
+        now = datetime(2030, 3, 4, 23, 30, tzinfo=dt_timezone.utc)
+        local_morning = timezone.make_aware(datetime(2030, 3, 5, 10, 0))
+        Appointment.objects.create(
+            title='Viewing', agent=agent,
+            start_time=local_morning, end_time=local_morning + timedelta(hours=1)
+        )
+        api = APIClient()
+        api.force_authenticate(agent)
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = api.get('/api/appointments/stats/')
+
+        self.assertEqual(response.data['upcoming_today'], 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CalendarSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def book(self, title='Viewing'):
+        return Appointment.objects.create(
+            title=title, agent=self.agent, start_time=next_monday(10), end_time=next_monday(11)
+        )
+
+    def sync(self, token=None):
+        return self.api.get('/api/appointments/sync/', {'sync_token': token} if token else {}).data
+
+    def test_late_commit_is_picked_up_by_next_sync(self):
+        first = self.book('First')
+        token = self.sync()['sync_token']
+
+        # Saved with an updated_at before the token was issued, committed after
+        late = self.book('Late')
+        Appointment.objects.filter(pk=late.pk).update(updated_at=first.updated_at)
+
+        data = self.sync(token)
+        self.assertFalse(data['full_sync'])
+        self.assertIn(late.id, [row['id'] for row in data['changed']])
+
+    def test_token_never_moves_back(self):
+        self.book()
+        token = self.sync()['sync_token']
+        self.assertGreaterEqual(int(self.sync(token)['sync_token']), int(token))
+
+    def test_removals_are_reported(self):
+        appointment = self.book()
+        appointment_id = appointment.id
+        token = self.sync()['sync_token']
+        appointment.delete()
+        self.assertIn(appointment_id, self.sync(token)['deleted'])
+
+    def test_token_older_than_retention_gets_full_sync(self):
+        self.book()
+        old = timezone.now() - AppointmentTombstone.RETENTION - timedelta(days=1)
+        data = self.sync(ical.encode_sync_token(old))
+        self.assertTrue(data['full_sync'])
+        self.assertEqual(len(data['changed']), 1)
+
+    def test_purge_keeps_recent_tombstones(self):
+        AppointmentTombstone.record(1, [self.agent.id])
+        AppointmentTombstone.record(2, [self.agent.id])
+        AppointmentTombstone.objects.filter(appointment_id=1).update(
+            deleted_at=AppointmentTombstone.horizon() - timedelta(seconds=1)
+        )
+        self.assertEqual(AppointmentTombstone.purge(), 1)
+        self.assertEqual(list(AppointmentTombstone.objects.values_list('appointment_id', flat=True)), [2])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def test_feed_url_uses_stored_secret(self):
+        url = self.api.get('/api/appointments/ical_url/').data['url']
+        self.assertTrue(url.endswith(f'/feed/{CalendarFeed.objects.get(user=self.agent).secret}.ics'))
+        self.assertEqual(self.api.get('/api/appointments/ical_url/').data['url'], url)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+
+    def test_rotate_revokes_old_url(self):
+        old_url = self.api.get('/api/appointments/ical_url/').data['url']
+        new_url = self.api.post('/api/appointments/rotate_ical_url/').data['url']
+
+        self.assertNotEqual(old_url, new_url)
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+    def test_inactive_user_feed_is_gone(self):
+        url = self.api.get('/api/appointments/ical_url/').data['url']
+        User.objects.filter(pk=self.agent.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, TIME_ZONE='Europe/Paris')
+class RecurrenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        schedule_index.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def local(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def weekly(self, start, **fields):
+        return Appointment.objects.create(
+            title='Open house', agent=self.agent, start_time=start,
+            end_time=start + timedelta(hours=1), recurrence_rule='FREQ=WEEKLY', **fields
+        )
+
+    def test_occurrences_keep_wall_clock_time_across_dst(self):
+        # Summer time starts in Paris on 2030-03-31
+        series = self.weekly(self.local(2030, 3, 25, 10, 0))
+
+        starts = [start for start, _ in series.occurrences(self.local(2030, 3, 25), self.local(2030, 4, 9))]
+
+        self.assertEqual([timezone.localtime(start).hour for start in starts], [10, 10, 10])
+        self.assertEqual([start.astimezone(dt_timezone.utc).hour for start in starts], [9, 8, 8])
+        self.assertTrue(is_occurrence(series.recurrence(), self.local(2030, 4, 1, 10, 0)))
+        self.assertFalse(is_occurrence(series.recurrence(), self.local(2030, 4, 1, 9, 0)))
+
+    def test_bounded_series_records_its_end(self):
+        start = self.local(2030, 3, 25, 10, 0)
+        bounded = Appointment.objects.create(
+            title='Course', agent=self.agent, start_time=start, end_time=start + timedelta(hours=1),
+            recurrence_rule='FREQ=DAILY;COUNT=3'
+        )
+        self.assertEqual(bounded.recurrence_end, self.local(2030, 3, 27, 11, 0))
+        self.assertIsNone(self.weekly(start).recurrence_end)
+
+    def test_invalid_rules_are_refused(self):
+        with self.assertRaises(ValueError):
+            parse_rule('COUNT=3', timezone.now())
+        response = self.api.post('/api/appointments/', {
+            'title': 'Bad', 'agent': self.agent.id,
+            'start_time': self.local(2030, 3, 25, 10, 0).isoformat(),
+            'end_time': self.local(2030, 3, 25, 11, 0).isoformat(),
+            'recurrence_rule': 'FREQ=SOMETIMES',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('recurrence_rule', response.data)
+
+    def test_moved_occurrence_replaces_generated_one(self):
+        series = self.weekly(self.local(2030, 3, 25, 10, 0))
+        original = self.local(2030, 4, 1, 10, 0)
+        moved = self.local(2030, 4, 2, 15, 0)
+
+        response = self.api.post(f'/api/appointments/{series.id}/occurrence/', {
+            'original_start': original.isoformat(),
+            'start_time': moved.isoformat(),
+            'end_time': (moved + timedelta(hours=1)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        calendar = self.api.get('/api/appointments/calendar/', {
+            'start_date': '2030-03-31', 'end_date': '2030-04-07',
+        }).data
+        self.assertEqual(
+            [(row['series'], row['start_time']) for row in calendar],
+            [(series.id, moved.isoformat())]
+        )
+
+    def test_cancelled_occurrence_frees_the_slot(self):
+        series = self.weekly(self.local(2030, 3, 25, 10, 0))
+        original = self.local(2030, 4, 1, 10, 0)
+
+        response = self.api.post(f'/api/appointments/{series.id}/occurrence/', {
+            'original_start': original.isoformat(), 'status': 'cancelled',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        week = (self.local(2030, 3, 31), self.local(2030, 4, 7))
+        self.assertEqual(Appointment.objects.filter(pk=series.pk).occurrences(*week), [])
+        exception = Appointment.objects.get(series=series)
+        self.assertEqual((exception.status, exception.original_start_time), ('cancelled', original))
+        self.assertIsNone(booking_conflict(self.agent.id, [(original, original + timedelta(hours=1))]))
+
+    def test_occurrence_must_exist(self):
+        series = self.weekly(self.local(2030, 3, 25, 10, 0))
+        response = self.api.post(f'/api/appointments/{series.id}/occurrence/', {
+            'original_start': self.local(2030, 4, 1, 11, 0).isoformat(), 'status': 'cancelled',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_series_overlapping(self):
+        open_ended = self.weekly(self.local(2030, 3, 25, 10, 0))
+        finished = Appointment.objects.create(
+            title='Finished', agent=self.agent, start_time=self.local(2030, 3, 4, 10, 0),
+            end_time=self.local(2030, 3, 4, 11, 0), recurrence_rule='FREQ=DAILY;COUNT=2'
+        )
+        later = self.weekly(self.local(2030, 6, 3, 10, 0))
+        Appointment.objects.create(
+            title='Single', agent=self.agent,
+            start_time=self.local(2030, 4, 1, 12, 0), end_time=self.local(2030, 4, 1, 13, 0)
+        )
+
+        found = Appointment.objects.series_overlapping(self.local(2030, 4, 1), self.local(2030, 4, 8))
+
+        self.assertEqual(list(found.values_list('id', flat=True)), [open_ended.id])
+        self.assertNotIn(finished.id, found.values_list('id', flat=True))
+        self.assertNotIn(later.id, found.values_list('id', flat=True))
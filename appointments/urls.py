@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AppointmentViewSet
+from .views import AppointmentViewSet, ical_feed
 
 router = DefaultRouter()
 router.register(r'', AppointmentViewSet, basename='appointment')
 
 urlpatterns = [
+    path('feed/<str:token>.ics', ical_feed, name='appointment-ical-feed'),
     path('', include(router.urls)),
 ]
 
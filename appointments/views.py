@@ -3,21 +3,121 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.db.models import Q, Count
-from datetime import timedelta
-from .models import Appointment
+from datetime import datetime, time, timedelta
+from .models import Appointment, CalendarFeed
 from .serializers import (
     AppointmentSerializer,
     AppointmentCreateSerializer,
     AppointmentCalendarSerializer,
-    AppointmentStatsSerializer
+    AppointmentStatsSerializer,
+    AvailabilityQuerySerializer,
+    OccurrenceExceptionSerializer
 )
+from .scheduling import schedule_index
+from .recurrence import is_occurrence
+from . import ical
+from .signals import stats_version
 from activity_log.models import ActivityLog
+from real_estate_platform.conditional import ConditionalGetMixin
+from users.models import User
+
+STATS_CACHE_TIMEOUT = 60  # seconds
+ICAL_FEED_HISTORY = timedelta(days=90)
+# Series are expanded over this span when a calendar request gives no end date
+CALENDAR_DEFAULT_SPAN = timedelta(days=90)
+
+# Fields an exception row copies from its series
+OCCURRENCE_FIELDS = [
+    'title', 'description', 'appointment_type', 'agent_id', 'client_id',
+    'related_property_id', 'related_transaction_id', 'duration_minutes',
+    'location', 'meeting_link', 'is_virtual', 'status', 'priority',
+    'send_reminder', 'notes', 'client_notes',
+]
+
+
+def appointments_visible_to(user):
+    """Appointments a user may see"""
+    # Admins see all appointments
+    if user.role == 'admin':
+        return Appointment.objects.all()
+
+    # Attendance is matched with a semi-join so no DISTINCT is needed
+    attending = Q(id__in=Appointment.attendees.through.objects.filter(
+        user=user
+    ).values('appointment_id'))
+
+    # Agents see their own appointments
+    if user.role == 'agent':
+        return Appointment.objects.filter(Q(agent=user) | attending)
+
+    # Clients see their own appointments
+    return Appointment.objects.filter(Q(client=user) | attending)
+
+
+def with_occurrences(queryset, start, end):
+    """
+    Single appointments and series occurrences starting in [start, end],
+    in start order
+    """
+    singles = queryset.singles().filter(start_time__gte=start, start_time__lte=end)
+    occurrences = [
+        occurrence for occurrence in queryset.occurrences(start, end)
+        if occurrence.start_time >= start
+    ]
+    return sorted([*singles, *occurrences], key=lambda appointment: appointment.start_time)
+
+
+def parse_bound(value):
+    """Datetime from an ISO date or datetime query parameter, or None"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match already names this ETag"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or '*' in tags
+
+
+def calendar_response(request, user, queryset):
+    """iCalendar document for recent and future appointments, honouring ETags"""
+    cutoff = timezone.now() - ICAL_FEED_HISTORY
+    queryset = queryset.filter(
+        Q(end_time__gte=cutoff)
+        | Q(recurrence_rule__isnull=False, recurrence_end__isnull=True)
+        | Q(recurrence_end__gte=cutoff)
+    )
+    etag = ical.calendar_etag(queryset, user)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(
+            ical.render_calendar(queryset.order_by('start_time'), request.get_host()),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+    response['ETag'] = etag
+    return response
 
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    # Attendees do not touch updated_at
+    cache_tags = ('appointments', 'properties', 'users')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['appointment_type', 'status', 'priority', 'agent', 'client', 'related_property', 'is_virtual']
     search_fields = ['title', 'description', 'location', 'notes']
@@ -25,22 +125,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     ordering = ['start_time']
 
     def get_queryset(self):
-        user = self.request.user
-
-        # Admins see all appointments
-        if user.role == 'admin':
-            return Appointment.objects.all()
-
-        # Agents see their own appointments
-        if user.role == 'agent':
-            return Appointment.objects.filter(
-                Q(agent=user) | Q(attendees=user)
-            ).distinct()
-
-        # Clients see their own appointments
-        return Appointment.objects.filter(
-            Q(client=user) | Q(attendees=user)
-        ).distinct()
+        return appointments_visible_to(self.request.user)
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -85,75 +170,277 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def calendar(self, request):
-        """Get appointments for calendar view"""
+        """
+        Get appointments for calendar view
+        Query params:
+            - start_date, end_date: date range (ISO dates or datetimes)
+        Recurring series are expanded into their occurrences within the
+        range (from now, for CALENDAR_DEFAULT_SPAN, when not given).
+        """
         queryset = self.filter_queryset(self.get_queryset())
 
         # Filter by date range if provided
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
+        window_start = parse_bound(start_date) if start_date else timezone.now()
+        window_end = parse_bound(end_date) if end_date else window_start + CALENDAR_DEFAULT_SPAN
+        if window_start is None or window_end is None:
+            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
 
+        singles = queryset.singles().select_related('agent', 'client', 'related_property')
         if start_date:
-            queryset = queryset.filter(start_time__gte=start_date)
+            singles = singles.filter(start_time__gte=window_start)
         if end_date:
-            queryset = queryset.filter(end_time__lte=end_date)
+            singles = singles.filter(end_time__lte=window_end)
+
+        occurrences = [
+            occurrence
+            for occurrence in queryset.select_related('agent', 'client', 'related_property')
+            .occurrences(window_start, window_end)
+            if occurrence.start_time >= window_start and occurrence.end_time <= window_end
+        ]
+        appointments = sorted([*singles, *occurrences], key=lambda appointment: appointment.start_time)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(appointments, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Incremental calendar sync
+        Query params:
+            - sync_token: token returned by the previous sync (omit for a full sync)
+        Apply ``deleted`` before ``changed``; an appointment shared again
+        after removal shows up in both. Changes near the end of one sync
+        are sent again by the next, and old tokens get a full sync.
+        """
+        queryset = self.get_queryset()
+        etag = ical.calendar_etag(queryset, request.user)
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        token = request.query_params.get('sync_token')
+        since = ical.decode_sync_token(token) if token else None
+        if token and since is None:
+            return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+
+        changed, deleted, next_token, full_sync = ical.delta_since(queryset, request.user, since)
+        changed = changed.select_related('agent', 'client', 'related_property')
+        response = Response({
+            'full_sync': full_sync,
+            'changed': AppointmentCalendarSerializer(changed, many=True).data,
+            'deleted': deleted,
+            'sync_token': next_token,
+        })
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['get'])
+    def ical(self, request):
+        """Get the user's appointments as an iCalendar (.ics) file"""
+        return calendar_response(request, request.user, self.get_queryset())
+
+    def _feed_url(self, request, feed):
+        path = reverse('appointment-ical-feed', kwargs={'token': feed.secret})
+        return Response({'url': request.build_absolute_uri(path)})
+
+    @action(detail=False, methods=['get'])
+    def ical_url(self, request):
+        """Get the private feed URL external calendar apps can subscribe to"""
+        return self._feed_url(request, CalendarFeed.for_user(request.user))
+
+    @action(detail=False, methods=['post'])
+    def rotate_ical_url(self, request):
+        """Replace the private feed URL; subscriptions to the old one stop updating"""
+        feed = CalendarFeed.for_user(request.user)
+        feed.rotate()
+        return self._feed_url(request, feed)
+
     @action(detail=False, methods=['get'])
     def upcoming(self, request):
         """Get upcoming appointments"""
         now = timezone.now()
         days = int(request.query_params.get('days', 7))
 
-        queryset = self.get_queryset().filter(
-            start_time__gte=now,
-            start_time__lte=now + timedelta(days=days),
-            status__in=['scheduled', 'confirmed']
-        )
+        queryset = self.get_queryset().filter(status__in=['scheduled', 'confirmed'])
+        appointments = with_occurrences(queryset, now, now + timedelta(days=days))
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(appointments, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def today(self, request):
         """Get today's appointments"""
-        today = timezone.now().date()
-        queryset = self.get_queryset().filter(
-            start_time__date=today
+        day_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        appointments = with_occurrences(
+            self.get_queryset(), day_start, day_start + timedelta(days=1) - timedelta(microseconds=1)
         )
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(appointments, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get appointment statistics"""
-        queryset = self.get_queryset()
-        now = timezone.now()
-
-        stats = {
-            'total_appointments': queryset.count(),
-            'scheduled': queryset.filter(status='scheduled').count(),
-            'confirmed': queryset.filter(status='confirmed').count(),
-            'completed': queryset.filter(status='completed').count(),
-            'cancelled': queryset.filter(status='cancelled').count(),
-            'upcoming_today': queryset.filter(
-                start_time__date=now.date(),
-                status__in=['scheduled', 'confirmed']
-            ).count(),
-            'upcoming_week': queryset.filter(
-                start_time__gte=now,
-                start_time__lte=now + timedelta(days=7),
-                status__in=['scheduled', 'confirmed']
-            ).count(),
-            'by_type': list(queryset.values('appointment_type').annotate(count=Count('id'))),
-            'by_agent': list(queryset.values('agent__full_name').annotate(count=Count('id'))[:10])
-        }
+        cache_key = f'appointment_stats:{stats_version()}:{request.user.id}'
+        stats = cache.get(cache_key)
+        if stats is None:
+            stats = self._compute_stats(self.get_queryset())
+            cache.set(cache_key, stats, STATS_CACHE_TIMEOUT)
 
         serializer = AppointmentStatsSerializer(stats)
         return Response(serializer.data)
 
+    def _compute_stats(self, queryset):
+        """Scalar counters in one aggregate query, breakdowns from one grouped query"""
+        now = timezone.now()
+        active = Q(status__in=['scheduled', 'confirmed'])
+
+        stats = queryset.aggregate(
+            total_appointments=Count('id'),
+            scheduled=Count('id', filter=Q(status='scheduled')),
+            confirmed=Count('id', filter=Q(status='confirmed')),
+            completed=Count('id', filter=Q(status='completed')),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+            upcoming_today=Count('id', filter=active & Q(start_time__date=timezone.localdate(now))),
+            upcoming_week=Count('id', filter=active & Q(
+                start_time__gte=now,
+                start_time__lte=now + timedelta(days=7)
+            )),
+        )
+
+        by_type = {}
+        by_agent = {}
+        groups = queryset.order_by().values(
+            'appointment_type', 'agent', 'agent__first_name', 'agent__last_name', 'agent__email'
+        ).annotate(count=Count('id'))
+        for group in groups:
+            by_type[group['appointment_type']] = by_type.get(group['appointment_type'], 0) + group['count']
+            agent = by_agent.setdefault(group['agent'], {
+                'agent': group['agent'],
+                'agent_name': f"{group['agent__first_name']} {group['agent__last_name']}".strip()
+                              or group['agent__email'],
+                'count': 0,
+            })
+            agent['count'] += group['count']
+
+        stats['by_type'] = [
+            {'appointment_type': appointment_type, 'count': count}
+            for appointment_type, count in by_type.items()
+        ]
+        stats['by_agent'] = sorted(by_agent.values(), key=lambda agent: -agent['count'])[:10]
+        return stats
+
+    def _availability_params(self, request):
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        agent_ids = data.get('agents') or list(
+            User.objects.filter(role='agent', is_active=True).values_list('id', flat=True)
+        )
+        start = data.get('start') or timezone.now()
+        end = data.get('end') or start + timedelta(days=7)
+        return agent_ids, start, end, timedelta(minutes=data['duration'])
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Get free slots per agent
+        Query params:
+            - agents: comma-separated agent ids (default: all agents)
+            - start, end: search window (default: now to a week from now)
+            - duration: minimum slot length in minutes (default: 60)
+        """
+        agent_ids, start, end, duration = self._availability_params(request)
+        slots = schedule_index.free_slots(agent_ids, start, end, duration)
+        return Response({
+            str(agent_id): [{'start': slot_start, 'end': slot_end} for slot_start, slot_end in agent_slots]
+            for agent_id, agent_slots in slots.items()
+        })
+
+    @action(detail=False, methods=['get'])
+    def first_available(self, request):
+        """Get the earliest free slot across agents (same params as availability)"""
+        agent_ids, start, end, duration = self._availability_params(request)
+        slot = schedule_index.first_available(
+            agent_ids, start, duration, search_days=max((end - start).days, 1)
+        )
+        if slot is None:
+            return Response({'detail': 'No agent is available in this window'}, status=status.HTTP_404_NOT_FOUND)
+
+        agent_id, slot_start, slot_end = slot
+        return Response({'agent': agent_id, 'start': slot_start, 'end': slot_end})
+
+    @action(detail=False, methods=['get'])
+    def double_bookings(self, request):
+        """Get overlapping appointments per agent (admins: all agents, agents: themselves)"""
+        if request.user.role == 'admin':
+            agent_ids = list(User.objects.filter(role='agent').values_list('id', flat=True))
+        elif request.user.role == 'agent':
+            agent_ids = [request.user.id]
+        else:
+            return Response({'error': 'Only admins and agents can view double bookings'}, status=403)
+
+        report = schedule_index.double_bookings(agent_ids)
+        return Response([
+            {'agent': agent_id, 'appointments': list(pair)}
+            for agent_id, pairs in report.items()
+            for pair in pairs
+        ])
+
+    @action(detail=True, methods=['post'])
+    def occurrence(self, request, pk=None):
+        """
+        Edit or cancel a single occurrence of a recurring series
+        Body:
+            - original_start: start time of the occurrence being changed
+            - any appointment field to override (e.g. start_time, end_time,
+              location, or status='cancelled')
+        The change is stored as an exception row replacing that occurrence.
+        """
+        series = self.get_object()
+        if not series.recurrence_rule:
+            return Response({'error': 'Appointment is not a recurring series'}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = OccurrenceExceptionSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        original_start = params.validated_data['original_start']
+
+        exception = series.exceptions.filter(original_start_time=original_start).first()
+        if exception is None:
+            if not is_occurrence(series.recurrence(), original_start):
+                return Response({'error': 'No occurrence starts at this time'}, status=status.HTTP_400_BAD_REQUEST)
+            exception = Appointment(
+                series=series,
+                original_start_time=original_start,
+                start_time=original_start,
+                end_time=original_start + (series.end_time - series.start_time),
+                created_by=request.user,
+                **{field: getattr(series, field) for field in OCCURRENCE_FIELDS}
+            )
+
+        overrides = {key: value for key, value in request.data.items() if key != 'original_start'}
+        overrides.pop('recurrence_rule', None)
+        serializer = AppointmentCreateSerializer(exception, data=overrides, partial=True)
+        serializer.is_valid(raise_exception=True)
+        created = exception.pk is None
+        exception = serializer.save()
+        if created:
+            exception.attendees.set(series.attendees.all())
+
+        ActivityLog.log_activity(
+            user=request.user,
+            action='update',
+            description=f'Changed occurrence {original_start:%Y-%m-%d %H:%M} of series: {series.title}',
+            content_object=series,
+            severity='low'
+        )
+
+        return Response(AppointmentSerializer(exception).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         """Confirm an appointment"""
@@ -207,3 +494,15 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
+
+
+def ical_feed(request, token):
+    """
+    Token-authenticated iCalendar feed for calendar apps that cannot send
+    an Authorization header
+    """
+    user = CalendarFeed.user_for(token)
+    if user is None:
+        raise Http404('Calendar feed not found')
+
+    return calendar_response(request, user, appointments_visible_to(user))
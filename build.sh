@@ -4,7 +4,7 @@ set -o errexit
 
 echo "Installing dependencies..."
 pip install -r requirements.txt
-pip install gunicorn whitenoise dj-database-url
+pip install gunicorn uvicorn whitenoise dj-database-url
 
 echo "Collecting static files..."
 python manage.py collectstatic --no-input
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CostEstimatesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cost_estimates'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        import cost_estimates.signals
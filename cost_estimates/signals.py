@@ -0,0 +1,10 @@
+"""
+Django signals retiring cached project template responses and estimate
+validators when templates or estimate items change
+"""
+from real_estate_platform.response_cache import invalidate_on_change
+from .models import EstimateItem, ProjectTemplate
+
+invalidate_on_change(ProjectTemplate, 'project_templates')
+# Item changes and deletes do not always touch the estimate's updated_at
+invalidate_on_change(EstimateItem, 'estimates')
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from decimal import Decimal
+from real_estate_platform.conditional import ConditionalGetMixin
+from real_estate_platform.response_cache import CachedResponseMixin
 from .models import CostEstimate, EstimateItem, ProjectTemplate
 from .serializers import (
     CostEstimateSerializer,
@@ -13,9 +15,10 @@ from .serializers import (
 )
 
 
-class CostEstimateListCreateView(generics.ListCreateAPIView):
+class CostEstimateListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """List and create cost estimates"""
 
+    cache_tags = ('estimates', 'users')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['project_type', 'quality_level', 'status']
@@ -33,9 +36,10 @@ class CostEstimateListCreateView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
-class CostEstimateDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CostEstimateDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a cost estimate"""
 
+    cache_tags = ('estimates', 'properties', 'users')
     serializer_class = CostEstimateSerializer
     permission_classes = [IsAuthenticated]
 
@@ -66,9 +70,10 @@ class EstimateItemDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class ProjectTemplateListView(generics.ListAPIView):
+class ProjectTemplateListView(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     """List project templates"""
 
+    cache_tags = ('project_templates', 'users')
     queryset = ProjectTemplate.objects.filter(is_active=True)
     serializer_class = ProjectTemplateSerializer
     permission_classes = [IsAuthenticated]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Document
+from .models import Document, DocumentAccess, StorageUsage
 
 
 @admin.register(Document)
@@ -27,3 +27,19 @@ class DocumentAdmin(admin.ModelAdmin):
             'fields': ('is_public', 'is_archived')
         }),
     )
+
+
+@admin.register(DocumentAccess)
+class DocumentAccessAdmin(admin.ModelAdmin):
+    list_display = ['document', 'user', 'reason']
+    list_filter = ['reason']
+    search_fields = ['document__title', 'user__email']
+    raw_id_fields = ['document', 'user']
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    list_display = ['user', 'used_bytes', 'document_count', 'quota_bytes', 'updated_at']
+    search_fields = ['user__email']
+    readonly_fields = ['used_bytes', 'document_count', 'updated_at']
+    raw_id_fields = ['user']
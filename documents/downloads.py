@@ -0,0 +1,179 @@
+"""
+File download responses with byte ranges, conditional requests and
+hand-off to the front server.
+
+After the permission check the transfer is either streamed by Django or,
+with ``settings.FILE_DOWNLOAD_BACKEND`` set to ``x-accel-redirect`` (nginx)
+or ``x-sendfile`` (Apache, lighttpd), handed to the front server, which then
+serves the bytes (and ranges) itself without holding an application worker.
+
+Django streams through the file's iterator under WSGI, but under ASGI it
+reads a synchronous iterator to the end before sending anything, so ASGI
+requests get an asynchronous iterator reading the file chunk by chunk.
+"""
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bytes per read of an ASGI download; each read is a hop to a thread
+ASYNC_CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range ``Range`` header, None to
+    serve the whole file (no, malformed or multi-range header), or False
+    if the range cannot be satisfied
+    """
+    match = _RANGE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in tags or f'W/{etag}' in tags or '*' in tags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return bool(if_modified_since and last_modified and int(last_modified.timestamp()) <= if_modified_since)
+
+
+def _range_applies(request, etag, last_modified):
+    """Honour Range only if If-Range (when sent) still matches the file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('W/'):
+        # If-Range needs a strong validator
+        return False
+    if if_range.startswith('"'):
+        return bool(etag) and not etag.startswith('W/') and if_range == etag
+    since = parse_http_date_safe(if_range)
+    return bool(since and last_modified and int(last_modified.timestamp()) <= since)
+
+
+class _BoundedFile:
+    """Read-only view of ``length`` bytes of an open file from its current position"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+async def _read_chunks(file, chunk_size):
+    """Chunks of an open file read in a thread, for ASGI responses"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while chunk := await read(chunk_size):
+        yield chunk
+
+
+def _disposition(filename, as_attachment):
+    """
+    Content-Disposition (RFC 6266) with an ASCII ``filename`` quoted-string
+    for every client and, when the name is not plain printable ASCII, the
+    exact name as ``filename*``
+    """
+    kind = 'attachment' if as_attachment else 'inline'
+    fallback = ''.join(char if ' ' <= char <= '~' else '_' for char in filename)
+    quoted = fallback.replace('\\', '\\\\').replace('"', '\\"')
+    disposition = f'{kind}; filename="{quoted}"'
+    if fallback != filename:
+        disposition += f"; filename*=utf-8''{quote(filename)}"
+    return disposition
+
+
+def _offloaded(field_file, backend):
+    response = HttpResponse()
+    if backend == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.FILE_DOWNLOAD_ACCEL_PREFIX + quote(field_file.name)
+    else:
+        response['X-Sendfile'] = field_file.path
+    # Let the front server fill in the type from the file
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, field_file, filename, content_type=None, etag=None,
+                  last_modified=None, as_attachment=True):
+    """
+    Response for downloading ``field_file`` that answers conditional
+    requests with 304, serves single byte ranges with 206, and offloads the
+    transfer to the front server when configured
+    """
+    if etag and _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        backend = getattr(settings, 'FILE_DOWNLOAD_BACKEND', 'django')
+        if backend in ('x-accel-redirect', 'x-sendfile'):
+            response = _offloaded(field_file, backend)
+        else:
+            response = _streamed(request, field_file, content_type, etag, last_modified)
+        response['Content-Disposition'] = _disposition(filename, as_attachment)
+
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def _streamed(request, field_file, content_type, etag, last_modified):
+    size = field_file.size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _range_applies(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = field_file.open('rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(_BoundedFile(file, end - start + 1), status=206,
+                                content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        # Headers and the file's closer stay as FileResponse set them
+        response.streaming_content = _read_chunks(response.file_to_stream, ASYNC_CHUNK_SIZE)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,14 @@
+"""
+Management command to delete unreferenced content-addressed files
+Usage: python manage.py collect_blobs
+"""
+from django.core.management.base import BaseCommand
+from documents.models import StoredBlob
+
+
+class Command(BaseCommand):
+    help = 'Delete stored files no document references, including those left by rolled-back saves'
+
+    def handle(self, *args, **options):
+        count = StoredBlob.collect_unreferenced()
+        self.stdout.write(self.style.SUCCESS(f'Collected {count} unreferenced file(s)'))
@@ -0,0 +1,56 @@
+"""
+Management command to move files stored under upload paths into
+content-addressed storage, collapsing duplicates
+Usage: python manage.py deduplicate_files [--dry-run]
+"""
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from documents.models import StoredBlob
+from documents.signals import BLOB_FIELDS
+from documents.storage import BLOB_PREFIX, blob_storage
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads into content-addressed storage and delete duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many files would be moved')
+
+    def handle(self, *args, **options):
+        moved = 0
+        freed = 0
+        for model, field_name in BLOB_FIELDS.items():
+            legacy = model.objects.exclude(**{f'{field_name}__startswith': BLOB_PREFIX}).exclude(
+                **{field_name: ''}
+            ).exclude(**{f'{field_name}__isnull': True})
+
+            for pk, old_name in legacy.values_list('pk', field_name).iterator():
+                if options['dry_run']:
+                    moved += 1
+                    continue
+                if not default_storage.exists(old_name):
+                    self.stderr.write(f'Missing file for {model.__name__} {pk}: {old_name}')
+                    continue
+
+                with default_storage.open(old_name, 'rb') as old_file:
+                    new_name = blob_storage.save(old_name, old_file)
+                # Queryset update, so the reference signals do not run twice
+                model.objects.filter(pk=pk).update(**{field_name: new_name})
+                StoredBlob.retain(new_name)
+                moved += 1
+
+                still_used = any(
+                    other.objects.filter(**{other_field: old_name}).exists()
+                    for other, other_field in BLOB_FIELDS.items()
+                )
+                if not still_used:
+                    freed += default_storage.size(old_name)
+                    default_storage.delete(old_name)
+
+        if options['dry_run']:
+            self.stdout.write(f'{moved} file(s) would be moved into content-addressed storage')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Moved {moved} file(s), freed {round(freed / (1024 * 1024), 2)} MB'
+            ))
@@ -0,0 +1,19 @@
+"""
+Management command to delete expired chunked uploads and their partial files
+Usage: python manage.py purge_upload_sessions
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from documents.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that expired before being completed'
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(expires_at__lte=timezone.now())
+        count = 0
+        for session in expired.iterator():
+            session.discard()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired upload(s)'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_access_grants(apps, schema_editor):
+    """Grant existing documents to their uploaders and the related agents"""
+    Document = apps.get_model('documents', 'Document')
+    DocumentAccess = apps.get_model('documents', 'DocumentAccess')
+
+    rows = Document.objects.values_list(
+        'id', 'uploaded_by_id', 'related_property__agent_id', 'related_transaction__agent_id'
+    )
+    grants = []
+    for document_id, uploader_id, property_agent_id, transaction_agent_id in rows.iterator():
+        for user_id, reason in [
+            (uploader_id, 'uploader'),
+            (property_agent_id, 'property_agent'),
+            (transaction_agent_id, 'transaction_agent'),
+        ]:
+            if user_id:
+                grants.append(DocumentAccess(document_id=document_id, user_id=user_id, reason=reason))
+    DocumentAccess.objects.bulk_create(grants, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('uploader', 'Uploader'), ('property_agent', 'Property Agent'), ('transaction_agent', 'Transaction Agent')], max_length=20)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_grants', to='documents.document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_grants', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'document_access',
+                'indexes': [models.Index(fields=['user', 'document'], name='document_ac_user_id_767327_idx')],
+                'unique_together': {('document', 'user', 'reason')},
+            },
+        ),
+        migrations.RunPython(seed_access_grants, migrations.RunPython.noop),
+    ]
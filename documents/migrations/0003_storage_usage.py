@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_storage_usage(apps, schema_editor):
+    """Start each uploader's counters from their existing documents"""
+    Document = apps.get_model('documents', 'Document')
+    StorageUsage = apps.get_model('documents', 'StorageUsage')
+
+    totals = Document.objects.filter(uploaded_by__isnull=False).order_by().values(
+        'uploaded_by'
+    ).annotate(used=Sum('file_size'), count=Count('id'))
+    StorageUsage.objects.bulk_create([
+        StorageUsage(user_id=row['uploaded_by'], used_bytes=row['used'] or 0, document_count=row['count'])
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_document_access'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('used_bytes', models.BigIntegerField(default=0)),
+                ('document_count', models.IntegerField(default=0)),
+                ('quota_bytes', models.BigIntegerField(blank=True, help_text='Overrides the default quota (0 for unlimited)', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='document_storage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'document_storage_usage',
+            },
+        ),
+        migrations.RunPython(seed_storage_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedblob',
+            name='claimed_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
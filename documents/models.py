@@ -1,6 +1,40 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from datetime import timedelta
+import hashlib
 import os
+import uuid
+from .storage import get_blob_storage, blob_storage, is_blob
+
+
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.doc': 'application/msword',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xls': 'application/vnd.ms-excel',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.txt': 'text/plain',
+}
+
+
+def mime_type_for(filename):
+    """MIME type from a file name's extension"""
+    ext = os.path.splitext(filename)[1].lower()
+    return MIME_TYPES.get(ext, 'application/octet-stream')
+
+
+def file_checksum(file):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
 
 
 def get_upload_path(instance, filename):
@@ -13,6 +47,22 @@ def get_upload_path(instance, filename):
         return f'documents/general/{filename}'
 
 
+class DocumentQuerySet(models.QuerySet):
+
+    def visible_to(self, user):
+        """
+        Documents a user may see: everything for staff, otherwise public
+        documents plus those granted in the access table (an indexed
+        semi-join, so no joins through properties or transactions)
+        """
+        if user.is_staff:
+            return self
+        return self.filter(
+            Q(is_public=True) |
+            Q(id__in=DocumentAccess.objects.filter(user=user).values('document_id'))
+        )
+
+
 class Document(models.Model):
     """Universal document model for all document types"""
 
@@ -54,9 +104,11 @@ class Document(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
 
     # File
-    file = models.FileField(upload_to=get_upload_path)
+    file = models.FileField(upload_to=get_upload_path, storage=get_blob_storage)
+    original_filename = models.CharField(max_length=255, blank=True, null=True)
     file_size = models.BigIntegerField(null=True, blank=True)  # in bytes
     file_type = models.CharField(max_length=100, blank=True, null=True)  # MIME type
+    checksum = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # SHA-256
 
     # Relationships (nullable to support different document types)
     related_property = models.ForeignKey('properties.Property', on_delete=models.CASCADE,
@@ -79,6 +131,8 @@ class Document(models.Model):
     # Tags for better organization
     tags = models.JSONField(default=list, blank=True)
 
+    objects = DocumentQuerySet.as_manager()
+
     class Meta:
         db_table = 'documents'
         ordering = ['-uploaded_at']
@@ -94,24 +148,16 @@ class Document(models.Model):
         return f"{self.title} ({self.get_document_type_display()})"
 
     def save(self, *args, **kwargs):
-        # Auto-set file size and type
-        if self.file:
+        # Auto-set file size, type and checksum when a new file is attached;
+        # chunked uploads arrive with all three already computed
+        if self.file and not self.file._committed:
+            upload = self.file.file
             self.file_size = self.file.size
-            # Get file extension
-            ext = os.path.splitext(self.file.name)[1].lower()
-            mime_types = {
-                '.pdf': 'application/pdf',
-                '.doc': 'application/msword',
-                '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                '.xls': 'application/vnd.ms-excel',
-                '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.txt': 'text/plain',
-            }
-            self.file_type = mime_types.get(ext, 'application/octet-stream')
+            self.file_type = getattr(upload, 'detected_type', None) or mime_type_for(self.file.name)
+            self.checksum = getattr(upload, 'checksum', None) or file_checksum(self.file)
+            self.original_filename = os.path.basename(self.file.name)
+            # Lets the content-addressed storage skip hashing the file again
+            upload.checksum = self.checksum
 
         # Auto-set category based on relationships
         if not self.category:
@@ -133,9 +179,294 @@ class Document(models.Model):
             return round(self.file_size / (1024 * 1024), 2)
         return 0
 
+    @property
+    def download_name(self):
+        """File name to offer when downloading"""
+        return self.original_filename or os.path.basename(self.file.name)
+
+    @property
+    def etag(self):
+        """Strong validator from the content checksum, weak one for files saved before checksums"""
+        if self.checksum:
+            return f'"{self.checksum}"'
+        return f'W/"{self.file.name}-{self.file_size or 0}"'
+
     @property
     def file_extension(self):
         """Return file extension"""
         if self.file:
             return os.path.splitext(self.file.name)[1].lower()
         return ''
+
+
+class DocumentAccess(models.Model):
+    """
+    Precomputed grant letting a user see a document, kept in sync with the
+    uploader and the agents of the related property and transaction
+    """
+
+    REASON_CHOICES = [
+        ('uploader', 'Uploader'),
+        ('property_agent', 'Property Agent'),
+        ('transaction_agent', 'Transaction Agent'),
+    ]
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='access_grants')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name='document_grants')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+
+    class Meta:
+        db_table = 'document_access'
+        unique_together = ['document', 'user', 'reason']
+        indexes = [
+            models.Index(fields=['user', 'document']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} can access document {self.document_id} ({self.reason})"
+
+    @classmethod
+    def expected_grants(cls, document_ids):
+        """(document_id, user_id, reason) tuples the given documents should have"""
+        rows = Document.objects.filter(id__in=document_ids).values_list(
+            'id', 'uploaded_by_id', 'related_property__agent_id', 'related_transaction__agent_id'
+        )
+        grants = set()
+        for document_id, uploader_id, property_agent_id, transaction_agent_id in rows:
+            for user_id, reason in [
+                (uploader_id, 'uploader'),
+                (property_agent_id, 'property_agent'),
+                (transaction_agent_id, 'transaction_agent'),
+            ]:
+                if user_id:
+                    grants.add((document_id, user_id, reason))
+        return grants
+
+    @classmethod
+    def sync(cls, document_ids):
+        """Bring the grants of the given documents in line with their current owners"""
+        document_ids = list(document_ids)
+        if not document_ids:
+            return
+        expected = cls.expected_grants(document_ids)
+        existing = {
+            (grant.document_id, grant.user_id, grant.reason): grant.pk
+            for grant in cls.objects.filter(document_id__in=document_ids)
+        }
+        stale = [pk for key, pk in existing.items() if key not in expected]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        cls.objects.bulk_create([
+            cls(document_id=document_id, user_id=user_id, reason=reason)
+            for document_id, user_id, reason in expected - existing.keys()
+        ], ignore_conflicts=True)
+
+
+class StorageUsage(models.Model):
+    """
+    Running totals of the documents a user has uploaded, adjusted on every
+    upload and delete so quota checks never have to scan documents
+    """
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                related_name='document_storage')
+    used_bytes = models.BigIntegerField(default=0)
+    document_count = models.IntegerField(default=0)
+    quota_bytes = models.BigIntegerField(null=True, blank=True,
+                                         help_text='Overrides the default quota (0 for unlimited)')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'document_storage_usage'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.used_bytes} bytes in {self.document_count} documents"
+
+    @property
+    def limit(self):
+        """Quota in bytes, or None when unlimited"""
+        quota = self.quota_bytes if self.quota_bytes is not None else settings.DOCUMENT_STORAGE_QUOTA
+        return quota or None
+
+    @property
+    def remaining(self):
+        limit = self.limit
+        return None if limit is None else max(limit - self.used_bytes, 0)
+
+    @classmethod
+    def for_user(cls, user_id):
+        usage, _ = cls.objects.get_or_create(user_id=user_id)
+        return usage
+
+    @classmethod
+    def adjust(cls, user_id, size_delta, count_delta):
+        """Atomically add to a user's counters, creating the row on first use"""
+        if not user_id or not (size_delta or count_delta):
+            return
+        changes = {
+            'used_bytes': F('used_bytes') + size_delta,
+            'document_count': F('document_count') + count_delta,
+            'updated_at': timezone.now(),
+        }
+        if not cls.objects.filter(user_id=user_id).update(**changes):
+            cls.objects.bulk_create([cls(user_id=user_id)], ignore_conflicts=True)
+            cls.objects.filter(user_id=user_id).update(**changes)
+
+
+class UploadSession(models.Model):
+    """
+    State of a chunked, resumable upload: the bytes received so far live in
+    a partial file on disk until the upload is completed into a Document
+    """
+
+    EXPIRY = timedelta(hours=24)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name='document_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True, null=True)
+    metadata = models.JSONField(default=dict, blank=True)  # Document fields sent at init
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'document_upload_sessions'
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size} bytes)"
+
+    @property
+    def partial_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{self.id}.part')
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.total_size
+
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + self.EXPIRY
+        super().save(*args, **kwargs)
+
+    def discard(self):
+        """Delete the session and its partial file"""
+        try:
+            os.remove(self.partial_path)
+        except FileNotFoundError:
+            pass
+        self.delete()
+
+
+class StoredBlob(models.Model):
+    """
+    A content-addressed file and the number of documents, property
+    documents and message attachments referencing it.
+
+    Storing a file claims its row first (see ``claim``), and unreferenced
+    blobs are only collected once their last claim is older than
+    ``CLAIM_GRACE``, so a save that found the file already on disk never
+    has it deleted before its reference is counted. Files left by saves
+    that were rolled back are removed by ``collect_unreferenced``.
+    """
+
+    CLAIM_GRACE = timedelta(hours=1)
+
+    name = models.CharField(max_length=255, primary_key=True)  # Storage name
+    checksum = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'stored_blobs'
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+    @staticmethod
+    def _checksum(name):
+        return os.path.splitext(os.path.basename(name))[0]
+
+    @classmethod
+    def claim(cls, name, size):
+        """
+        Mark a blob as about to be referenced, under its row lock, before
+        the storage decides whether the file still has to be written
+        """
+        blobs = cls.objects.filter(name=name)
+        with transaction.atomic():
+            if not blobs.update(claimed_at=timezone.now()):
+                cls.objects.bulk_create(
+                    [cls(name=name, checksum=cls._checksum(name), size=size)], ignore_conflicts=True
+                )
+                # Someone else may have inserted the row first
+                blobs.update(claimed_at=timezone.now())
+
+    @classmethod
+    def retain(cls, name):
+        """Count a new reference to a stored file"""
+        if not is_blob(name):
+            return
+        if not cls.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            size = blob_storage.size(name) if blob_storage.exists(name) else 0
+            cls.objects.bulk_create([cls(name=name, checksum=cls._checksum(name), size=size)],
+                                    ignore_conflicts=True)
+            cls.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+    @classmethod
+    def release(cls, name):
+        """Drop a reference; the file is collected after commit if it was the last one"""
+        if not is_blob(name):
+            return
+        cls.objects.filter(name=name).update(ref_count=F('ref_count') - 1)
+        transaction.on_commit(lambda: cls.collect(name))
+
+    @classmethod
+    def collect(cls, name, now=None):
+        """
+        Delete a blob and its file if it is unreferenced and not claimed
+        recently, re-checked under the row lock; returns whether it was
+        """
+        cutoff = (now or timezone.now()) - cls.CLAIM_GRACE
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(
+                name=name, ref_count__lte=0, claimed_at__lt=cutoff
+            ).first()
+            if blob is None:
+                return False
+            blob.delete()
+            blob_storage.delete(name)
+        return True
+
+    @classmethod
+    def collect_unreferenced(cls, now=None):
+        """
+        Delete unreferenced blobs past the claim grace period, and blob files
+        older than it that have no row at all (a save rolled back before its
+        claim was committed). Returns the number of files deleted.
+        """
+        now = now or timezone.now()
+        cutoff = now - cls.CLAIM_GRACE
+        collected = 0
+        names = cls.objects.filter(ref_count__lte=0, claimed_at__lt=cutoff).values_list('name', flat=True)
+        for name in list(names):
+            collected += cls.collect(name, now)
+
+        for name in blob_storage.blob_names():
+            if blob_storage.get_modified_time(name) >= cutoff or cls.objects.filter(name=name).exists():
+                continue
+            # Collected through a stale row, so a concurrent claim either
+            # refreshes it first or waits for the row lock
+            cls.objects.bulk_create([cls(
+                name=name, checksum=cls._checksum(name), claimed_at=cutoff - timedelta(seconds=1)
+            )], ignore_conflicts=True)
+            collected += cls.collect(name, now)
+        return collected
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Document
+from .models import Document, StorageUsage, UploadSession
+from .uploads import MAX_UPLOAD_SIZE, RECOMMENDED_CHUNK_SIZE
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -18,12 +19,12 @@ class DocumentSerializer(serializers.ModelSerializer):
         model = Document
         fields = [
             'id', 'title', 'description', 'document_type', 'category',
-            'file', 'file_url', 'file_size', 'file_size_mb', 'file_type', 'file_extension',
+            'file', 'file_url', 'original_filename', 'file_size', 'file_size_mb', 'file_type', 'file_extension',
             'related_property', 'property_title', 'related_transaction', 'transaction_property',
             'related_user', 'uploaded_by', 'uploaded_by_name', 'uploaded_at', 'updated_at',
             'is_public', 'is_archived', 'tags'
         ]
-        read_only_fields = ['id', 'file_size', 'file_type', 'uploaded_at', 'updated_at']
+        read_only_fields = ['id', 'original_filename', 'file_size', 'file_type', 'uploaded_at', 'updated_at']
     
     def get_file_url(self, obj):
         """Get the full URL for the file"""
@@ -35,6 +36,18 @@ class DocumentSerializer(serializers.ModelSerializer):
         return None
 
 
+def check_quota(request, size, replacing=None):
+    """Raise a ValidationError if storing ``size`` bytes would exceed the user's quota"""
+    if request and request.user.is_authenticated:
+        usage = StorageUsage.for_user(request.user.id)
+        replaced = (replacing.file_size or 0) if replacing else 0
+        remaining = usage.remaining
+        if remaining is not None and size - replaced > remaining:
+            raise serializers.ValidationError(
+                f'Storage quota exceeded: {round(remaining / (1024 * 1024), 2)} MB remaining'
+            )
+
+
 class DocumentUploadSerializer(serializers.ModelSerializer):
     """Simplified serializer for document upload"""
     
@@ -43,6 +56,11 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'document_type', 'category', 'file',
                   'related_property', 'related_transaction', 'related_user', 'tags', 'is_public']
         
+    def validate_file(self, value):
+        """Reject uploads that would exceed the uploader's storage quota"""
+        check_quota(self.context.get('request'), value.size, self.instance)
+        return value
+
     def create(self, validated_data):
         # Set uploaded_by from request user
         request = self.context.get('request')
@@ -50,3 +68,46 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
             validated_data['uploaded_by'] = request.user
         return super().create(validated_data)
 
+
+class StorageUsageSerializer(serializers.ModelSerializer):
+    """Serializer for a user's document storage counters"""
+
+    used_mb = serializers.SerializerMethodField()
+    limit = serializers.IntegerField(read_only=True)
+    remaining = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StorageUsage
+        fields = ['used_bytes', 'used_mb', 'document_count', 'limit', 'remaining', 'updated_at']
+
+    def get_used_mb(self, obj):
+        return round(obj.used_bytes / (1024 * 1024), 2)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for starting and resuming chunked uploads"""
+
+    size = serializers.IntegerField(source='total_size', min_value=1, max_value=MAX_UPLOAD_SIZE)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'content_type', 'chunk_size', 'created_at', 'expires_at']
+        read_only_fields = ['id', 'offset', 'content_type', 'created_at', 'expires_at']
+
+    def get_chunk_size(self, obj):
+        return RECOMMENDED_CHUNK_SIZE
+
+    def validate(self, data):
+        """Check the Document fields now so the upload is not wasted"""
+        request = self.context.get('request')
+        check_quota(request, data['total_size'])
+        metadata = {
+            field: value for field, value in self.initial_data.items()
+            if field in DocumentUploadSerializer.Meta.fields and field not in ['id', 'file']
+        }
+        document = DocumentUploadSerializer(data=metadata, context=self.context)
+        document.fields.pop('file')
+        document.is_valid(raise_exception=True)
+        data['metadata'] = metadata
+        return data
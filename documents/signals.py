@@ -0,0 +1,100 @@
+"""
+Django signals keeping the document access table and per-user storage
+counters in sync with documents and the agents of related properties and
+transactions
+"""
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from messaging.models import Message
+from properties.models import Property, PropertyDocument, Transaction
+from .models import Document, DocumentAccess, StorageUsage, StoredBlob
+
+# File fields kept in content-addressed storage, per model
+BLOB_FIELDS = {
+    Document: 'file',
+    PropertyDocument: 'file',
+    Message: 'attachment',
+}
+
+
+@receiver(post_init, sender=Document)
+def remember_storage_owner(sender, instance, **kwargs):
+    # Lets post_save move only the difference in storage usage
+    instance._loaded_storage = (
+        instance.__dict__.get('uploaded_by_id'), instance.__dict__.get('file_size') or 0
+    )
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, created, **kwargs):
+    DocumentAccess.sync([instance.pk])
+
+    owner_id, size = instance.uploaded_by_id, instance.file_size or 0
+    previous_owner_id, previous_size = (None, 0) if created else instance._loaded_storage
+    if owner_id == previous_owner_id:
+        StorageUsage.adjust(owner_id, size - previous_size, 0)
+    else:
+        StorageUsage.adjust(previous_owner_id, -previous_size, -1)
+        StorageUsage.adjust(owner_id, size, 1)
+    instance._loaded_storage = (owner_id, size)
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    previous_owner_id, previous_size = instance._loaded_storage
+    StorageUsage.adjust(previous_owner_id, -previous_size, -1)
+
+
+@receiver(post_init, sender=Property)
+@receiver(post_init, sender=Transaction)
+def remember_agent(sender, instance, **kwargs):
+    # Lets post_save tell whether the agent changed without another query
+    instance._loaded_agent_id = instance.__dict__.get('agent_id')
+
+
+@receiver(post_save, sender=Property)
+def property_saved(sender, instance, created, **kwargs):
+    if not created and instance.agent_id != instance._loaded_agent_id:
+        DocumentAccess.sync(
+            Document.objects.filter(related_property=instance).values_list('id', flat=True)
+        )
+    instance._loaded_agent_id = instance.agent_id
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, **kwargs):
+    if not created and instance.agent_id != instance._loaded_agent_id:
+        DocumentAccess.sync(
+            Document.objects.filter(related_transaction=instance).values_list('id', flat=True)
+        )
+    instance._loaded_agent_id = instance.agent_id
+
+
+def _file_name(instance, field_name):
+    value = instance.__dict__.get(field_name)
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=Document)
+@receiver(post_init, sender=PropertyDocument)
+@receiver(post_init, sender=Message)
+def remember_blob(sender, instance, **kwargs):
+    instance._loaded_blob = _file_name(instance, BLOB_FIELDS[sender])
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_save, sender=PropertyDocument)
+@receiver(post_save, sender=Message)
+def blob_reference_saved(sender, instance, **kwargs):
+    name = _file_name(instance, BLOB_FIELDS[sender])
+    if name != instance._loaded_blob:
+        StoredBlob.retain(name)
+        StoredBlob.release(instance._loaded_blob)
+        instance._loaded_blob = name
+
+
+@receiver(post_delete, sender=Document)
+@receiver(post_delete, sender=PropertyDocument)
+@receiver(post_delete, sender=Message)
+def blob_reference_deleted(sender, instance, **kwargs):
+    StoredBlob.release(instance._loaded_blob)
@@ -0,0 +1,60 @@
+"""
+Content-addressed file storage.
+
+Files are stored once under ``blobs/<aa>/<bb>/<sha256><ext>`` whatever name
+or folder they were uploaded with, so identical contracts and IDs attached
+to several documents, property documents or messages share one file.
+References are counted in ``documents.StoredBlob`` and the file is removed
+when the last one goes away (or by ``collect_blobs``).
+"""
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'blobs/'
+
+
+def blob_name(checksum, extension):
+    return f'{BLOB_PREFIX}{checksum[:2]}/{checksum[2:4]}/{checksum}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files by their SHA-256; saving content that
+    is already stored only returns the existing name
+    """
+
+    def __init__(self, **kwargs):
+        # Concurrent writers of the same blob write the same bytes
+        # (allow_overwrite needs Django 5.1)
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def _save(self, name, content):
+        from .models import StoredBlob, file_checksum
+
+        checksum = getattr(content, 'checksum', None) or file_checksum(content)
+        name = blob_name(checksum, os.path.splitext(name)[1].lower())
+        # Claimed before looking, so the file is not collected under us
+        StoredBlob.claim(name, content.size)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+    def blob_names(self):
+        """Names of every stored blob"""
+        root = self.path(BLOB_PREFIX)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                yield os.path.relpath(os.path.join(directory, filename), self.location).replace(os.sep, '/')
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_storage():
+    return blob_storage
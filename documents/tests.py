@@ -1,3 +1,520 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from django.db.models import Q
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from activity_log.models import ActivityLog
+from properties.models import Property, Transaction
+from users.models import User
+from .downloads import _disposition, file_response
+from .models import Document, DocumentAccess, StorageUsage, StoredBlob, UploadSession
+from .storage import blob_storage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'chunks')
+
+
+def legacy_visible(user):
+    """The join-based permission filter the access table replaces"""
+    if user.is_staff:
+        return Document.objects.all()
+    return Document.objects.filter(
+        Q(uploaded_by=user) |
+        Q(is_public=True) |
+        Q(related_property__agent=user) |
+        Q(related_transaction__agent=user)
+    ).distinct()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DocumentAccessTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.uploader = User.objects.create_user(
+            email='uploader@example.com', username='uploader', password='pass', role='client'
+        )
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.other_agent = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='agent'
+        )
+        self.stranger = User.objects.create_user(
+            email='stranger@example.com', username='stranger', password='pass', role='client'
+        )
+        self.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='pass', role='admin', is_staff=True
+        )
+        self.users = [self.uploader, self.agent, self.other_agent, self.stranger, self.staff]
+
+        self.property = Property.objects.create(
+            title='House', description='', property_type='residential',
+            address='1 Main St', city='Douala', state='Littoral', price=100000, agent=self.agent
+        )
+        self.transaction = Transaction.objects.create(
+            property=self.property, buyer=self.uploader, agent=self.other_agent, sale_price=100000
+        )
+        self.property_document = self._document('Deed', related_property=self.property)
+        self.transaction_document = self._document('Receipt', related_transaction=self.transaction)
+        self.private_document = self._document('ID card')
+        self.public_document = self._document('Brochure', is_public=True, uploaded_by=self.agent)
+
+    def _document(self, title, uploaded_by=None, **kwargs):
+        return Document.objects.create(
+            title=title, document_type='other', category='',
+            file=SimpleUploadedFile(f'{title}.pdf', b'%PDF-1.4 test'),
+            uploaded_by=uploaded_by or self.uploader, **kwargs
+        )
+
+    def assertSameVisibility(self):
+        for user in self.users:
+            self.assertEqual(
+                set(Document.objects.visible_to(user).values_list('id', flat=True)),
+                set(legacy_visible(user).values_list('id', flat=True)),
+                f'visibility differs for {user.email}'
+            )
+
+    def test_matches_legacy_filter(self):
+        self.assertSameVisibility()
+        self.assertEqual(
+            set(Document.objects.visible_to(self.stranger)), {self.public_document}
+        )
+
+    def test_property_agent_change(self):
+        self.property.agent = self.other_agent
+        self.property.save()
+
+        self.assertSameVisibility()
+        self.assertNotIn(self.property_document, Document.objects.visible_to(self.agent))
+
+    def test_transaction_agent_change(self):
+        self.transaction.agent = None
+        self.transaction.save()
+
+        self.assertSameVisibility()
+        self.assertNotIn(self.transaction_document, Document.objects.visible_to(self.other_agent))
+
+    def test_document_relinked_and_published(self):
+        self.private_document.related_property = self.property
+        self.private_document.save()
+        self.transaction_document.is_public = True
+        self.transaction_document.uploaded_by = self.agent
+        self.transaction_document.save()
+
+        self.assertSameVisibility()
+
+    def test_agent_deleted(self):
+        self.agent.delete()
+        self.users.remove(self.agent)
+
+        self.assertSameVisibility()
+        self.assertFalse(DocumentAccess.objects.filter(reason='property_agent').exists())
+
+    def test_permission_filter_avoids_joins(self):
+        sql = str(Document.objects.visible_to(self.agent).query)
+
+        self.assertNotIn('DISTINCT', sql)
+        self.assertNotIn('properties', sql)
+        self.assertNotIn('transactions', sql)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SECURE_SSL_REDIRECT=False)
+class StorageUsageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='agent'
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _document(self, content, uploaded_by=None):
+        return Document.objects.create(
+            title='Doc', document_type='other', category='',
+            file=SimpleUploadedFile('doc.pdf', content), uploaded_by=uploaded_by or self.user
+        )
+
+    def usage(self, user=None):
+        usage = StorageUsage.for_user((user or self.user).id)
+        return usage.used_bytes, usage.document_count
+
+    def test_counters_follow_uploads_and_deletes(self):
+        first = self._document(b'x' * 100)
+        self._document(b'x' * 50)
+        self.assertEqual(self.usage(), (150, 2))
+
+        first.delete()
+        self.assertEqual(self.usage(), (50, 1))
+
+    def test_counters_follow_owner_and_size_changes(self):
+        document = self._document(b'x' * 100)
+
+        document.file = SimpleUploadedFile('bigger.pdf', b'x' * 300)
+        document.save()
+        self.assertEqual(self.usage(), (300, 1))
+
+        document.uploaded_by = self.other
+        document.save()
+        self.assertEqual(self.usage(), (0, 0))
+        self.assertEqual(self.usage(self.other), (300, 1))
+
+    def test_upload_over_quota_is_refused(self):
+        self._document(b'x' * 80)
+        StorageUsage.objects.filter(user=self.user).update(quota_bytes=100)
+
+        response = self.api.post('/api/documents/', {
+            'title': 'Too big', 'document_type': 'other', 'category': 'general',
+            'file': SimpleUploadedFile('big.pdf', b'x' * 50),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quota', str(response.data))
+
+        response = self.api.post('/api/documents/', {
+            'title': 'Fits', 'document_type': 'other', 'category': 'general',
+            'file': SimpleUploadedFile('small.pdf', b'x' * 20),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.api.get('/api/documents/quota/').data['used_bytes'], 100)
+
+    @override_settings(DOCUMENT_STORAGE_QUOTA=1000)
+    def test_default_quota_and_override(self):
+        usage = StorageUsage.for_user(self.user.id)
+        self.assertEqual(usage.limit, 1000)
+        usage.quota_bytes = 0
+        self.assertIsNone(usage.limit)
+        self.assertIsNone(usage.remaining)
+
+    def test_storage_by_user_is_for_staff_only(self):
+        self._document(b'x' * 10)
+        storage = self.api.get('/api/documents/stats/').data['storage']
+        self.assertNotIn('by_user', storage)
+
+        staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='pass', role='admin', is_staff=True
+        )
+        self.api.force_authenticate(staff)
+        storage = self.api.get('/api/documents/stats/').data['storage']
+        self.assertEqual([row['id'] for row in storage['by_user']], [self.user.id])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHUNKED_UPLOAD_DIR=UPLOAD_DIR, SECURE_SSL_REDIRECT=False)
+class ChunkedUploadTests(TestCase):
+    CONTENT = b'%PDF-1.4 chunked upload test'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='agent'
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        response = self.api.post('/api/documents/uploads/', {
+            'filename': 'deed.pdf', 'size': len(self.CONTENT),
+            'title': 'Deed', 'document_type': 'other', 'category': 'general',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/documents/uploads/{response.data['id']}/"
+
+    def put_chunk(self, start, end):
+        return self.api.put(
+            self.url, self.CONTENT[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.CONTENT)}'
+        )
+
+    def complete(self, **body):
+        return self.api.post(f'{self.url}complete/', body, format='json')
+
+    def test_chunks_in_order_complete_into_document(self):
+        self.assertEqual(self.put_chunk(0, 9).data['offset'], 10)
+        self.assertEqual(self.put_chunk(10, len(self.CONTENT) - 1).data['offset'], len(self.CONTENT))
+        partial_path = UploadSession.objects.get().partial_path
+
+        response = self.complete(sha256=hashlib.sha256(self.CONTENT).hexdigest())
+
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(pk=response.data['id'])
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.CONTENT)
+        self.assertEqual(document.file_type, 'application/pdf')
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(partial_path))
+
+    def test_out_of_order_chunk_is_refused_with_offset(self):
+        self.put_chunk(0, 9)
+
+        response = self.put_chunk(15, 20)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 10)
+
+    def test_duplicate_chunk_leaves_offset_alone(self):
+        self.put_chunk(0, 9)
+
+        response = self.put_chunk(0, 9)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.api.get(self.url).data['offset'], 10)
+
+    def test_complete_with_missing_chunks_is_refused(self):
+        self.put_chunk(0, 9)
+
+        response = self.complete()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 10)
+        self.assertFalse(Document.objects.exists())
+
+    def test_checksum_mismatch_discards_upload(self):
+        self.put_chunk(0, len(self.CONTENT) - 1)
+
+        response = self.complete(sha256='0' * 64)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Document.objects.exists())
+
+    def test_purge_removes_only_expired_uploads(self):
+        self.put_chunk(0, 9)
+        expired = UploadSession.objects.get()
+        live = UploadSession.objects.create(user=self.user, filename='live.pdf', total_size=10)
+        UploadSession.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(os.path.exists(expired.partial_path))
+
+        call_command('purge_upload_sessions', stdout=StringIO())
+
+        self.assertEqual(list(UploadSession.objects.values_list('pk', flat=True)), [live.pk])
+        self.assertFalse(os.path.exists(expired.partial_path))
+        self.assertEqual(self.api.get(self.url).status_code, 404)
+
+
+class StoredBlobTests(TestCase):
+    def setUp(self):
+        # Files of other tests outlive their rolled-back rows: orphans here
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='agent'
+        )
+
+    def _document(self, content, title='Contract'):
+        return Document.objects.create(
+            title=title, document_type='other', category='general',
+            file=SimpleUploadedFile(f'{title}.pdf', content), uploaded_by=self.user
+        )
+
+    def age_claims(self):
+        StoredBlob.objects.update(claimed_at=timezone.now() - StoredBlob.CLAIM_GRACE - timedelta(seconds=1))
+
+    def test_identical_files_share_one_blob(self):
+        first = self._document(b'%PDF same contract')
+        second = self._document(b'%PDF same contract', title='Copy')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith('blobs/'))
+        self.assertEqual(StoredBlob.objects.get(name=first.file.name).ref_count, 2)
+
+    def test_last_release_collects_the_file(self):
+        first = self._document(b'%PDF release me')
+        second = self._document(b'%PDF release me', title='Copy')
+        name = first.file.name
+        self.age_claims()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(blob_storage.exists(name))
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(blob_storage.exists(name))
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+
+    def test_recent_claim_keeps_unreferenced_file(self):
+        document = self._document(b'%PDF claimed')
+        name = document.file.name
+        self.age_claims()
+        Document.objects.filter(pk=document.pk).delete()
+        StoredBlob.objects.filter(name=name).update(ref_count=0)
+
+        # A save finding the file on disk claims it before skipping the write
+        blob_storage.save('again.pdf', ContentFile(b'%PDF claimed'))
+
+        self.assertFalse(StoredBlob.collect(name))
+        self.assertTrue(blob_storage.exists(name))
+
+    def test_save_after_collect_writes_the_file_again(self):
+        document = self._document(b'%PDF collected')
+        name = document.file.name
+        self.age_claims()
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertFalse(blob_storage.exists(name))
+
+        again = self._document(b'%PDF collected', title='Again')
+
+        self.assertEqual(again.file.name, name)
+        self.assertTrue(blob_storage.exists(name))
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+
+    def test_collect_unreferenced_removes_orphans(self):
+        kept = self._document(b'%PDF kept')
+        # Claimed and written, but the saving transaction never counted it
+        orphan_row = blob_storage.save('rolled-back.pdf', ContentFile(b'%PDF rolled back'))
+        # Written by a save whose claim was rolled back with it
+        orphan_file = blob_storage.save('no-row.pdf', ContentFile(b'%PDF no row'))
+        StoredBlob.objects.filter(name=orphan_file).delete()
+
+        self.assertEqual(StoredBlob.collect_unreferenced(), 0)
+
+        later = timezone.now() + StoredBlob.CLAIM_GRACE + timedelta(minutes=1)
+        self.assertEqual(StoredBlob.collect_unreferenced(now=later), 2)
+        self.assertFalse(blob_storage.exists(orphan_row))
+        self.assertFalse(blob_storage.exists(orphan_file))
+        self.assertTrue(blob_storage.exists(kept.file.name))
+        self.assertEqual(list(StoredBlob.objects.values_list('name', flat=True)), [kept.file.name])
+
+    def test_deduplicate_files_moves_legacy_uploads(self):
+        documents = [self._document(b'placeholder', title=f'Legacy {i}') for i in range(2)]
+        for i, document in enumerate(documents):
+            legacy_name = default_storage.save(f'documents/legacy-{i}.pdf', ContentFile(b'%PDF legacy'))
+            Document.objects.filter(pk=document.pk).update(file=legacy_name)
+
+        output = StringIO()
+        call_command('deduplicate_files', '--dry-run', stdout=output)
+        self.assertIn('2 file(s) would be moved', output.getvalue())
+
+        call_command('deduplicate_files', stdout=StringIO())
+
+        names = set(Document.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(name.startswith('blobs/'))
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 2)
+        self.assertFalse(default_storage.exists('documents/legacy-0.pdf'))
+        self.assertFalse(default_storage.exists('documents/legacy-1.pdf'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SECURE_SSL_REDIRECT=False)
+class DownloadTests(TestCase):
+    CONTENT = b'%PDF-1.4 0123456789'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='agent'
+        )
+        self.document = Document.objects.create(
+            title='Deed', document_type='other', category='general',
+            file=SimpleUploadedFile('deed.pdf', self.CONTENT), uploaded_by=self.user
+        )
+        self.url = f'/api/documents/{self.document.id}/download/'
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def get(self, **headers):
+        response = self.api.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.document.etag)
+        self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_byte_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 2-5/{len(self.CONTENT)}')
+        self.assertEqual(self.body(response), self.CONTENT[2:6])
+
+        response = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual(self.body(response), self.CONTENT[-3:])
+
+        response = self.get(HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.CONTENT)}')
+
+    def test_if_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=self.document.etag)
+        self.assertEqual(response.status_code, 206)
+
+        # The file changed since the client's partial copy: send all of it
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=f'W/{self.document.etag}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        response = self.get(HTTP_IF_NONE_MATCH=self.document.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_transfers_are_logged(self):
+        self.get(HTTP_IF_NONE_MATCH=self.document.etag)
+        self.get(HTTP_RANGE='bytes=100-')
+        self.get(HTTP_RANGE='bytes=5-')
+        self.assertFalse(ActivityLog.objects.filter(action='download').exists())
+
+        self.get(HTTP_RANGE='bytes=0-5')
+        self.get()
+        self.assertEqual(ActivityLog.objects.filter(action='download').count(), 2)
+
+    def test_asgi_download_streams_asynchronously(self):
+        async def body(response):
+            return b''.join([chunk async for chunk in response])
+
+        request = AsyncRequestFactory().get(self.url)
+        response = file_response(request, self.document.file, 'deed.pdf', etag=self.document.etag)
+        self.addCleanup(response.close)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(len(self.CONTENT)))
+        self.assertEqual(async_to_sync(body)(response), self.CONTENT)
+
+        request = AsyncRequestFactory().get(self.url, headers={'Range': 'bytes=2-5'})
+        response = file_response(request, self.document.file, 'deed.pdf', etag=self.document.etag)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(async_to_sync(body)(response), self.CONTENT[2:6])
+
+    @override_settings(FILE_DOWNLOAD_BACKEND='x-accel-redirect', FILE_DOWNLOAD_ACCEL_PREFIX='/protected/')
+    def test_x_accel_redirect(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertFalse(response.has_header('Content-Type'))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="deed.pdf"')
+
+    def test_disposition_escapes_names(self):
+        self.assertEqual(
+            _disposition('a "quoted" \\ name.pdf', True),
+            'attachment; filename="a \\"quoted\\" \\\\ name.pdf"'
+        )
+        self.assertEqual(
+            _disposition('résumé.pdf', False),
+            "inline; filename=\"r_sum_.pdf\"; filename*=utf-8''r%C3%A9sum%C3%A9.pdf"
+        )
@@ -0,0 +1,158 @@
+"""
+Chunked, resumable document uploads.
+
+Protocol:
+    1. POST   uploads/                 Document fields plus ``filename`` and ``size``
+    2. PUT    uploads/<id>/            raw chunk with ``Content-Range: bytes start-end/size``
+    3. GET    uploads/<id>/            current offset, to resume after a dropped connection
+    4. POST   uploads/<id>/complete/   turn the received bytes into a Document
+
+Chunks are copied from the request stream into a partial file on disk in
+small blocks, and the SHA-256 digest and MIME type are computed on the way,
+so memory per upload stays constant whatever the file size. The ASGI server
+receives the chunk before the view runs, so slow clients never hold a
+worker thread.
+"""
+import hashlib
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from .models import mime_type_for
+
+BLOCK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+RECOMMENDED_CHUNK_SIZE = 5 * 1024 * 1024
+MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Leading bytes of the formats documents are commonly uploaded in
+_SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+]
+
+
+def detect_content_type(head, filename):
+    """
+    MIME type from the first bytes of a file, falling back to its extension
+    (which also tells apart the Office formats sharing a container)
+    """
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return mime_type_for(filename)
+
+
+def parse_content_range(value):
+    """(start, end, total) from a ``bytes start-end/total`` header, end inclusive"""
+    match = _CONTENT_RANGE.match(value or '')
+    if not match:
+        return None
+    start, end, total = (int(group) for group in match.groups())
+    if end < start or end >= total:
+        return None
+    return start, end, total
+
+
+class _RunningHashes:
+    """
+    SHA-256 state of in-progress uploads handled by this process.
+    Hash objects cannot be stored, so an upload whose chunks reach several
+    processes is hashed from its partial file once it completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes = {}  # upload id -> (offset, sha256)
+
+    def take(self, upload_id, offset):
+        """Hash state continuing at ``offset``, or a fresh one at offset 0"""
+        with self._lock:
+            state = self._hashes.pop(upload_id, None)
+        if state and state[0] == offset:
+            return state[1]
+        return hashlib.sha256() if offset == 0 else None
+
+    def put(self, upload_id, offset, digest):
+        with self._lock:
+            self._hashes[upload_id] = (offset, digest)
+
+    def discard(self, upload_id):
+        with self._lock:
+            self._hashes.pop(upload_id, None)
+
+
+running_hashes = _RunningHashes()
+
+
+def write_chunk(session, stream, start, length):
+    """
+    Copy up to ``length`` bytes from ``stream`` into the session's partial
+    file at ``start``; returns the number of bytes written, which is less
+    than ``length`` when the client went away mid-chunk
+    """
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    upload_id = str(session.id)
+    digest = running_hashes.take(upload_id, start)
+    written = 0
+
+    mode = 'r+b' if os.path.exists(session.partial_path) else 'w+b'
+    with open(session.partial_path, mode) as partial:
+        # Drop anything past the offset left behind by an interrupted chunk
+        partial.seek(start)
+        partial.truncate()
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            if start == 0 and written == 0:
+                session.content_type = detect_content_type(block, session.filename)
+            partial.write(block)
+            if digest is not None:
+                digest.update(block)
+            written += len(block)
+
+    if digest is not None:
+        running_hashes.put(upload_id, start + written, digest)
+    return written
+
+
+class CompletedUpload(UploadedFile):
+    """
+    A fully received partial file. File system storage moves it into place
+    instead of copying it, other storages stream it in chunks.
+    """
+
+    def __init__(self, session, checksum):
+        super().__init__(
+            open(session.partial_path, 'rb'), session.filename,
+            session.content_type, session.total_size
+        )
+        self.path = session.partial_path
+        self.detected_type = session.content_type
+        self.checksum = checksum
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def complete_upload(session):
+    """The received file with its checksum, hashing it now if this process lacks the running hash"""
+    digest = running_hashes.take(str(session.id), session.total_size)
+    if digest is None:
+        digest = hashlib.sha256()
+        with open(session.partial_path, 'rb') as partial:
+            for block in iter(lambda: partial.read(BLOCK_SIZE), b''):
+                digest.update(block)
+    return CompletedUpload(session, digest.hexdigest())
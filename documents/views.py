@@ -1,20 +1,44 @@
-from rest_framework import viewsets, filters, status
+from rest_framework import viewsets, filters, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse, Http404
-from django.db import models
-from .models import Document
-from .serializers import DocumentSerializer, DocumentUploadSerializer
+from django.http import Http404
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import Document, StorageUsage, UploadSession
+from .serializers import (
+    DocumentSerializer,
+    DocumentUploadSerializer,
+    StorageUsageSerializer,
+    UploadSessionSerializer
+)
+from .downloads import file_response, parse_range
+from .uploads import MAX_CHUNK_SIZE, parse_content_range, write_chunk, complete_upload, running_hashes
 from activity_log.models import ActivityLog
+from real_estate_platform.conditional import ConditionalGetMixin
 
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class ClientIPMixin:
+
+    def get_client_ip(self):
+        """Get client IP address"""
+        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
+        if x_forwarded_for:
+            ip = x_forwarded_for.split(',')[0]
+        else:
+            ip = self.request.META.get('REMOTE_ADDR')
+        return ip
+
+
+class DocumentViewSet(ConditionalGetMixin, ClientIPMixin, viewsets.ModelViewSet):
     """ViewSet for Document model with file upload support"""
 
     permission_classes = [IsAuthenticated]
+    # Access follows the agents of related properties and transactions
+    cache_tags = ('properties', 'transactions', 'users')
     parser_classes = (MultiPartParser, FormParser)
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'document_type', 'related_property', 'related_transaction', 'related_user', 'is_archived']
@@ -24,19 +48,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter documents based on user permissions"""
-        user = self.request.user
-        queryset = Document.objects.all()
-
-        # Non-admin users can only see their own documents or public ones
-        if not user.is_staff:
-            queryset = queryset.filter(
-                models.Q(uploaded_by=user) |
-                models.Q(is_public=True) |
-                models.Q(related_property__agent=user) |
-                models.Q(related_transaction__agent=user)
-            ).distinct()
-
-        return queryset
+        # Non-admin users only see public documents and those granted to them
+        return Document.objects.visible_to(self.request.user)
 
     def get_serializer_class(self):
         """Use different serializers for different actions"""
@@ -79,11 +92,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
-        """Download a document file"""
+        """Download a document file, with byte ranges and conditional requests"""
         document = self.get_object()
+        if not document.file or not document.file.storage.exists(document.file.name):
+            raise Http404("File not found")
 
-        try:
-            # Log download activity
+        response = file_response(
+            request, document.file, document.download_name,
+            content_type=document.file_type or None,
+            etag=document.etag, last_modified=document.updated_at,
+        )
+
+        # Revalidations and unsatisfiable ranges transfer nothing; resumed or
+        # seeking downloads send many range requests, so log only the first
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), document.file_size or 0)
+        if response.status_code not in (304, 416) and (byte_range is None or byte_range[0] == 0):
             ActivityLog.log_activity(
                 user=request.user,
                 action='download',
@@ -93,41 +116,58 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 ip_address=self.get_client_ip(),
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
             )
-
-            return FileResponse(document.file.open('rb'), as_attachment=True,
-                              filename=document.file.name.split('/')[-1])
-        except Exception as e:
-            raise Http404("File not found")
+        return response
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Get document statistics"""
-        queryset = self.get_queryset()
+        """Get document statistics, aggregated in the database"""
+        queryset = self.get_queryset().order_by()
 
+        totals = queryset.aggregate(total_documents=Count('id'), total_size=Sum('file_size'))
         stats = {
-            'total_documents': queryset.count(),
-            'total_size_mb': sum(doc.file_size_mb for doc in queryset),
+            'total_documents': totals['total_documents'],
+            'total_size_mb': _megabytes(totals['total_size']),
             'by_category': {},
             'by_type': {},
+            'storage': {
+                'by_property': _storage_breakdown(queryset, 'related_property', 'related_property__title'),
+                'by_transaction': _storage_breakdown(
+                    queryset, 'related_transaction', 'related_transaction__property__title'
+                ),
+            },
+            'quota': StorageUsageSerializer(StorageUsage.for_user(request.user.id)).data,
             'recent_uploads': DocumentSerializer(
-                queryset[:5], many=True, context={'request': request}
+                self.get_queryset().select_related(
+                    'uploaded_by', 'related_property', 'related_transaction__property'
+                )[:5],
+                many=True, context={'request': request}
             ).data
         }
 
-        # Count by category
-        for category in Document.CATEGORY_CHOICES:
-            count = queryset.filter(category=category[0]).count()
-            if count > 0:
-                stats['by_category'][category[1]] = count
+        # Other users' names and usage are for staff only
+        if request.user.is_staff:
+            stats['storage']['by_user'] = _storage_breakdown(
+                queryset, 'uploaded_by', 'uploaded_by__first_name', 'uploaded_by__last_name',
+                'uploaded_by__email'
+            )
 
-        # Count by type
-        for doc_type in Document.DOCUMENT_TYPE_CHOICES:
-            count = queryset.filter(document_type=doc_type[0]).count()
-            if count > 0:
-                stats['by_type'][doc_type[1]] = count
+        # Count by category and type in one grouped query
+        categories = dict(Document.CATEGORY_CHOICES)
+        document_types = dict(Document.DOCUMENT_TYPE_CHOICES)
+        groups = queryset.values('category', 'document_type').annotate(count=Count('id'))
+        for group in groups:
+            category = categories.get(group['category'], group['category'])
+            document_type = document_types.get(group['document_type'], group['document_type'])
+            stats['by_category'][category] = stats['by_category'].get(category, 0) + group['count']
+            stats['by_type'][document_type] = stats['by_type'].get(document_type, 0) + group['count']
 
         return Response(stats)
 
+    @action(detail=False, methods=['get'])
+    def quota(self, request):
+        """Get the current user's storage usage and quota"""
+        return Response(StorageUsageSerializer(StorageUsage.for_user(request.user.id)).data)
+
     @action(detail=True, methods=['post'])
     def archive(self, request, pk=None):
         """Archive a document"""
@@ -145,11 +185,133 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
         return Response({'status': 'archived'})
 
-    def get_client_ip(self):
-        """Get client IP address"""
-        x_forwarded_for = self.request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+
+class DocumentUploadViewSet(ClientIPMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                            viewsets.GenericViewSet):
+    """
+    Chunked, resumable document uploads (protocol in documents.uploads):
+    create an upload, PUT its chunks in order, then complete it
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = UploadSessionSerializer
+    lookup_value_regex = '[0-9a-f-]{36}'
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user, expires_at__gt=timezone.now())
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def update(self, request, pk=None):
+        """Receive one chunk (raw body, Content-Range: bytes start-end/size)"""
+        content_range = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'))
+        if content_range is None or request.stream is None:
+            return Response({'error': 'Send the chunk as the body with Content-Range: bytes start-end/size'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = content_range
+        length = end - start + 1
+        if length > MAX_CHUNK_SIZE:
+            return Response({'error': f'Chunks are limited to {MAX_CHUNK_SIZE} bytes'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with transaction.atomic():
+            try:
+                session = self.get_queryset().select_for_update(nowait=True).get(pk=pk)
+            except UploadSession.DoesNotExist:
+                raise Http404('Upload not found')
+            except DatabaseError:
+                return Response({'error': 'Another chunk of this upload is being received'},
+                                status=status.HTTP_409_CONFLICT)
+
+            if total != session.total_size:
+                return Response({'error': 'Content-Range size does not match the upload'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if start != session.offset:
+                # The client resumes from the offset we actually hold
+                return Response({'error': 'Chunk does not start at the current offset', 'offset': session.offset},
+                                status=status.HTTP_409_CONFLICT)
+
+            written = write_chunk(session, request.stream, start, length)
+            session.offset = start + written
+            session.expires_at = timezone.now() + UploadSession.EXPIRY
+            session.save(update_fields=['offset', 'content_type', 'expires_at'])
+
+        return Response(self.get_serializer(session).data)
+
+    def destroy(self, request, pk=None):
+        """Abort an upload"""
+        session = self.get_object()
+        running_hashes.discard(str(session.id))
+        session.discard()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """
+        Turn a fully received upload into a Document
+        Body (optional): sha256 - checksum to verify the received file against
+        """
+        session = self.get_object()
+        if not session.is_complete:
+            return Response({'error': 'Upload is not complete', 'offset': session.offset},
+                            status=status.HTTP_409_CONFLICT)
+
+        upload = complete_upload(session)
+        try:
+            expected = request.data.get('sha256')
+            if expected and expected.lower() != upload.checksum:
+                session.discard()
+                return Response({'error': 'Checksum mismatch, upload discarded'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = DocumentUploadSerializer(
+                data={**session.metadata, 'file': upload}, context={'request': request}
+            )
+            serializer.is_valid(raise_exception=True)
+            document = serializer.save(uploaded_by=request.user)
+        finally:
+            upload.close()
+        session.discard()
+
+        ActivityLog.log_activity(
+            user=request.user,
+            action='upload',
+            description=f'Uploaded document: {document.title}',
+            content_object=document,
+            severity='low',
+            ip_address=self.get_client_ip(),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+
+        return Response(DocumentSerializer(document, context={'request': request}).data,
+                        status=status.HTTP_201_CREATED)
+
+
+STORAGE_BREAKDOWN_LIMIT = 10
+
+
+def _megabytes(size):
+    return round((size or 0) / (1024 * 1024), 2)
+
+
+def _storage_breakdown(queryset, key, *label_fields):
+    """Document count and size per ``key`` (largest first), one grouped query"""
+    rows = queryset.filter(**{f'{key}__isnull': False}).values(key, *label_fields).annotate(
+        count=Count('id'), size=Sum('file_size')
+    ).order_by('-size')[:STORAGE_BREAKDOWN_LIMIT]
+
+    breakdown = []
+    for row in rows:
+        labels = [row[field] for field in label_fields]
+        if key == 'uploaded_by':
+            name = f'{labels[0]} {labels[1]}'.strip() or labels[2]
         else:
-            ip = self.request.META.get('REMOTE_ADDR')
-        return ip
+            name = labels[0]
+        breakdown.append({
+            'id': row[key],
+            'name': name,
+            'count': row['count'],
+            'size_mb': _megabytes(row['size']),
+        })
+    return breakdown
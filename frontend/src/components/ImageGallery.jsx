@@ -62,7 +62,10 @@ const ImageGallery = ({ images, propertyId, onUpdate, editable = false }) => {
               onClick={() => setSelectedImage(image)}
             >
               <img
-                src={image.image}
+                src={image.thumbnail || image.image}
+                srcSet={image.webp_srcset || undefined}
+                sizes="(min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw"
+                loading="lazy"
                 alt={image.caption || 'Property image'}
                 className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
               />
@@ -135,6 +138,8 @@ const ImageGallery = ({ images, propertyId, onUpdate, editable = false }) => {
             {/* Image */}
             <img
               src={selectedImage.image}
+              srcSet={selectedImage.webp_srcset || undefined}
+              sizes="90vw"
               alt={selectedImage.caption || 'Property image'}
               className="max-w-full max-h-[90vh] object-contain rounded-lg"
               onClick={(e) => e.stopPropagation()}
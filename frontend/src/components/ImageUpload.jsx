@@ -84,21 +84,21 @@ const ImageUpload = ({ propertyId, onUploadComplete }) => {
     setUploading(true)
 
     try {
-      // Upload each file
-      for (let i = 0; i < selectedFiles.length; i++) {
-        const formData = new FormData()
-        formData.append('image', selectedFiles[i])
-        formData.append('is_primary', i === 0) // First image is primary
-        formData.append('order', i)
+      // All files in one request; the server stores them in parallel and
+      // appends them to the gallery (the first becomes primary if none is)
+      const formData = new FormData()
+      selectedFiles.forEach((file) => formData.append('images', file))
 
-        await axios.post(`/api/properties/${propertyId}/images/`, formData, {
-          headers: {
-            'Content-Type': 'multipart/form-data',
-          },
-        })
-      }
+      const { data } = await axios.post(`/api/properties/${propertyId}/images/bulk/`, formData, {
+        headers: {
+          'Content-Type': 'multipart/form-data',
+        },
+      })
 
-      showToast.success(`${selectedFiles.length} image(s) uploaded successfully!`)
+      data.results
+        .filter((result) => result.status === 'error')
+        .forEach((result) => showToast.error(`${result.filename}: ${result.errors.join(' ')}`))
+      showToast.success(`${data.created} image(s) uploaded successfully!`)
       
       // Clear selections
       setSelectedFiles([])
@@ -110,7 +110,7 @@ const ImageUpload = ({ propertyId, onUploadComplete }) => {
       }
     } catch (error) {
       console.error('Upload error:', error)
-      showToast.error(error.response?.data?.message || 'Failed to upload images')
+      showToast.error(error.response?.data?.error || error.response?.data?.message || 'Failed to upload images')
     } finally {
       setUploading(false)
     }
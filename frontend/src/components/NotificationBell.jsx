@@ -11,11 +11,49 @@ const NotificationBell = () => {
 
   useEffect(() => {
     fetchUnreadCount();
-    
-    // Poll for new notifications every 30 seconds
-    const interval = setInterval(fetchUnreadCount, 30000);
-    
-    return () => clearInterval(interval);
+
+    // Receive new notifications over Server-Sent Events instead of polling.
+    // EventSource cannot send the access token, so each connection opens
+    // with a single-use ticket; on error reconnect with a fresh one.
+    let source = null;
+    let retryTimer = null;
+    let cancelled = false;
+
+    const connect = async () => {
+      try {
+        const { data } = await axios.post('/api/notifications/stream/ticket/');
+        if (cancelled) return;
+        // The stream is served by the events process, which may have its own host
+        const eventsUrl = import.meta.env.VITE_EVENTS_URL || axios.defaults.baseURL || '';
+        source = new EventSource(
+          `${eventsUrl}/api/notifications/stream/?ticket=${encodeURIComponent(data.ticket)}`
+        );
+        source.addEventListener('notification', (event) => {
+          const notification = JSON.parse(event.data);
+          if (notification.truncated) {
+            // Too large to relay; load it instead
+            fetchUnreadCount();
+            fetchNotifications();
+            return;
+          }
+          setNotifications(prev => [notification, ...prev]);
+          setUnreadCount(prev => prev + 1);
+        });
+        source.onerror = () => {
+          source.close();
+          if (!cancelled) retryTimer = setTimeout(connect, 5000);
+        };
+      } catch (error) {
+        if (!cancelled) retryTimer = setTimeout(connect, 30000);
+      }
+    };
+    connect();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
   }, []);
 
   useEffect(() => {
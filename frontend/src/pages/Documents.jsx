@@ -2,6 +2,7 @@ import { useState, useEffect, useContext } from 'react';
 import axios from 'axios';
 import { AuthContext } from '../context/AuthContext';
 import { toast } from 'react-toastify';
+import { uploadDocument } from '../utils/chunkedUpload';
 import { DocumentIcon, ArrowDownTrayIcon, TrashIcon, FunnelIcon, PlusIcon } from '@heroicons/react/24/outline';
 
 const Documents = () => {
@@ -49,21 +50,19 @@ const Documents = () => {
     e.preventDefault();
     setUploading(true);
 
-    const data = new FormData();
-    data.append('title', formData.title);
-    data.append('description', formData.description);
-    data.append('document_type', formData.document_type);
-    data.append('category', formData.category);
-    data.append('file', formData.file);
-    data.append('is_public', formData.is_public);
+    const fields = {
+      title: formData.title,
+      description: formData.description,
+      document_type: formData.document_type,
+      category: formData.category,
+      is_public: formData.is_public,
+    };
     if (formData.tags.length > 0) {
-      data.append('tags', JSON.stringify(formData.tags));
+      fields.tags = formData.tags;
     }
 
     try {
-      await axios.post('/api/documents/', data, {
-        headers: { 'Content-Type': 'multipart/form-data' }
-      });
+      await uploadDocument(formData.file, fields);
       toast.success('Document uploaded successfully!');
       setShowUploadForm(false);
       setFormData({
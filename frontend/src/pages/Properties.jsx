@@ -3,10 +3,19 @@ import { useNavigate } from 'react-router-dom'
 import axios from 'axios'
 import showToast, { getErrorMessage } from '../utils/toast'
 
+const SORT_ORDERINGS = {
+  newest: '-listing_date',
+  oldest: 'listing_date',
+  price_low: 'price',
+  price_high: '-price',
+}
+
 const Properties = () => {
   const navigate = useNavigate()
   const [properties, setProperties] = useState([])
   const [filteredProperties, setFilteredProperties] = useState([])
+  const [resultCount, setResultCount] = useState(0)
+  const [facets, setFacets] = useState({})
   const [loading, setLoading] = useState(true)
   const [showForm, setShowForm] = useState(false)
   const [showFilters, setShowFilters] = useState(false)
@@ -43,14 +52,15 @@ const Properties = () => {
   }, [])
 
   useEffect(() => {
-    applyFiltersAndSort()
+    // Results and facet counts come from the server; wait for typing to pause
+    const timer = setTimeout(searchProperties, 250)
+    return () => clearTimeout(timer)
   }, [properties, searchTerm, filters, sortBy])
 
   const fetchProperties = async () => {
     try {
       const response = await axios.get('/api/properties/my-properties/')
       setProperties(response.data)
-      setFilteredProperties(response.data)
     } catch (error) {
       console.error('Failed to fetch properties:', error)
       showToast.error(getErrorMessage(error))
@@ -59,64 +69,47 @@ const Properties = () => {
     }
   }
 
-  const applyFiltersAndSort = () => {
-    let filtered = [...properties]
-
-    // Apply search
-    if (searchTerm) {
-      filtered = filtered.filter(property =>
-        property.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        property.address.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        property.city.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        property.state.toLowerCase().includes(searchTerm.toLowerCase())
-      )
-    }
+  const filterParams = () => {
+    const params = {}
+    if (searchTerm) params.q = searchTerm
+    Object.entries(filters).forEach(([name, value]) => {
+      if (value) params[name] = value
+    })
+    return params
+  }
 
-    // Apply filters
-    if (filters.property_type) {
-      filtered = filtered.filter(p => p.property_type === filters.property_type)
-    }
-    if (filters.status) {
-      filtered = filtered.filter(p => p.status === filters.status)
-    }
-    if (filters.city) {
-      filtered = filtered.filter(p => p.city.toLowerCase().includes(filters.city.toLowerCase()))
-    }
-    if (filters.state) {
-      filtered = filtered.filter(p => p.state.toLowerCase().includes(filters.state.toLowerCase()))
-    }
-    if (filters.min_price) {
-      filtered = filtered.filter(p => parseFloat(p.price) >= parseFloat(filters.min_price))
-    }
-    if (filters.max_price) {
-      filtered = filtered.filter(p => parseFloat(p.price) <= parseFloat(filters.max_price))
-    }
-    if (filters.min_bedrooms) {
-      filtered = filtered.filter(p => p.bedrooms >= parseInt(filters.min_bedrooms))
-    }
-    if (filters.min_bathrooms) {
-      filtered = filtered.filter(p => p.bathrooms >= parseFloat(filters.min_bathrooms))
+  const searchProperties = async () => {
+    const params = { mine: 1, page_size: 100, ordering: SORT_ORDERINGS[sortBy], ...filterParams() }
+
+    try {
+      const { data } = await axios.get('/api/properties/search/', { params })
+      setFilteredProperties(data.results)
+      setResultCount(data.count)
+      setFacets(data.facets)
+    } catch (error) {
+      console.error('Failed to search properties:', error)
     }
+  }
 
-    // Apply sorting
-    switch (sortBy) {
-      case 'price_low':
-        filtered.sort((a, b) => parseFloat(a.price) - parseFloat(b.price))
-        break
-      case 'price_high':
-        filtered.sort((a, b) => parseFloat(b.price) - parseFloat(a.price))
-        break
-      case 'newest':
-        filtered.sort((a, b) => new Date(b.listing_date) - new Date(a.listing_date))
-        break
-      case 'oldest':
-        filtered.sort((a, b) => new Date(a.listing_date) - new Date(b.listing_date))
-        break
-      default:
-        break
+  // Notify me of new listings (from any agent) matching the current filters
+  const saveSearch = async () => {
+    const name = window.prompt('Name this search')
+    if (!name) return
+    try {
+      await axios.post('/api/properties/saved-searches/', {
+        name,
+        query: new URLSearchParams(filterParams()).toString(),
+      })
+      showToast.success('Search saved. You will be notified of new matching listings.')
+    } catch (error) {
+      showToast.error(getErrorMessage(error))
     }
+  }
 
-    setFilteredProperties(filtered)
+  // "Residential (12)" for the options of a faceted select
+  const facetLabel = (name, value, label) => {
+    const facet = facets[name]?.find((item) => item.value === value)
+    return facet ? `${label} (${facet.count})` : label
   }
 
   const handleFilterChange = (e) => {
@@ -342,11 +335,11 @@ const Properties = () => {
                   className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
                 >
                   <option value="">All Types</option>
-                  <option value="residential">Residential</option>
-                  <option value="commercial">Commercial</option>
-                  <option value="land">Land</option>
-                  <option value="industrial">Industrial</option>
-                  <option value="mixed">Mixed Use</option>
+                  <option value="residential">{facetLabel('property_type', 'residential', 'Residential')}</option>
+                  <option value="commercial">{facetLabel('property_type', 'commercial', 'Commercial')}</option>
+                  <option value="land">{facetLabel('property_type', 'land', 'Land')}</option>
+                  <option value="industrial">{facetLabel('property_type', 'industrial', 'Industrial')}</option>
+                  <option value="mixed">{facetLabel('property_type', 'mixed', 'Mixed Use')}</option>
                 </select>
               </div>
 
@@ -359,11 +352,11 @@ const Properties = () => {
                   className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500"
                 >
                   <option value="">All Status</option>
-                  <option value="available">Available</option>
-                  <option value="pending">Pending</option>
-                  <option value="sold">Sold</option>
-                  <option value="rented">Rented</option>
-                  <option value="off_market">Off Market</option>
+                  <option value="available">{facetLabel('status', 'available', 'Available')}</option>
+                  <option value="pending">{facetLabel('status', 'pending', 'Pending')}</option>
+                  <option value="sold">{facetLabel('status', 'sold', 'Sold')}</option>
+                  <option value="rented">{facetLabel('status', 'rented', 'Rented')}</option>
+                  <option value="off_market">{facetLabel('status', 'off_market', 'Off Market')}</option>
                 </select>
               </div>
 
@@ -441,7 +434,13 @@ const Properties = () => {
               </div>
             </div>
 
-            <div className="flex justify-end mt-4">
+            <div className="flex justify-end mt-4 space-x-2">
+              <button
+                onClick={saveSearch}
+                className="px-4 py-2 bg-blue-600 text-white rounded-lg hover:bg-blue-700 font-medium"
+              >
+                🔔 Save Search
+              </button>
               <button
                 onClick={clearFilters}
                 className="px-4 py-2 bg-gray-200 text-gray-700 rounded-lg hover:bg-gray-300 font-medium"
@@ -454,7 +453,7 @@ const Properties = () => {
 
         {/* Results Count */}
         <div className="mt-4 text-sm text-gray-600">
-          Showing <span className="font-semibold text-gray-900">{filteredProperties.length}</span> of <span className="font-semibold text-gray-900">{properties.length}</span> properties
+          Showing <span className="font-semibold text-gray-900">{resultCount}</span> of <span className="font-semibold text-gray-900">{properties.length}</span> properties
         </div>
       </div>
 
@@ -15,11 +15,23 @@ const PropertyDetail = () => {
   const [loading, setLoading] = useState(true)
   const [currentImageIndex, setCurrentImageIndex] = useState(0)
   const [showImageUpload, setShowImageUpload] = useState(false)
+  const [similar, setSimilar] = useState([])
+  const [matchingClients, setMatchingClients] = useState([])
 
   useEffect(() => {
+    setCurrentImageIndex(0)
     fetchPropertyDetail()
+    fetchSimilar()
   }, [id])
 
+  const canManage = (listing) => user && (user.id === listing.agent || user.role === 'admin')
+
+  useEffect(() => {
+    if (property && canManage(property)) {
+      fetchMatchingClients()
+    }
+  }, [property?.id])
+
   const fetchPropertyDetail = async () => {
     try {
       const response = await axios.get(`/api/properties/${id}/`)
@@ -34,6 +46,25 @@ const PropertyDetail = () => {
     }
   }
 
+  const fetchSimilar = async () => {
+    try {
+      const response = await axios.get(`/api/properties/${id}/similar/`)
+      setSimilar(response.data)
+    } catch (error) {
+      // Recommendations are optional; the page works without them
+      setSimilar([])
+    }
+  }
+
+  const fetchMatchingClients = async () => {
+    try {
+      const response = await axios.get(`/api/properties/${id}/matching-clients/`, { params: { limit: 10 } })
+      setMatchingClients(response.data)
+    } catch (error) {
+      setMatchingClients([])
+    }
+  }
+
   const formatPrice = (price) => {
     return new Intl.NumberFormat('en-US', {
       style: 'currency',
@@ -174,6 +205,8 @@ const PropertyDetail = () => {
                 <>
                   <img
                     src={property.images[currentImageIndex].image}
+                    srcSet={property.images[currentImageIndex].webp_srcset || undefined}
+                    sizes="(min-width: 1024px) 66vw, 100vw"
                     alt={property.images[currentImageIndex].caption || property.title}
                     className="w-full h-96 object-cover"
                   />
@@ -225,7 +258,8 @@ const PropertyDetail = () => {
                     }`}
                   >
                     <img
-                      src={image.image}
+                      src={image.thumbnail || image.image}
+                      loading="lazy"
                       alt={image.caption || `Image ${index + 1}`}
                       className="w-full h-full object-cover"
                     />
@@ -244,7 +278,7 @@ const PropertyDetail = () => {
           </div>
 
           {/* Image Management (only for property owner/agent) */}
-          {user && (user.id === property.agent || user.role === 'admin') && (
+          {canManage(property) && (
             <div className="bg-white shadow-xl rounded-2xl p-6">
               <div className="flex justify-between items-center mb-4">
                 <h2 className="text-2xl font-bold text-gray-900">Manage Images</h2>
@@ -385,6 +419,29 @@ const PropertyDetail = () => {
             </div>
           )}
 
+          {/* Clients to contact (only for property owner/agent) */}
+          {canManage(property) && matchingClients.length > 0 && (
+            <div className="bg-white shadow-xl rounded-2xl p-6">
+              <h2 className="text-xl font-bold text-gray-900 mb-4">Clients to Contact</h2>
+              <ul className="divide-y divide-gray-100">
+                {matchingClients.map(({ client, similarity, interest_status }) => (
+                  <li key={client.id} className="py-2 flex justify-between items-center">
+                    <div>
+                      <p className="font-semibold text-gray-900">{client.full_name}</p>
+                      <p className="text-sm text-gray-600">{client.email}</p>
+                    </div>
+                    <div className="text-right">
+                      <span className="text-sm font-semibold text-blue-600">{Math.round(similarity * 100)}% match</span>
+                      {interest_status && (
+                        <p className="text-xs text-gray-500">{interest_status.replace('_', ' ')}</p>
+                      )}
+                    </div>
+                  </li>
+                ))}
+              </ul>
+            </div>
+          )}
+
           {/* Action Buttons */}
           <div className="bg-white shadow-xl rounded-2xl p-6 space-y-3">
             <button className="w-full px-4 py-3 bg-green-600 text-white rounded-lg hover:bg-green-700 font-semibold transition-colors duration-200 flex items-center justify-center">
@@ -408,6 +465,47 @@ const PropertyDetail = () => {
           </div>
         </div>
       </div>
+
+      {/* Similar Properties */}
+      {similar.length > 0 && (
+        <div className="mt-6">
+          <h2 className="text-2xl font-bold text-gray-900 mb-4">Similar Properties</h2>
+          <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 gap-6">
+            {similar.map((listing) => (
+              <button
+                key={listing.id}
+                onClick={() => navigate(`/properties/${listing.id}`)}
+                className="bg-white shadow-xl rounded-2xl overflow-hidden text-left hover:shadow-2xl transition-shadow duration-200"
+              >
+                {listing.primary_image ? (
+                  <img
+                    src={listing.primary_image}
+                    srcSet={listing.primary_image_srcset || undefined}
+                    sizes="(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw"
+                    loading="lazy"
+                    alt={listing.title}
+                    className="w-full h-40 object-cover"
+                  />
+                ) : (
+                  <div className="w-full h-40 bg-gradient-to-br from-gray-100 to-gray-200 flex items-center justify-center text-4xl">
+                    {getPropertyTypeIcon(listing.property_type)}
+                  </div>
+                )}
+                <div className="p-4">
+                  <p className="font-semibold text-gray-900 truncate">{listing.title}</p>
+                  <p className="text-sm text-gray-600">{listing.city}, {listing.state}</p>
+                  <div className="flex justify-between items-center mt-2">
+                    <span className="font-bold text-blue-600">{formatPrice(listing.price)}</span>
+                    {listing.bedrooms != null && (
+                      <span className="text-sm text-gray-600">🛏️ {listing.bedrooms}</span>
+                    )}
+                  </div>
+                </div>
+              </button>
+            ))}
+          </div>
+        </div>
+      )}
     </div>
   )
 }
@@ -35,13 +35,16 @@ const Reports = () => {
     }
   };
 
-  const generateReport = () => {
+  const generateReport = async () => {
     setLoading(true);
     
     try {
       let data = null;
       
       switch (reportType) {
+        case 'market_analysis':
+          data = await generateMarketAnalysisReport();
+          break;
         case 'transactions':
           data = generateTransactionReport();
           break;
@@ -203,6 +206,28 @@ const Reports = () => {
     };
   };
 
+  // Read from the precomputed market index rather than individual listings
+  const generateMarketAnalysisReport = async () => {
+    const { data } = await axios.get('/api/properties/market-analysis/', {
+      params: { start: dateRange.startDate.slice(0, 7), end: dateRange.endDate.slice(0, 7) }
+    });
+    const change = (value) => (value === null || value === undefined ? 'N/A' : `${value > 0 ? '+' : ''}${value}%`);
+
+    return {
+      title: 'Market Analysis Report',
+      summary: {
+        'Median Price': data.summary.median_price ? formatPrice(data.summary.median_price, data.summary.currency) : 'N/A',
+        'Median Price / sqft': data.summary.median_price_per_sqft ? formatPrice(data.summary.median_price_per_sqft, data.summary.currency) : 'N/A',
+        'Price Change': change(data.summary.price_change),
+        'Price / sqft Change': change(data.summary.price_per_sqft_change),
+        'Markets': data.summary.markets
+      },
+      markets: data.markets.filter(m => m.city && m.property_type),
+      details: data.markets,
+      type: 'market_analysis'
+    };
+  };
+
   const exportToCSV = () => {
     if (!reportData) {
       showToast.error('Please generate a report first');
@@ -242,6 +267,12 @@ const Reports = () => {
       reportData.details.forEach(p => {
         csvContent += `"${p.title}",${p.property_type},${p.status},$${p.price},"${p.city}, ${p.state}"\n`;
       });
+    } else if (reportData.type === 'market_analysis') {
+      csvContent += 'MARKETS\n';
+      csvContent += 'City,Type,Currency,Median Price,Median Price per sqft,Price Change %,Price per sqft Change %,Observations\n';
+      reportData.markets.forEach(m => {
+        csvContent += `"${m.city}",${m.property_type},${m.currency},${m.median_price},${m.median_price_per_sqft ?? ''},${m.price_change ?? ''},${m.price_per_sqft_change ?? ''},${m.sample_count}\n`;
+      });
     } else if (reportData.type === 'materials') {
       csvContent += 'MATERIAL DETAILS\n';
       csvContent += 'Name,Category,Unit,Current Price,Supplier\n';
@@ -272,10 +303,10 @@ const Reports = () => {
     window.print();
   };
 
-  const formatPrice = (price) => {
+  const formatPrice = (price, currency = 'USD') => {
     return new Intl.NumberFormat('en-US', {
       style: 'currency',
-      currency: 'USD',
+      currency,
       minimumFractionDigits: 0,
       maximumFractionDigits: 0,
     }).format(price);
@@ -315,6 +346,7 @@ const Reports = () => {
               <option value="commission">Commission Report</option>
               <option value="properties">Property Report</option>
               <option value="materials">Material Inventory Report</option>
+              <option value="market_analysis">Market Analysis Report</option>
             </select>
           </div>
 
@@ -450,6 +482,41 @@ const Reports = () => {
             </div>
           )}
 
+          {/* Markets (for market analysis reports) */}
+          {reportData.type === 'market_analysis' && reportData.markets && (
+            <div className="mb-8">
+              <h3 className="text-xl font-bold text-gray-900 mb-4">Markets</h3>
+              <div className="overflow-x-auto">
+                <table className="min-w-full divide-y divide-gray-200">
+                  <thead className="bg-gray-50">
+                    <tr>
+                      <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">City</th>
+                      <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">Type</th>
+                      <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">Median Price</th>
+                      <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">Per sqft</th>
+                      <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">Change</th>
+                    </tr>
+                  </thead>
+                  <tbody className="bg-white divide-y divide-gray-200">
+                    {reportData.markets.map((m) => (
+                      <tr key={`${m.city}-${m.property_type}-${m.currency}`}>
+                        <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{m.city}</td>
+                        <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">{m.property_type}</td>
+                        <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">{formatPrice(m.median_price, m.currency)}</td>
+                        <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
+                          {m.median_price_per_sqft ? formatPrice(m.median_price_per_sqft, m.currency) : 'N/A'}
+                        </td>
+                        <td className={`px-6 py-4 whitespace-nowrap text-sm font-semibold ${m.price_change < 0 ? 'text-red-600' : 'text-green-600'}`}>
+                          {m.price_change === null ? 'N/A' : `${m.price_change > 0 ? '+' : ''}${m.price_change}%`}
+                        </td>
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              </div>
+            </div>
+          )}
+
           {/* Details Section */}
           <div>
             <h3 className="text-xl font-bold text-gray-900 mb-4">Detailed Data</h3>
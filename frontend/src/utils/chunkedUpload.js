@@ -0,0 +1,51 @@
+import axios from 'axios'
+
+/**
+ * Chunked, resumable document upload
+ * Sends the file in chunks to /api/documents/uploads/ and resumes from the
+ * server's offset after a failed chunk, so large files survive flaky links.
+ */
+
+const MAX_RETRIES = 5
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+const sendChunk = (url, file, start, chunkSize) => {
+  const end = Math.min(start + chunkSize, file.size)
+  return axios.put(url, file.slice(start, end), {
+    headers: {
+      'Content-Type': 'application/octet-stream',
+      'Content-Range': `bytes ${start}-${end - 1}/${file.size}`,
+    },
+  })
+}
+
+export const uploadDocument = async (file, fields, { onProgress } = {}) => {
+  const { data: session } = await axios.post('/api/documents/uploads/', {
+    ...fields,
+    filename: file.name,
+    size: file.size,
+  })
+  const url = `/api/documents/uploads/${session.id}/`
+
+  let offset = session.offset
+  let retries = 0
+  while (offset < file.size) {
+    try {
+      const { data } = await sendChunk(url, file, offset, session.chunk_size)
+      offset = data.offset
+      retries = 0
+      if (onProgress) onProgress(offset / file.size)
+    } catch (error) {
+      if (retries >= MAX_RETRIES) throw error
+      retries += 1
+      await sleep(1000 * 2 ** retries)
+      // Resume from whatever the server actually stored
+      const { data } = await axios.get(url)
+      offset = data.offset
+    }
+  }
+
+  const { data: document } = await axios.post(`${url}complete/`)
+  return document
+}
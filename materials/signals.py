@@ -0,0 +1,9 @@
+"""
+Django signals retiring cached material responses when materials or
+their prices change
+"""
+from real_estate_platform.response_cache import invalidate_on_change
+from .models import Material, MaterialPrice
+
+invalidate_on_change(Material, 'materials')
+invalidate_on_change(MaterialPrice, 'materials')
@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Avg, Count
+from real_estate_platform.conditional import ConditionalGetMixin
+from real_estate_platform.response_cache import CachedResponseMixin
 from .models import Supplier, Material, MaterialPrice, PriceAlert
 from .serializers import (
     SupplierSerializer,
@@ -33,9 +35,10 @@ class SupplierDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class MaterialListCreateView(generics.ListCreateAPIView):
+class MaterialListCreateView(ConditionalGetMixin, CachedResponseMixin, generics.ListCreateAPIView):
     """List and create materials"""
 
+    cache_tags = ('materials',)
     queryset = Material.objects.filter(is_active=True)
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -49,9 +52,10 @@ class MaterialListCreateView(generics.ListCreateAPIView):
         return MaterialSerializer
 
 
-class MaterialDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MaterialDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a material"""
 
+    cache_tags = ('materials',)
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
     permission_classes = [IsAuthenticated]
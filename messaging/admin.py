@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Conversation, Message, ClientPropertyInterest
+from .models import Conversation, Message, ConversationReadState, ClientPropertyInterest
 
 
 class MessageInline(admin.TabularInline):
@@ -46,6 +46,13 @@ class MessageAdmin(admin.ModelAdmin):
     message_preview.short_description = 'Message'
 
 
+@admin.register(ConversationReadState)
+class ConversationReadStateAdmin(admin.ModelAdmin):
+    list_display = ['conversation', 'user', 'last_read_message_id', 'last_read_at']
+    search_fields = ['user__email', 'conversation__subject']
+    readonly_fields = ['last_read_at']
+
+
 @admin.register(ClientPropertyInterest)
 class ClientPropertyInterestAdmin(admin.ModelAdmin):
     list_display = ['client', 'property_obj', 'interest_level', 'status', 'created_at']
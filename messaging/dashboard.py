@@ -0,0 +1,150 @@
+"""
+Client dashboard assembly with single-query counters and short-lived caching
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import IntegerField, Q, Subquery
+from django.utils import timezone
+from properties.models import Transaction
+from appointments.models import Appointment
+from .models import Message, ClientPropertyInterest
+
+User = get_user_model()
+
+DASHBOARD_CACHE_TIMEOUT = 60  # seconds
+ACTIVE_TRANSACTION_STATUSES = ['pending', 'in_progress']
+UPCOMING_APPOINTMENT_STATUSES = ['scheduled', 'confirmed']
+
+
+class SubqueryCount(Subquery):
+    """Scalar subquery returning the number of rows of a queryset"""
+
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = IntegerField()
+
+
+def dashboard_cache_key(user_id):
+    return f'client_dashboard:{user_id}'
+
+
+def invalidate_client_dashboard(*user_ids):
+    """Drop cached dashboards for the given users"""
+    keys = [dashboard_cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def _property_location(property_obj):
+    return ', '.join(part for part in [property_obj.address, property_obj.city, property_obj.state] if part)
+
+
+def _transactions_for(user):
+    return Transaction.objects.filter(Q(buyer=user) | Q(seller=user))
+
+
+def _upcoming_appointments_for(user, now):
+    return Appointment.objects.filter(
+        Q(client=user) | Q(attendees=user),
+        start_time__gte=now,
+        status__in=UPCOMING_APPOINTMENT_STATUSES
+    ).distinct()
+
+
+def get_dashboard_counters(user, now):
+    """All dashboard counters in one round trip"""
+    return User.objects.filter(pk=user.pk).annotate(
+        total_interests=SubqueryCount(
+            ClientPropertyInterest.objects.filter(client=user).values('id')
+        ),
+        active_transactions=SubqueryCount(
+            _transactions_for(user).filter(status__in=ACTIVE_TRANSACTION_STATUSES).values('id')
+        ),
+        upcoming_appointments=SubqueryCount(
+            _upcoming_appointments_for(user, now).values('id')
+        ),
+        unread_messages=SubqueryCount(
+            Message.objects.unread_for(user).values('id')
+        ),
+    ).values(
+        'total_interests', 'active_transactions', 'upcoming_appointments', 'unread_messages'
+    ).get()
+
+
+def build_client_dashboard(user):
+    """Assemble the dashboard payload: one counter query plus one per list"""
+    now = timezone.now()
+    dashboard_data = get_dashboard_counters(user, now)
+
+    recent_interests = ClientPropertyInterest.objects.filter(
+        client=user
+    ).select_related('property_obj').order_by('-created_at')[:5]
+    dashboard_data['recent_properties'] = [
+        {
+            'id': interest.property_obj.id,
+            'title': interest.property_obj.title,
+            'price': str(interest.property_obj.price),
+            'location': _property_location(interest.property_obj),
+            'status': interest.property_obj.status,
+            'interest_level': interest.interest_level,
+            'interest_status': interest.status,
+        }
+        for interest in recent_interests
+    ]
+
+    recent_transactions = _transactions_for(user).select_related('property').order_by('-created_at')[:5]
+    dashboard_data['recent_transactions'] = [
+        {
+            'id': trans.id,
+            'property_title': trans.property.title,
+            'sale_price': str(trans.sale_price),
+            'status': trans.status,
+            'role': 'buyer' if trans.buyer_id == user.id else 'seller',
+            'created_at': trans.created_at,
+        }
+        for trans in recent_transactions
+    ]
+
+    upcoming_appointments = _upcoming_appointments_for(user, now).select_related(
+        'agent', 'related_property'
+    ).order_by('start_time')[:5]
+    dashboard_data['upcoming_appointments_list'] = [
+        {
+            'id': appt.id,
+            'title': appt.title,
+            'appointment_type': appt.appointment_type,
+            'start_time': appt.start_time,
+            'agent_name': appt.agent.full_name,
+            'property_title': appt.related_property.title if appt.related_property else None,
+            'location': appt.location,
+            'is_virtual': appt.is_virtual,
+        }
+        for appt in upcoming_appointments
+    ]
+
+    recent_messages = Message.objects.filter(
+        conversation__participants=user
+    ).select_related('sender', 'conversation').with_read_state(user).order_by('-created_at')[:10]
+    dashboard_data['recent_messages'] = [
+        {
+            'id': msg.id,
+            'conversation_id': msg.conversation_id,
+            'conversation_subject': msg.conversation.subject,
+            'sender_name': msg.sender.full_name,
+            'message': msg.message[:100],  # First 100 chars
+            'is_read': msg.sender_id == user.id or msg.id <= msg.read_cursor,
+            'created_at': msg.created_at,
+        }
+        for msg in recent_messages
+    ]
+
+    return dashboard_data
+
+
+def get_client_dashboard(user):
+    """Cached dashboard payload for a user"""
+    key = dashboard_cache_key(user.id)
+    dashboard_data = cache.get(key)
+    if dashboard_data is None:
+        dashboard_data = build_client_dashboard(user)
+        cache.set(key, dashboard_data, DASHBOARD_CACHE_TIMEOUT)
+    return dashboard_data
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_read_states(apps, schema_editor):
+    """Start each participant's cursor at the last message marked read by the legacy flag"""
+    Conversation = apps.get_model('messaging', 'Conversation')
+    Message = apps.get_model('messaging', 'Message')
+    ConversationReadState = apps.get_model('messaging', 'ConversationReadState')
+
+    states = []
+    through = Conversation.participants.through
+    for conversation_id, user_id in through.objects.values_list('conversation_id', 'user_id').iterator():
+        last_read = Message.objects.filter(
+            conversation_id=conversation_id, is_read=True
+        ).exclude(sender_id=user_id).aggregate(last=Max('id'))['last']
+        if last_read:
+            states.append(ConversationReadState(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                last_read_message_id=last_read,
+            ))
+    ConversationReadState.objects.bulk_create(states, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'conversation_read_states',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='messages_convers_c96a9f_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='messaging.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='conversationreadstate',
+            index=models.Index(fields=['user'], name='conversatio_user_id_68125d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationreadstate',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(seed_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:18
+
+import documents.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_conversation_read_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=documents.storage.get_blob_storage, upload_to='message_attachments/'),
+        ),
+    ]
@@ -1,6 +1,84 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
+from documents.storage import get_blob_storage
+from real_estate_platform.response_cache import invalidate_tags
+
+
+def read_cursor_for(user, conversation_ref):
+    """
+    Expression resolving to the id of the last message ``user`` has read in
+    the conversation referenced by ``conversation_ref`` (0 if none).
+    """
+    return Coalesce(
+        Subquery(
+            ConversationReadState.objects.filter(
+                conversation=conversation_ref, user=user
+            ).values('last_read_message_id')[:1]
+        ),
+        0,
+    )
+
+
+class ConversationQuerySet(models.QuerySet):
+    """QuerySet helpers for building conversation listings"""
+
+    def inbox_for(self, user):
+        """
+        Conversations of a user annotated with last-message details and
+        unread count, so an inbox page never touches the full message history.
+        """
+        last_message = Message.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-created_at', '-id')
+
+        return self.filter(participants=user).select_related(
+            'related_property', 'related_transaction', 'related_appointment'
+        ).prefetch_related('participants').annotate(
+            read_cursor=read_cursor_for(user, OuterRef('pk')),
+            last_message_id=Subquery(last_message.values('id')[:1]),
+            last_message_text=Subquery(last_message.values('message')[:1]),
+            last_message_time=Subquery(last_message.values('created_at')[:1]),
+            last_message_sender_id=Subquery(last_message.values('sender_id')[:1]),
+            unread_messages=Count(
+                'messages',
+                filter=Q(messages__id__gt=F('read_cursor')) & ~Q(messages__sender=user),
+            ),
+        )
+
+
+class MessageQuerySet(models.QuerySet):
+    """QuerySet helpers for per-participant read state and history windows"""
+
+    def with_read_state(self, user):
+        """Annotate each message with the user's read cursor for its conversation"""
+        return self.annotate(read_cursor=read_cursor_for(user, OuterRef('conversation')))
+
+    def unread_for(self, user):
+        """Messages from others in the user's conversations past their read cursor"""
+        return self.filter(conversation__participants=user).exclude(
+            sender=user
+        ).with_read_state(user).filter(id__gt=F('read_cursor'))
+
+    def window(self, before=None, after=None, limit=50):
+        """
+        A page of at most ``limit`` messages in chronological order, either
+        the newest ones, those older than ``before`` or those newer than
+        ``after`` (message ids). Returns ``(messages, has_more)``.
+        """
+        queryset = self.select_related('sender')
+        if after is not None:
+            messages = list(queryset.filter(id__gt=after).order_by('id')[:limit + 1])
+            has_more = len(messages) > limit
+            return messages[:limit], has_more
+
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        messages = list(queryset.order_by('-id')[:limit + 1])
+        has_more = len(messages) > limit
+        return messages[:limit][::-1], has_more
 
 
 class Conversation(models.Model):
@@ -53,6 +131,8 @@ class Conversation(models.Model):
     # Status
     is_archived = models.BooleanField(default=False)
 
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         db_table = 'conversations'
         ordering = ['-updated_at']
@@ -70,10 +150,27 @@ class Conversation(models.Model):
         """Get the last message in the conversation"""
         return self.messages.order_by('-created_at').first()
 
-    @property
     def unread_count(self, user):
         """Get unread message count for a user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        return self.messages.exclude(sender=user).filter(
+            id__gt=read_cursor_for(user, self.pk)
+        ).count()
+
+    def mark_read(self, user, message_id=None):
+        """
+        Move the user's read cursor up to ``message_id`` (defaults to the
+        latest message). The cursor only moves forward: one upsert whose
+        update is conditional, so a late request for an older message
+        cannot un-read newer ones. Returns whether the cursor moved.
+        """
+        if not ConversationReadState.advance(self.pk, user.pk, message_id):
+            return False
+        # Unread counts changed; the upsert sends no signals
+        transaction.on_commit(lambda: invalidate_tags('messaging'))
+
+        from .dashboard import invalidate_client_dashboard
+        invalidate_client_dashboard(user.id)
+        return True
 
 
 class Message(models.Model):
@@ -101,12 +198,13 @@ class Message(models.Model):
     # Attachments
     attachment = models.FileField(
         upload_to='message_attachments/',
+        storage=get_blob_storage,
         null=True,
         blank=True
     )
     attachment_name = models.CharField(max_length=255, blank=True, null=True)
 
-    # Status
+    # Status (legacy global flag; per-participant state lives in ConversationReadState)
     is_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
 
@@ -114,11 +212,14 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         db_table = 'messages'
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['conversation', 'created_at']),
+            models.Index(fields=['conversation', 'id']),
             models.Index(fields=['sender']),
             models.Index(fields=['is_read']),
         ]
@@ -126,12 +227,67 @@ class Message(models.Model):
     def __str__(self):
         return f"Message from {self.sender.full_name} at {self.created_at}"
 
-    def mark_as_read(self):
-        """Mark message as read"""
-        if not self.is_read:
-            self.is_read = True
-            self.read_at = timezone.now()
-            self.save()
+    def mark_as_read(self, user):
+        """Mark this message (and everything before it) as read for a user"""
+        if self.sender_id == user.id:
+            return False
+        return self.conversation.mark_read(user, self.id)
+
+
+class ConversationReadState(models.Model):
+    """
+    Per-participant read cursor: the last message a user has read in a
+    conversation. Every message with a higher id from someone else is unread.
+    """
+
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='read_states'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='conversation_read_states'
+    )
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'conversation_read_states'
+        unique_together = ['conversation', 'user']
+        indexes = [
+            models.Index(fields=['user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read {self.conversation_id} up to {self.last_read_message_id}"
+
+    @classmethod
+    def advance(cls, conversation_id, user_id, message_id=None):
+        """
+        Insert or move forward a cursor in one statement (PostgreSQL, SQLite
+        3.35+); ``message_id`` None means the conversation's latest message.
+        The ORM's upsert cannot make the update conditional, hence the SQL.
+        Returns whether a row was written.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = f"""
+            INSERT INTO {table} (conversation_id, user_id, last_read_message_id, last_read_at)
+            SELECT %s, %s, latest.id, %s FROM (
+                SELECT COALESCE(%s, MAX(id)) AS id
+                FROM {connection.ops.quote_name(Message._meta.db_table)} WHERE conversation_id = %s
+            ) latest
+            WHERE latest.id IS NOT NULL
+            ON CONFLICT (conversation_id, user_id) DO UPDATE SET
+                last_read_message_id = excluded.last_read_message_id,
+                last_read_at = excluded.last_read_at
+            WHERE {table}.last_read_message_id < excluded.last_read_message_id
+            RETURNING id
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [conversation_id, user_id, timezone.now(), message_id, conversation_id])
+            return cursor.fetchone() is not None
 
 
 class ClientPropertyInterest(models.Model):
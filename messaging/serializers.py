@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Conversation, Message, ClientPropertyInterest
+from .models import Conversation, ConversationReadState, Message, ClientPropertyInterest
 from users.serializers import UserSerializer
 from properties.serializers import PropertyListSerializer
 
@@ -8,6 +8,7 @@ class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.full_name', read_only=True)
     sender_email = serializers.CharField(source='sender.email', read_only=True)
     sender_role = serializers.CharField(source='sender.role', read_only=True)
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
@@ -16,7 +17,24 @@ class MessageSerializer(serializers.ModelSerializer):
             'message', 'attachment', 'attachment_name',
             'is_read', 'read_at', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['sender', 'is_read', 'read_at', 'created_at', 'updated_at']
+        read_only_fields = ['sender', 'read_at', 'created_at', 'updated_at']
+    
+    def get_is_read(self, obj):
+        """
+        Read state for the requesting user, from the annotated read cursor.
+        Without a requesting user there is no single answer: None.
+        """
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return None
+        if obj.sender_id == request.user.id:
+            return True
+        read_cursor = getattr(obj, 'read_cursor', None)
+        if read_cursor is None:
+            read_cursor = ConversationReadState.objects.filter(
+                conversation_id=obj.conversation_id, user=request.user
+            ).values_list('last_read_message_id', flat=True).first() or 0
+        return obj.id <= read_cursor
 
 
 class MessageCreateSerializer(serializers.ModelSerializer):
@@ -27,8 +45,11 @@ class MessageCreateSerializer(serializers.ModelSerializer):
 
 class ConversationSerializer(serializers.ModelSerializer):
     participants_details = UserSerializer(source='participants', many=True, read_only=True)
+    last_message_id = serializers.SerializerMethodField()
     last_message_text = serializers.SerializerMethodField()
     last_message_time = serializers.SerializerMethodField()
+    last_message_sender = serializers.SerializerMethodField()
+    last_message_sender_name = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
     property_title = serializers.CharField(source='related_property.title', read_only=True)
     transaction_id = serializers.IntegerField(source='related_transaction.id', read_only=True)
@@ -41,40 +62,129 @@ class ConversationSerializer(serializers.ModelSerializer):
             'related_property', 'property_title',
             'related_transaction', 'transaction_id',
             'related_appointment', 'appointment_title',
-            'last_message_text', 'last_message_time', 'unread_count',
+            'last_message_id', 'last_message_text', 'last_message_time',
+            'last_message_sender', 'last_message_sender_name', 'unread_count',
             'is_archived', 'created_by', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
     
+    def _last_message(self, obj):
+        """
+        Last message fields, taken from the inbox annotations when present
+        and otherwise looked up once per conversation.
+        """
+        if hasattr(obj, 'last_message_time'):
+            return {
+                'id': obj.last_message_id,
+                'message': obj.last_message_text,
+                'created_at': obj.last_message_time,
+                'sender_id': obj.last_message_sender_id,
+            }
+        if not hasattr(obj, '_last_message_cache'):
+            last_msg = obj.last_message
+            obj._last_message_cache = {
+                'id': last_msg.id,
+                'message': last_msg.message,
+                'created_at': last_msg.created_at,
+                'sender_id': last_msg.sender_id,
+            } if last_msg else {}
+        return obj._last_message_cache
+    
+    def get_last_message_id(self, obj):
+        return self._last_message(obj).get('id')
+    
     def get_last_message_text(self, obj):
-        last_msg = obj.last_message
-        return last_msg.message if last_msg else None
+        return self._last_message(obj).get('message')
     
     def get_last_message_time(self, obj):
-        last_msg = obj.last_message
-        return last_msg.created_at if last_msg else None
+        return self._last_message(obj).get('created_at')
+    
+    def get_last_message_sender(self, obj):
+        return self._last_message(obj).get('sender_id')
+    
+    def get_last_message_sender_name(self, obj):
+        sender_id = self._last_message(obj).get('sender_id')
+        if sender_id is None:
+            return None
+        # Participants are prefetched, so resolving the sender is free
+        for participant in obj.participants.all():
+            if participant.id == sender_id:
+                return participant.full_name
+        return None
     
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread_messages'):
+            return obj.unread_messages
         request = self.context.get('request')
         if request and request.user:
-            return obj.messages.filter(is_read=False).exclude(sender=request.user).count()
+            return obj.unread_count(request.user)
         return 0
 
 
-class ConversationDetailSerializer(serializers.ModelSerializer):
+class MessageWindowMixin:
+    """Windowed message history driven by ``before``/``after``/``limit`` query params"""
+
+    DEFAULT_MESSAGE_LIMIT = 50
+    MAX_MESSAGE_LIMIT = 200
+
+    def get_message_window(self, conversation):
+        request = self.context.get('request')
+        params = request.query_params if request else {}
+
+        def int_param(name):
+            value = params.get(name)
+            if value is None or value == '':
+                return None
+            if not value.isdigit() or int(value) < 1:
+                raise serializers.ValidationError({name: 'Expected a positive message id or count.'})
+            return int(value)
+
+        limit = min(int_param('limit') or self.DEFAULT_MESSAGE_LIMIT, self.MAX_MESSAGE_LIMIT)
+        queryset = conversation.messages.all()
+        if request:
+            queryset = queryset.with_read_state(request.user)
+
+        before, after = int_param('before'), int_param('after')
+        messages, has_more = queryset.window(before=before, after=after, limit=limit)
+        return {
+            'messages': MessageSerializer(messages, many=True, context=self.context).data,
+            'before': messages[0].id if messages else None,
+            'after': messages[-1].id if messages else None,
+            'has_more_before': has_more if after is None else True,
+            'has_more_after': has_more if after is not None else before is not None,
+        }
+
+
+class ConversationDetailSerializer(MessageWindowMixin, serializers.ModelSerializer):
     participants_details = UserSerializer(source='participants', many=True, read_only=True)
-    messages = MessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
+    message_cursors = serializers.SerializerMethodField()
     property_title = serializers.CharField(source='related_property.title', read_only=True)
     
     class Meta:
         model = Conversation
         fields = [
-            'id', 'subject', 'participants', 'participants_details', 'messages',
+            'id', 'subject', 'participants', 'participants_details',
+            'messages', 'message_cursors',
             'related_property', 'property_title',
             'related_transaction', 'related_appointment',
             'is_archived', 'created_by', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_by', 'created_at', 'updated_at']
+    
+    def _window(self, obj):
+        if not hasattr(obj, '_message_window'):
+            obj._message_window = self.get_message_window(obj)
+        return obj._message_window
+    
+    def get_messages(self, obj):
+        """Latest page of messages (or the page selected by before/after)"""
+        return self._window(obj)['messages']
+    
+    def get_message_cursors(self, obj):
+        """Message ids to pass as before/after when scrolling the history"""
+        window = self._window(obj)
+        return {key: value for key, value in window.items() if key != 'messages'}
 
 
 class ConversationCreateSerializer(serializers.ModelSerializer):
@@ -91,7 +201,7 @@ class ClientPropertyInterestSerializer(serializers.ModelSerializer):
     client_email = serializers.CharField(source='client.email', read_only=True)
     property_title = serializers.CharField(source='property_obj.title', read_only=True)
     property_price = serializers.DecimalField(source='property_obj.price', max_digits=15, decimal_places=2, read_only=True)
-    property_location = serializers.CharField(source='property_obj.location', read_only=True)
+    property_location = serializers.SerializerMethodField()
     property_status = serializers.CharField(source='property_obj.status', read_only=True)
     interest_level_display = serializers.CharField(source='get_interest_level_display', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -106,6 +216,10 @@ class ClientPropertyInterestSerializer(serializers.ModelSerializer):
             'notes', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
+    
+    def get_property_location(self, obj):
+        property_obj = obj.property_obj
+        return ', '.join(part for part in [property_obj.address, property_obj.city, property_obj.state] if part)
 
 
 class ClientPropertyInterestCreateSerializer(serializers.ModelSerializer):
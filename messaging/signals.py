@@ -0,0 +1,120 @@
+"""
+Django signals for pushing new messages to connected clients and keeping
+cached client dashboards and property matching profiles fresh
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from notifications.realtime import publish, user_channel
+from real_estate_platform.response_cache import invalidate_on_change, invalidate_tags
+from appointments.models import Appointment
+from properties.recommendations import recommender
+from .dashboard import invalidate_client_dashboard
+from .models import Conversation, Message, ClientPropertyInterest
+from .serializers import MessageSerializer
+
+invalidate_on_change(Message, 'messaging')
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    """
+    Publish a new message on the channels of the other participants, so
+    open inboxes update without polling
+    """
+    if not created:
+        return
+
+    participant_ids = instance.conversation.participants.exclude(
+        id=instance.sender_id
+    ).values_list('id', flat=True)
+
+    channels = [user_channel(user_id) for user_id in participant_ids]
+
+    data = MessageSerializer(instance).data
+    # Every recipient's cursor is behind a message that was just created
+    data['is_read'] = False
+    publish(channels, 'message', data)
+
+
+# Conversations being deleted: their participants are invalidated once,
+# not once per cascaded message
+_deleting_conversation_ids = set()
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed_dashboard(sender, instance, **kwargs):
+    """Unread counts and recent messages change for every participant"""
+    if instance.conversation_id in _deleting_conversation_ids:
+        return
+    participant_ids = instance.conversation.participants.values_list('id', flat=True)
+    invalidate_client_dashboard(*participant_ids)
+
+
+@receiver(pre_delete, sender=Conversation)
+def conversation_deleting_dashboard(sender, instance, **kwargs):
+    """The participant rows are gone by post_delete: remember who they were"""
+    instance._dashboard_participant_ids = list(instance.participants.values_list('id', flat=True))
+    _deleting_conversation_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted_dashboard(sender, instance, **kwargs):
+    _deleting_conversation_ids.discard(instance.pk)
+    invalidate_client_dashboard(*instance.__dict__.pop('_dashboard_participant_ids', []))
+
+
+@receiver(post_save, sender=ClientPropertyInterest)
+@receiver(post_delete, sender=ClientPropertyInterest)
+def interest_changed_dashboard(sender, instance, **kwargs):
+    invalidate_client_dashboard(instance.client_id)
+
+
+@receiver(post_save, sender=ClientPropertyInterest)
+@receiver(post_delete, sender=ClientPropertyInterest)
+def interest_changed_profile(sender, instance, **kwargs):
+    """The client's profile for property matching follows their interests"""
+    client_id = instance.client_id
+    transaction.on_commit(lambda: recommender.refresh_client(client_id))
+
+
+@receiver(post_save, sender='properties.Transaction')
+@receiver(post_delete, sender='properties.Transaction')
+def transaction_changed_dashboard(sender, instance, **kwargs):
+    invalidate_client_dashboard(instance.buyer_id, instance.seller_id)
+
+
+@receiver(pre_delete, sender=Appointment)
+def appointment_deleting_dashboard(sender, instance, **kwargs):
+    """The attendee rows are gone by post_delete: remember who they were"""
+    instance._dashboard_attendee_ids = list(instance.attendees.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def appointment_changed_dashboard(sender, instance, **kwargs):
+    attendee_ids = getattr(instance, '_dashboard_attendee_ids', None)
+    if attendee_ids is None:
+        attendee_ids = instance.attendees.values_list('id', flat=True)
+    invalidate_client_dashboard(instance.client_id, *attendee_ids)
+
+
+@receiver(m2m_changed, sender=Appointment.attendees.through)
+def appointment_attendees_changed_dashboard(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Appointment):
+        return
+    if action == 'pre_clear':
+        # clear() reports no pk_set
+        instance._dashboard_attendee_ids = list(instance.attendees.values_list('id', flat=True))
+    elif action == 'post_clear':
+        invalidate_client_dashboard(*instance.__dict__.pop('_dashboard_attendee_ids', []))
+    elif action in ['post_add', 'post_remove']:
+        invalidate_client_dashboard(*(pk_set or []))
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def conversation_participants_changed(sender, action, **kwargs):
+    """Participants decide who sees a conversation, without touching updated_at"""
+    if action in ['post_add', 'post_remove', 'post_clear']:
+        transaction.on_commit(lambda: invalidate_tags('messaging'))
@@ -1,3 +1,356 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from appointments.models import Appointment
+from properties.models import Property, Transaction
+from users.models import User
+from .dashboard import dashboard_cache_key
+from .models import Conversation, ConversationReadState, Message, ClientPropertyInterest
+from .serializers import ConversationSerializer
 
-# Create your tests here.
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ClientDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        now = timezone.now()
+        for i in range(3):
+            property_obj = Property.objects.create(
+                title=f'House {i}', description='', property_type='residential',
+                address=f'{i} Main St', city='Douala', state='Littoral',
+                price=100000 + i, agent=self.agent
+            )
+            ClientPropertyInterest.objects.create(client=self.client_user, property_obj=property_obj)
+            Transaction.objects.create(
+                property=property_obj, buyer=self.client_user, agent=self.agent,
+                sale_price=100000 + i, status='pending'
+            )
+            Appointment.objects.create(
+                title=f'Viewing {i}', agent=self.agent, client=self.client_user,
+                related_property=property_obj,
+                start_time=now + timedelta(days=i + 1),
+                end_time=now + timedelta(days=i + 1, hours=1)
+            )
+        conversation = Conversation.objects.create(subject='Deal', created_by=self.agent)
+        conversation.participants.add(self.agent, self.client_user)
+        for i in range(4):
+            Message.objects.create(conversation=conversation, sender=self.agent, message=f'Hello {i}')
+
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+        self.url = reverse('client-dashboard')
+
+    def test_dashboard_counts_and_lists(self):
+        response = self.api.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_interests'], 3)
+        self.assertEqual(response.data['active_transactions'], 3)
+        self.assertEqual(response.data['upcoming_appointments'], 3)
+        self.assertEqual(response.data['unread_messages'], 4)
+        self.assertEqual(response.data['recent_properties'][0]['location'], '2 Main St, Douala, Littoral')
+        self.assertEqual(len(response.data['recent_transactions']), 3)
+        self.assertEqual(len(response.data['recent_messages']), 4)
+
+    def test_dashboard_query_count(self):
+        # Counters in one query plus one per list
+        with self.assertNumQueries(5):
+            self.api.get(self.url)
+
+        # Served from cache on the next request
+        with self.assertNumQueries(0):
+            self.api.get(self.url)
+
+    def test_dashboard_invalidated_on_read(self):
+        self.api.get(self.url)
+        conversation = Conversation.objects.get()
+        conversation.mark_read(self.client_user)
+
+        response = self.api.get(self.url)
+        self.assertEqual(response.data['unread_messages'], 0)
+
+    def test_conversation_delete_invalidates_once(self):
+        def delete_conversation(message_count):
+            conversation = Conversation.objects.create(subject='Other', created_by=self.agent)
+            conversation.participants.add(self.agent, self.client_user)
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender=self.agent, message='Hi') for _ in range(message_count)
+            ])
+            cache.set(dashboard_cache_key(self.client_user.id), {'cached': True})
+            with CaptureQueriesContext(connection) as queries:
+                conversation.delete()
+            self.assertIsNone(cache.get(dashboard_cache_key(self.client_user.id)))
+            return len(queries)
+
+        # Cascaded messages do not look up the participants one by one
+        self.assertEqual(delete_conversation(5), delete_conversation(50))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ReadCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.conversation = Conversation.objects.create(subject='Deal', created_by=self.agent)
+        self.conversation.participants.add(self.agent, self.client_user)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.agent, message=f'Hello {i}')
+            for i in range(3)
+        ]
+
+    def cursor(self):
+        return ConversationReadState.objects.get(
+            conversation=self.conversation, user=self.client_user
+        ).last_read_message_id
+
+    def test_cursor_never_moves_back(self):
+        self.assertTrue(self.conversation.mark_read(self.client_user))
+        self.assertEqual(self.cursor(), self.messages[-1].id)
+
+        self.assertFalse(self.conversation.mark_read(self.client_user, self.messages[0].id))
+        self.assertFalse(self.messages[1].mark_as_read(self.client_user))
+        self.assertEqual(self.cursor(), self.messages[-1].id)
+
+    def test_mark_read_is_one_statement(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.conversation.mark_read(self.client_user, self.messages[0].id))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.conversation.mark_read(self.client_user))
+        with self.assertNumQueries(1):
+            self.assertFalse(self.conversation.mark_read(self.client_user, self.messages[1].id))
+        self.assertEqual(self.cursor(), self.messages[-1].id)
+        empty = Conversation.objects.create(subject='Empty', created_by=self.agent)
+        self.assertFalse(empty.mark_read(self.client_user))
+        self.assertFalse(ConversationReadState.objects.filter(conversation=empty).exists())
+
+    def test_mark_as_read_moves_cursor_forward(self):
+        self.assertTrue(self.messages[0].mark_as_read(self.client_user))
+        self.assertEqual(self.cursor(), self.messages[0].id)
+        self.assertTrue(self.messages[1].mark_as_read(self.client_user))
+        self.assertEqual(self.cursor(), self.messages[1].id)
+        # The sender's own message leaves their cursor alone
+        self.assertFalse(self.messages[2].mark_as_read(self.agent))
+
+    def test_is_read_is_per_requesting_user(self):
+        self.messages[0].mark_as_read(self.client_user)
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+
+        response = api.get(f'/api/messaging/messages/{self.messages[1].id}/')
+        self.assertFalse(response.data['is_read'])
+        response = api.post(f'/api/messaging/messages/{self.messages[1].id}/mark_read/')
+        self.assertTrue(response.data['is_read'])
+
+    def test_stream_payload_is_unread_for_recipients(self):
+        with mock.patch('messaging.signals.publish') as publish:
+            Message.objects.create(conversation=self.conversation, sender=self.agent, message='New')
+        channels, event, data = publish.call_args.args
+        self.assertEqual(event, 'message')
+        self.assertFalse(data['is_read'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AppointmentDashboardInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.attendee = User.objects.create_user(
+            email='attendee@example.com', username='attendee', password='pass', role='client'
+        )
+        start = timezone.now() + timedelta(days=1)
+        self.appointment = Appointment.objects.create(
+            title='Viewing', agent=self.agent, start_time=start, end_time=start + timedelta(hours=1)
+        )
+        self.appointment.attendees.add(self.attendee)
+        self.key = dashboard_cache_key(self.attendee.id)
+
+    def test_delete_invalidates_attendee_dashboards(self):
+        cache.set(self.key, {'cached': True})
+        self.appointment.delete()
+        self.assertIsNone(cache.get(self.key))
+
+    def test_clear_invalidates_attendee_dashboards(self):
+        cache.set(self.key, {'cached': True})
+        self.appointment.attendees.clear()
+        self.assertIsNone(cache.get(self.key))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class InboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+
+    def conversation(self, messages=(), subject='Deal'):
+        conversation = Conversation.objects.create(subject=subject, created_by=self.agent)
+        conversation.participants.add(self.agent, self.client_user)
+        for sender, text in messages:
+            Message.objects.create(conversation=conversation, sender=sender, message=text)
+        return conversation
+
+    def serialized(self):
+        request = RequestFactory().get('/')
+        request.user = self.client_user
+        inbox = Conversation.objects.inbox_for(self.client_user)
+        return ConversationSerializer(inbox, many=True, context={'request': request}).data
+
+    def test_query_count_does_not_grow_with_the_inbox(self):
+        for n in range(5):
+            self.conversation([(self.agent, 'Hello'), (self.client_user, 'Hi')], subject=f'Deal {n}')
+        with self.assertNumQueries(2) as small:
+            self.assertEqual(len(self.serialized()), 5)
+        for n in range(45):
+            self.conversation([(self.agent, 'Hello'), (self.client_user, 'Hi')], subject=f'More {n}')
+        # The conversations and their prefetched participants, however many
+        with self.assertNumQueries(len(small.captured_queries)):
+            self.assertEqual(len(self.serialized()), 50)
+
+    def test_unread_count_excludes_own_messages_and_follows_the_cursor(self):
+        conversation = self.conversation([
+            (self.agent, 'One'), (self.client_user, 'Mine'), (self.agent, 'Two'), (self.agent, 'Three'),
+        ])
+        row, = self.serialized()
+        self.assertEqual(row['unread_count'], 3)
+
+        second = conversation.messages.get(message='Two')
+        conversation.mark_read(self.client_user, second.id)
+        row, = self.serialized()
+        self.assertEqual(row['unread_count'], 1)
+        self.assertEqual(row['unread_count'], conversation.unread_count(self.client_user))
+
+        Message.objects.create(conversation=conversation, sender=self.client_user, message='Reply')
+        row, = self.serialized()
+        self.assertEqual(row['unread_count'], 1)
+        conversation.mark_read(self.client_user)
+        row, = self.serialized()
+        self.assertEqual(row['unread_count'], 0)
+
+    def test_last_message_preview(self):
+        empty = self.conversation(subject='Empty')
+        conversation = self.conversation([(self.agent, 'First'), (self.client_user, 'Second')])
+        # Messages created in the same instant: the later id is the last one
+        conversation.messages.update(created_at=timezone.now())
+        last = conversation.messages.get(message='Second')
+        rows = {row['id']: row for row in self.serialized()}
+
+        self.assertEqual(rows[conversation.id]['last_message_id'], last.id)
+        self.assertEqual(rows[conversation.id]['last_message_text'], 'Second')
+        self.assertEqual(rows[conversation.id]['last_message_sender'], self.client_user.id)
+        self.assertEqual(rows[conversation.id]['last_message_sender_name'], self.client_user.full_name)
+        self.assertIsNone(rows[empty.id]['last_message_id'])
+        self.assertIsNone(rows[empty.id]['last_message_sender_name'])
+        self.assertEqual(rows[empty.id]['unread_count'], 0)
+
+    def test_inbox_endpoint_lists_newest_conversations_first(self):
+        older = self.conversation([(self.agent, 'Old')], subject='Older')
+        newer = self.conversation([(self.agent, 'New')], subject='Newer')
+        Conversation.objects.filter(pk=older.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        response = api.get('/api/messaging/conversations/inbox/')
+        self.assertEqual([row['id'] for row in response.data['results']], [newer.id, older.id])
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MessageWindowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.conversation = Conversation.objects.create(subject='Deal', created_by=self.agent)
+        self.conversation.participants.add(self.agent, self.client_user)
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.agent if n % 2 else self.client_user,
+                    message=f'Message {n}')
+            for n in range(300)
+        ])
+        self.ids = list(self.conversation.messages.order_by('id').values_list('id', flat=True))
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+        self.url = f'/api/messaging/conversations/{self.conversation.id}/history/'
+
+    def window(self, **params):
+        response = self.api.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertWindow(self, window, ids, has_more_before, has_more_after):
+        self.assertEqual([message['id'] for message in window['messages']], ids)
+        self.assertEqual(window['before'], ids[0] if ids else None)
+        self.assertEqual(window['after'], ids[-1] if ids else None)
+        self.assertEqual((window['has_more_before'], window['has_more_after']), (has_more_before, has_more_after))
+
+    def test_latest_page(self):
+        self.assertWindow(self.window(), self.ids[-50:], True, False)
+        self.assertWindow(self.window(limit=10), self.ids[-10:], True, False)
+        # The limit is capped
+        self.assertEqual(len(self.window(limit=1000)['messages']), 200)
+
+    def test_scrolling_back_to_the_start(self):
+        window = self.window(before=self.ids[100], limit=40)
+        self.assertWindow(window, self.ids[60:100], True, True)
+        window = self.window(before=window['before'], limit=40)
+        self.assertWindow(window, self.ids[20:60], True, True)
+        window = self.window(before=window['before'], limit=40)
+        self.assertWindow(window, self.ids[:20], False, True)
+        # Exactly a page left is not "more"
+        self.assertWindow(self.window(before=self.ids[40], limit=40), self.ids[:40], False, True)
+
+    def test_scrolling_forward_to_the_end(self):
+        window = self.window(after=self.ids[200], limit=50)
+        self.assertWindow(window, self.ids[201:251], True, True)
+        window = self.window(after=window['after'], limit=50)
+        self.assertWindow(window, self.ids[251:], True, False)
+        self.assertWindow(self.window(after=self.ids[-1]), [], True, False)
+
+    def test_invalid_cursor(self):
+        for params in [{'before': 'abc'}, {'after': '-3'}, {'limit': '0'}, {'limit': '2.5'}]:
+            response = self.api.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.data)
+
+    def test_long_thread_reads_only_the_window(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(f'/api/messaging/conversations/{self.conversation.id}/')
+        self.assertEqual(len(response.data['messages']), 50)
+        self.assertFalse(response.data['message_cursors']['has_more_after'])
+        message_queries = [query['sql'] for query in queries if 'FROM "messages"' in query['sql']]
+        # One windowed read, limit + 1 rows to learn whether there is more
+        self.assertEqual(len(message_queries), 1)
+        self.assertIn('LIMIT 51', message_queries[0])
+        count = len(queries)
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.agent, message='More') for _ in range(300)
+        ])
+        with self.assertNumQueries(count):
+            self.api.get(f'/api/messaging/conversations/{self.conversation.id}/')
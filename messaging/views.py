@@ -3,9 +3,7 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.utils import timezone
-from django.db.models import Q, Count, Prefetch
-from datetime import timedelta
+from django.db.models import Q, F, Count
 from .models import Conversation, Message, ClientPropertyInterest
 from .serializers import (
     ConversationSerializer,
@@ -17,13 +15,15 @@ from .serializers import (
     ClientPropertyInterestCreateSerializer,
     ClientDashboardSerializer
 )
+from .dashboard import get_client_dashboard
 from activity_log.models import ActivityLog
-from properties.models import Property, Transaction
-from appointments.models import Appointment
+from real_estate_platform.conditional import ConditionalGetMixin
 
 
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    # Unread counts and participants move without touching updated_at
+    cache_tags = ('appointments', 'messaging', 'properties', 'users')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['is_archived', 'related_property', 'related_transaction']
     search_fields = ['subject']
@@ -32,10 +32,19 @@ class ConversationViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return Conversation.objects.filter(participants=user).prefetch_related('participants', 'messages')
+        if self.action in ['list', 'inbox']:
+            return Conversation.objects.inbox_for(user)
+        queryset = Conversation.objects.filter(participants=user)
+        if self.action in ['retrieve', 'history']:
+            queryset = queryset.select_related('related_property').prefetch_related('participants')
+        return queryset
+
+    def conditional_queryset(self):
+        # The inbox annotations are not needed to count rows and find the latest change
+        return self.filter_queryset(Conversation.objects.filter(participants=self.request.user))
 
     def get_serializer_class(self):
-        if self.action == 'retrieve':
+        if self.action in ['retrieve', 'history']:
             return ConversationDetailSerializer
         if self.action in ['create', 'update', 'partial_update']:
             return ConversationCreateSerializer
@@ -55,6 +64,32 @@ class ConversationViewSet(viewsets.ModelViewSet):
             severity='low'
         )
 
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """Get active conversations with last message and unread count"""
+        queryset = self.filter_queryset(self.get_queryset()).filter(is_archived=False)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Page through a conversation's messages
+        Query params:
+            - before: message id to load older messages from
+            - after: message id to load newer messages from
+            - limit: page size (default: 50, max: 200)
+        """
+        conversation = self.get_object()
+        serializer = self.get_serializer(conversation)
+        return Response(serializer.get_message_window(conversation))
+
     @action(detail=True, methods=['post'])
     def archive(self, request, pk=None):
         """Archive a conversation"""
@@ -79,25 +114,33 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def mark_all_read(self, request, pk=None):
         """Mark all messages in conversation as read"""
         conversation = self.get_object()
-        messages = conversation.messages.filter(is_read=False).exclude(sender=request.user)
-
-        for message in messages:
-            message.mark_as_read()
+        conversation.mark_read(request.user)
 
         return Response({'status': 'All messages marked as read'})
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    cache_tags = ('messaging', 'users')
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['conversation', 'sender', 'is_read']
+    filterset_fields = ['conversation', 'sender']
     ordering_fields = ['created_at']
     ordering = ['created_at']
 
     def get_queryset(self):
         user = self.request.user
         # Only show messages from conversations user is part of
-        return Message.objects.filter(conversation__participants=user)
+        queryset = Message.objects.filter(
+            conversation__participants=user
+        ).select_related('sender').with_read_state(user)
+
+        # Read state is per participant, so is_read is resolved against the cursor
+        is_read = self.request.query_params.get('is_read')
+        if is_read is not None:
+            unread = Q(id__gt=F('read_cursor')) & ~Q(sender=user)
+            queryset = queryset.filter(unread) if is_read.lower() in ['false', '0'] else queryset.exclude(unread)
+
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -122,7 +165,8 @@ class MessageViewSet(viewsets.ModelViewSet):
     def mark_read(self, request, pk=None):
         """Mark a message as read"""
         message = self.get_object()
-        message.mark_as_read()
+        message.mark_as_read(request.user)
+        message = self.get_queryset().get(pk=message.pk)
 
         serializer = self.get_serializer(message)
         return Response(serializer.data)
@@ -130,13 +174,14 @@ class MessageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get all unread messages"""
-        queryset = self.get_queryset().filter(is_read=False).exclude(sender=request.user)
+        queryset = Message.objects.unread_for(request.user).select_related('sender')
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
 
-class ClientPropertyInterestViewSet(viewsets.ModelViewSet):
+class ClientPropertyInterestViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    cache_tags = ('properties', 'users')
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['client', 'property_obj', 'interest_level', 'status']
     ordering_fields = ['created_at', 'updated_at']
@@ -146,11 +191,12 @@ class ClientPropertyInterestViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         # Admins and agents see all
+        queryset = ClientPropertyInterest.objects.select_related('client', 'property_obj')
         if user.role in ['admin', 'agent']:
-            return ClientPropertyInterest.objects.all()
+            return queryset
 
         # Clients see only their own
-        return ClientPropertyInterest.objects.filter(client=user)
+        return queryset.filter(client=user)
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -181,105 +227,5 @@ def client_dashboard(request):
     if user.role != 'client':
         return Response({'error': 'This endpoint is only for clients'}, status=403)
 
-    now = timezone.now()
-
-    # Get statistics
-    total_interests = ClientPropertyInterest.objects.filter(client=user).count()
-    active_transactions = Transaction.objects.filter(
-        Q(buyer=user) | Q(seller=user),
-        status__in=['pending', 'in_progress']
-    ).count()
-    upcoming_appointments = Appointment.objects.filter(
-        Q(client=user) | Q(attendees=user),
-        start_time__gte=now,
-        status__in=['scheduled', 'confirmed']
-    ).count()
-    unread_messages = Message.objects.filter(
-        conversation__participants=user,
-        is_read=False
-    ).exclude(sender=user).count()
-
-    # Get recent properties (interested in)
-    recent_interests = ClientPropertyInterest.objects.filter(
-        client=user
-    ).select_related('property_obj').order_by('-created_at')[:5]
-
-    recent_properties = []
-    for interest in recent_interests:
-        recent_properties.append({
-            'id': interest.property_obj.id,
-            'title': interest.property_obj.title,
-            'price': str(interest.property_obj.price),
-            'location': interest.property_obj.location,
-            'status': interest.property_obj.status,
-            'interest_level': interest.interest_level,
-            'interest_status': interest.status,
-        })
-
-    # Get recent transactions
-    recent_transactions_qs = Transaction.objects.filter(
-        Q(buyer=user) | Q(seller=user)
-    ).select_related('property_obj').order_by('-created_at')[:5]
-
-    recent_transactions = []
-    for trans in recent_transactions_qs:
-        recent_transactions.append({
-            'id': trans.id,
-            'property_title': trans.property_obj.title,
-            'amount': str(trans.amount),
-            'status': trans.status,
-            'transaction_type': trans.transaction_type,
-            'created_at': trans.created_at,
-        })
-
-    # Get upcoming appointments
-    upcoming_appointments_qs = Appointment.objects.filter(
-        Q(client=user) | Q(attendees=user),
-        start_time__gte=now,
-        status__in=['scheduled', 'confirmed']
-    ).select_related('agent', 'related_property').order_by('start_time')[:5]
-
-    upcoming_appointments_list = []
-    for appt in upcoming_appointments_qs:
-        upcoming_appointments_list.append({
-            'id': appt.id,
-            'title': appt.title,
-            'appointment_type': appt.appointment_type,
-            'start_time': appt.start_time,
-            'agent_name': appt.agent.full_name,
-            'property_title': appt.related_property.title if appt.related_property else None,
-            'location': appt.location,
-            'is_virtual': appt.is_virtual,
-        })
-
-    # Get recent messages
-    recent_messages_qs = Message.objects.filter(
-        conversation__participants=user
-    ).select_related('sender', 'conversation').order_by('-created_at')[:10]
-
-    recent_messages = []
-    for msg in recent_messages_qs:
-        recent_messages.append({
-            'id': msg.id,
-            'conversation_id': msg.conversation.id,
-            'conversation_subject': msg.conversation.subject,
-            'sender_name': msg.sender.full_name,
-            'message': msg.message[:100],  # First 100 chars
-            'is_read': msg.is_read,
-            'created_at': msg.created_at,
-        })
-
-    # Prepare dashboard data
-    dashboard_data = {
-        'total_interests': total_interests,
-        'active_transactions': active_transactions,
-        'upcoming_appointments': upcoming_appointments,
-        'unread_messages': unread_messages,
-        'recent_properties': recent_properties,
-        'recent_transactions': recent_transactions,
-        'upcoming_appointments_list': upcoming_appointments_list,
-        'recent_messages': recent_messages,
-    }
-
-    serializer = ClientDashboardSerializer(dashboard_data)
+    serializer = ClientDashboardSerializer(get_client_dashboard(user))
     return Response(serializer.data)
@@ -6,6 +6,7 @@ class NotificationsConfig(AppConfig):
     name = 'notifications'
 
     def ready(self):
-        """Import signals when app is ready"""
+        """Import signals and system checks when app is ready"""
+        import notifications.checks
         import notifications.signals
 
@@ -0,0 +1,19 @@
+"""
+System checks for real-time delivery
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def realtime_broker_check(app_configs, **kwargs):
+    """LocalBroker drops events published by other processes"""
+    broker = getattr(settings, 'REALTIME_BROKER', 'notifications.realtime.LocalBroker')
+    if broker.endswith('.LocalBroker') and not settings.DEBUG:
+        return [Warning(
+            'REALTIME_BROKER is LocalBroker: events published by other processes '
+            '(web workers, import worker, notifier, reminders) never reach open streams.',
+            hint="Use 'notifications.realtime.PostgresBroker' with a PostgreSQL database.",
+            id='notifications.W001',
+        )]
+    return []
@@ -4,6 +4,7 @@ Email notification utilities for sending automated emails
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.utils import timezone
 from django.utils.html import strip_tags
 
 
@@ -145,6 +146,34 @@ def send_welcome_email(user):
         return False
 
 
+def build_appointment_reminder_email(appointment, user):
+    """
+    Build (without sending) a reminder email for an upcoming appointment,
+    so callers can deliver many of them over one connection
+    
+    Args:
+        appointment: Appointment object
+        user: User to remind
+    """
+    subject = f'Reminder: {appointment.title} on {timezone.localtime(appointment.start_time):%b %d, %H:%M}'
+    
+    context = {
+        'user': user,
+        'appointment': appointment,
+        'frontend_url': settings.FRONTEND_URL,
+    }
+    
+    html_message = render_to_string('emails/appointment_reminder.html', context)
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=strip_tags(html_message),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+    email.attach_alternative(html_message, 'text/html')
+    return email
+
+
 def send_bulk_notification_email(users, subject, message, html_message=None):
     """
     Send bulk email notification to multiple users
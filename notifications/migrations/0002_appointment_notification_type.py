@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('transaction', 'Transaction Update'), ('property', 'Property Update'), ('price_alert', 'Price Alert'), ('system', 'System Notification'), ('assignment', 'New Assignment'), ('appointment', 'Appointment Reminder')], max_length=20),
+        ),
+    ]
@@ -1,5 +1,9 @@
+import secrets
+from datetime import timedelta
+
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class Notification(models.Model):
@@ -11,6 +15,7 @@ class Notification(models.Model):
         ('price_alert', 'Price Alert'),
         ('system', 'System Notification'),
         ('assignment', 'New Assignment'),
+        ('appointment', 'Appointment Reminder'),
     ]
     
     PRIORITY_CHOICES = [
@@ -53,3 +58,41 @@ class Notification(models.Model):
             self.read_at = timezone.now()
             self.save()
 
+
+class StreamTicket(models.Model):
+    """
+    Single-use credential for opening an event stream. EventSource cannot
+    send headers, so rather than putting the access token in the URL (and
+    so in access and proxy logs) the client trades it for a ticket that
+    is only good for one connection within a few seconds.
+    """
+
+    LIFETIME = timedelta(seconds=30)
+
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stream_tickets')
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'notification_stream_tickets'
+
+    def __str__(self):
+        return f"Stream ticket for user {self.user_id}"
+
+    @classmethod
+    def issue(cls, user):
+        now = timezone.now()
+        cls.objects.filter(expires_at__lte=now).delete()
+        return cls.objects.create(key=secrets.token_urlsafe(32), user=user, expires_at=now + cls.LIFETIME)
+
+    @classmethod
+    def redeem(cls, key):
+        """The ticket's user, at most once; None for unknown or expired tickets"""
+        ticket = cls.objects.filter(key=key, expires_at__gt=timezone.now()).select_related('user').first()
+        if ticket is None:
+            return None
+        # Whoever deletes the row first owns the ticket
+        deleted, _ = cls.objects.filter(pk=ticket.pk).delete()
+        if not deleted or not ticket.user.is_active:
+            return None
+        return ticket.user
@@ -0,0 +1,186 @@
+"""
+Publish/subscribe for pushing events to connected clients.
+
+Events are published on per-user channels (``user:<id>``) and delivered to
+the Server-Sent Events streams subscribed to those channels. The broker
+class comes from ``settings.REALTIME_BROKER``:
+
+- ``PostgresBroker`` relays events through PostgreSQL LISTEN/NOTIFY, so
+  events published by any process (every web worker, the Procfile
+  ``worker`` and ``notifier``, reminder commands) reach every stream
+- ``LocalBroker`` only reaches streams of the publishing process; it is
+  meant for single-process development
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """A set of channels delivered into one asyncio queue"""
+
+    def __init__(self, broker, channels, maxsize=100):
+        self.broker = broker
+        self.channels = list(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        """Hand an event to the subscriber's loop (safe from any thread)"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        # Slow consumers drop events instead of growing memory without bound
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    Broker delivering events to subscribers in the current process only
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channels):
+        """Subscribe to channels; must be called from a running event loop"""
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channels, event):
+        """Deliver an event once to every subscriber of any of the channels"""
+        with self._lock:
+            subscribers = set()
+            for channel in channels:
+                subscribers.update(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # Event loop already closed; the stream is gone
+                self.unsubscribe(subscription)
+
+
+def _truncated(event):
+    """Event standing in for one too large to relay; clients refetch it"""
+    data = event['data'] if isinstance(event['data'], dict) else {}
+    return {'type': event['type'], 'data': {'id': data.get('id'), 'truncated': True}}
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Broker relaying events between processes with PostgreSQL LISTEN/NOTIFY.
+
+    Publishing is a ``pg_notify`` on the default connection. A process with
+    subscribers runs one listener thread on a connection of its own that
+    hands every notification to its local subscribers.
+    """
+
+    CHANNEL = 'realtime_events'
+    # NOTIFY payloads must stay below 8000 bytes
+    MAX_PAYLOAD = 7900
+    RECONNECT_DELAY = 2  # seconds
+    POLL_TIMEOUT = 30  # seconds
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, channels):
+        self._ensure_listener()
+        return super().subscribe(channels)
+
+    def publish(self, channels, event):
+        payload = json.dumps({'channels': list(channels), 'event': event}, default=str)
+        if len(payload.encode()) > self.MAX_PAYLOAD:
+            payload = json.dumps({'channels': list(channels), 'event': _truncated(event)}, default=str)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, payload])
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='realtime-listener', daemon=True)
+                self._listener.start()
+
+    def _deliver(self, payload):
+        message = json.loads(payload)
+        LocalBroker.publish(self, message['channels'], message['event'])
+
+    def _listen(self):
+        while True:
+            wrapper = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.CHANNEL}')
+                while True:
+                    readable, _, _ = select.select([raw], [], [], self.POLL_TIMEOUT)
+                    if not readable:
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self._deliver(raw.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Realtime listener lost its database connection; reconnecting')
+                time.sleep(self.RECONNECT_DELAY)
+            finally:
+                wrapper.close()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Return the process-wide broker configured in settings"""
+    broker_path = getattr(settings, 'REALTIME_BROKER', 'notifications.realtime.LocalBroker')
+    return import_string(broker_path)()
+
+
+def publish(channels, event_type, data):
+    """
+    Publish an event once the current transaction commits, so subscribers
+    never hear about rows they cannot read yet.
+    """
+    event = {'type': event_type, 'data': data}
+
+    transaction.on_commit(lambda: get_broker().publish(list(channels), event))
+
+
+def format_sse(event):
+    """Encode an event as a Server-Sent Events frame"""
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
@@ -10,6 +10,8 @@ from .email_utils import (
     send_welcome_email
 )
 from .models import Notification
+from .realtime import publish, user_channel
+from .serializers import NotificationSerializer
 
 User = get_user_model()
 
@@ -142,3 +144,16 @@ def material_price_alert(sender, instance, created, **kwargs):
                             related_type='material'
                         )
 
+
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    """
+    Push new notifications to the user's open event streams
+    """
+    if created:
+        publish(
+            [user_channel(instance.user_id)],
+            'notification',
+            NotificationSerializer(instance).data
+        )
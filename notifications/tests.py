@@ -0,0 +1,114 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.testing import ApplicationCommunicator
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import User
+from .models import StreamTicket
+from .realtime import LocalBroker, PostgresBroker, user_channel
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StreamTicketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='client'
+        )
+
+    def test_ticket_is_single_use(self):
+        ticket = StreamTicket.issue(self.user)
+        self.assertEqual(StreamTicket.redeem(ticket.key), self.user)
+        self.assertIsNone(StreamTicket.redeem(ticket.key))
+
+    def test_expired_ticket_is_refused_and_purged(self):
+        ticket = StreamTicket.issue(self.user)
+        StreamTicket.objects.filter(pk=ticket.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(StreamTicket.redeem(ticket.key))
+        StreamTicket.issue(self.user)
+        self.assertFalse(StreamTicket.objects.filter(pk=ticket.pk).exists())
+
+    def test_ticket_endpoint_requires_authentication(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/notifications/stream/ticket/').status_code, 401)
+        client.force_authenticate(self.user)
+        response = client.post('/api/notifications/stream/ticket/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(StreamTicket.objects.filter(key=response.data['ticket'], user=self.user).exists())
+
+    def test_stream_refuses_token_in_query(self):
+        token = str(AccessToken.for_user(self.user))
+        response = self.client.get('/api/notifications/stream/', {'token': token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_opens_with_ticket_once(self):
+        ticket = StreamTicket.issue(self.user)
+        response = self.client.get('/api/notifications/stream/', {'ticket': ticket.key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        response.close()
+        again = self.client.get('/api/notifications/stream/', {'ticket': ticket.key})
+        self.assertEqual(again.status_code, 401)
+
+
+class BrokerTests(SimpleTestCase):
+    def test_local_broker_delivers_to_subscribed_channels(self):
+        async def scenario():
+            broker = LocalBroker()
+            subscription = broker.subscribe([user_channel(1)])
+            other = broker.subscribe([user_channel(2)])
+            broker.publish([user_channel(1)], {'type': 'notification', 'data': {'id': 7}})
+            event = await subscription.get(timeout=1)
+            self.assertTrue(other.queue.empty())
+            subscription.close()
+            other.close()
+            self.assertEqual(broker._subscribers, {})
+            return event
+
+        self.assertEqual(asyncio.run(scenario())['data'], {'id': 7})
+
+    def test_postgres_broker_hands_notifications_to_local_subscribers(self):
+        async def scenario():
+            broker = PostgresBroker()
+            # Only the delivery side; publishing needs a PostgreSQL connection
+            subscription = LocalBroker.subscribe(broker, [user_channel(3)])
+            broker._deliver(json.dumps({
+                'channels': [user_channel(3)],
+                'event': {'type': 'message', 'data': {'id': 1}},
+            }))
+            event = await subscription.get(timeout=1)
+            subscription.close()
+            return event
+
+        self.assertEqual(asyncio.run(scenario())['type'], 'message')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, ALLOWED_HOSTS=['testserver'])
+class EventsApplicationTests(SimpleTestCase):
+    """The events process serves the stream and nothing else"""
+
+    def request(self, path):
+        from real_estate_platform.events import application
+
+        async def scenario():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                'headers': [(b'host', b'testserver')], 'http_version': '1.1', 'scheme': 'http',
+            })
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(timeout=5)
+            await communicator.wait(timeout=5)
+            return start['status']
+
+        return asyncio.run(scenario())
+
+    def test_other_paths_are_refused(self):
+        self.assertEqual(self.request('/api/properties/'), 404)
+        self.assertEqual(self.request('/api/documents/1/download/'), 404)
+
+    def test_stream_reaches_django(self):
+        # No ticket: answered by the stream view itself
+        self.assertEqual(self.request('/api/notifications/stream/'), 401)
@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import NotificationViewSet
+from .views import NotificationViewSet, event_stream, stream_ticket
 
 router = DefaultRouter()
 router.register(r'', NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    path('stream/', event_stream, name='notification-stream'),
+    path('stream/ticket/', stream_ticket, name='notification-stream-ticket'),
     path('', include(router.urls)),
 ]
 
@@ -1,9 +1,20 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Notification
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .models import Notification, StreamTicket
 from .serializers import NotificationSerializer
+from .realtime import get_broker, user_channel, format_sse
+
+# Seconds between keep-alive comments on an idle event stream
+STREAM_KEEPALIVE_SECONDS = 20
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
@@ -57,3 +68,67 @@ class NotificationViewSet(viewsets.ModelViewSet):
         deleted_count, _ = self.get_queryset().filter(is_read=True).delete()
         return Response({'deleted': deleted_count})
 
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def stream_ticket(request):
+    """Single-use ticket for opening the event stream with EventSource"""
+    ticket = StreamTicket.issue(request.user)
+    return Response(
+        {'ticket': ticket.key, 'expires_in': int(StreamTicket.LIFETIME.total_seconds())},
+        status=status.HTTP_201_CREATED
+    )
+
+
+def _authenticate_stream(request):
+    """
+    Resolve the user for an event stream: a ``?ticket=`` from stream_ticket
+    (browsers' EventSource cannot send headers) or a JWT Authorization header
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return StreamTicket.redeem(ticket)
+
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream pushing notifications and messages to the user
+    Query params:
+        - ticket: single-use ticket from POST stream/ticket/
+    """
+    user = await sync_to_async(_authenticate_stream)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    async def events():
+        # Subscribed only once the response is consumed, so a response that
+        # is never streamed holds no queue
+        subscription = get_broker().subscribe([user_channel(user.id)])
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
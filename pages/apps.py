@@ -5,3 +5,6 @@ class PagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pages'
 
+    def ready(self):
+        """Import signals when app is ready"""
+        import pages.signals
@@ -0,0 +1,9 @@
+"""
+Django signals retiring cached About page and team responses when their
+content changes
+"""
+from real_estate_platform.response_cache import invalidate_on_change
+from .models import AboutPage, TeamMember
+
+invalidate_on_change(AboutPage, 'pages')
+invalidate_on_change(TeamMember, 'pages')
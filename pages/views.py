@@ -1,6 +1,8 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from real_estate_platform.conditional import ConditionalGetMixin
+from real_estate_platform.response_cache import CachedResponseMixin, cache_response
 from .models import AboutPage, TeamMember
 from .serializers import (
     AboutPageSerializer,
@@ -23,7 +25,7 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         return request.user and request.user.is_authenticated and request.user.is_staff
 
 
-class AboutPageViewSet(viewsets.ModelViewSet):
+class AboutPageViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for About Page content.
     - GET: Anyone can view
@@ -32,18 +34,21 @@ class AboutPageViewSet(viewsets.ModelViewSet):
     """
     queryset = AboutPage.objects.all()
     permission_classes = [IsAdminOrReadOnly]
+    cache_tags = ('pages', 'users')
     
     def get_serializer_class(self):
         if self.action in ['update', 'partial_update']:
             return AboutPageUpdateSerializer
         return AboutPageSerializer
     
+    @cache_response
     def list(self, request, *args, **kwargs):
         """Get the About page content (singleton)"""
         instance = AboutPage.get_instance()
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
     
+    @cache_response
     def retrieve(self, request, *args, **kwargs):
         """Get the About page content by ID"""
         instance = AboutPage.get_instance()
@@ -93,6 +98,7 @@ class AboutPageViewSet(viewsets.ModelViewSet):
         )
     
     @action(detail=False, methods=['get'])
+    @cache_response
     def current(self, request):
         """Get current About page content"""
         instance = AboutPage.get_instance()
@@ -100,7 +106,7 @@ class AboutPageViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class TeamMemberViewSet(viewsets.ModelViewSet):
+class TeamMemberViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for Team Members.
     - GET: Anyone can view active members
@@ -109,6 +115,9 @@ class TeamMemberViewSet(viewsets.ModelViewSet):
     queryset = TeamMember.objects.filter(is_active=True)
     serializer_class = TeamMemberSerializer
     permission_classes = [IsAdminOrReadOnly]
+    # Staff also see inactive members
+    cache_tags = ('pages',)
+    cache_scope = 'role'
     
     def get_queryset(self):
         """Return active team members for public, all for admins"""
@@ -1,10 +1,15 @@
 from django.contrib import admin
-from .models import Property, PropertyImage, PropertyDocument, Transaction
+from .models import (
+    MarketIndexPoint, Place, Property, PropertyImage, PropertyDocument, PropertyImportJob, PropertyPrice,
+    SavedSearch, Transaction,
+)
 
 
 class PropertyImageInline(admin.TabularInline):
     model = PropertyImage
     extra = 1
+    fields = ['image', 'caption', 'is_primary', 'order', 'processing_status', 'width', 'height']
+    readonly_fields = ['processing_status', 'width', 'height']
 
 
 class PropertyDocumentInline(admin.TabularInline):
@@ -27,3 +32,50 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ['status', 'transaction_date']
     search_fields = ['property__title', 'buyer__email', 'seller__email']
     date_hierarchy = 'transaction_date'
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'state', 'country', 'latitude', 'longitude']
+    search_fields = ['name', 'state']
+    exclude = ['key', 'state_key']
+
+
+@admin.register(PropertyImportJob)
+class PropertyImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'file_format', 'status', 'processed_rows', 'created_count',
+                    'updated_count', 'error_count', 'created_at']
+    list_filter = ['status', 'file_format']
+    readonly_fields = ['processed_rows', 'created_count', 'updated_count', 'error_count', 'errors',
+                       'message', 'started_at', 'finished_at']
+
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'frequency', 'last_notified_at', 'created_at']
+    list_filter = ['frequency']
+    search_fields = ['name', 'user__email', 'query']
+    readonly_fields = ['last_notified_at']
+
+
+@admin.register(PropertyPrice)
+class PropertyPriceAdmin(admin.ModelAdmin):
+    """Price history is append-only"""
+
+    list_display = ['property', 'price', 'currency', 'source', 'city', 'property_type', 'recorded_at']
+    list_filter = ['source', 'property_type']
+    search_fields = ['property__title', 'city']
+    date_hierarchy = 'recorded_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MarketIndexPoint)
+class MarketIndexPointAdmin(admin.ModelAdmin):
+    list_display = ['city', 'property_type', 'currency', 'month', 'median_price', 'median_price_per_sqft', 'sample_count']
+    list_filter = ['property_type', 'currency']
+    search_fields = ['city']
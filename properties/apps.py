@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PropertiesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'properties'
+
+    def ready(self):
+        """Import signals and system checks when app is ready"""
+        import properties.checks
+        import properties.signals
@@ -0,0 +1,383 @@
+"""
+In-process compressed bitmap index over low-cardinality property attributes.
+
+Every attribute value (``property_type:residential``, ``city:abuja``,
+``bedrooms:3``, ``feature:pool``, ``agent:12`` ...) maps to the set of
+property ids having it, stored roaring-style: ids are split on their high
+16 bits into containers that are either Python sets of the low bits
+(sparse) or 65536-bit Python ints (dense), so AND/OR/NOT and counts run as native
+bitwise operations on machine words.
+
+The index is built from the database the first time a process searches,
+updated in place from Property signals, and rebuilt when another process
+has changed properties (a version counter in the shared cache) or after
+``MAX_AGE`` to pick up writes that bypass signals, such as bulk imports.
+The cache must be shared by all processes (``settings.SHARED_CACHE``),
+otherwise their changes only show up after ``MAX_AGE``.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+# A container switches from an id set to a bitmap above this many ids
+ARRAY_LIMIT = 4096
+# Rebuild at least this often (seconds)
+MAX_AGE = 300
+
+VERSION_KEY = 'properties:bitmap_index_version'
+
+BEDROOM_KEYS = ['0', '1', '2', '3', '4', '5+']
+BATHROOM_KEYS = ['0', '1', '2', '3', '4+']
+
+
+def _to_int(container):
+    if isinstance(container, int):
+        return container
+    bits = 0
+    for low in container:
+        bits |= 1 << low
+    return bits
+
+
+def _count(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _lows(container):
+    """Low 16 bits of the ids in a container, ascending"""
+    if not isinstance(container, int):
+        yield from sorted(container)
+        return
+    while container:
+        lowest = container & -container
+        yield lowest.bit_length() - 1
+        container ^= lowest
+
+
+def _compact(container):
+    """Container in its cheaper form, or None when empty"""
+    if isinstance(container, int):
+        if not container:
+            return None
+        if container.bit_count() <= ARRAY_LIMIT:
+            return set(_lows(container))
+        return container
+    if not container:
+        return None
+    if len(container) > ARRAY_LIMIT:
+        return _to_int(container)
+    return container
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return {low for low in a if b >> low & 1}
+    return a & b
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        return _to_int(a) | _to_int(b)
+    return a | b
+
+
+def _andnot(a, b):
+    if isinstance(a, int):
+        return a & ~_to_int(b)
+    if isinstance(b, int):
+        return {low for low in a if not b >> low & 1}
+    return a - b
+
+
+class Bitmap:
+    """Set of non-negative integers in 65536-id containers"""
+
+    __slots__ = ['containers']
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        bitmap = cls()
+        for id_ in ids:
+            bitmap.add(id_)
+        return bitmap
+
+    def add(self, id_):
+        high, low = id_ >> 16, id_ & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = {low}
+        elif isinstance(container, int):
+            self.containers[high] = container | (1 << low)
+        else:
+            container.add(low)
+            if len(container) > ARRAY_LIMIT:
+                self.containers[high] = _to_int(container)
+
+    def discard(self, id_):
+        high, low = id_ >> 16, id_ & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container &= ~(1 << low)
+        else:
+            container.discard(low)
+        container = _compact(container)
+        if container is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = container
+
+    def __contains__(self, id_):
+        container = self.containers.get(id_ >> 16)
+        if container is None:
+            return False
+        low = id_ & 0xFFFF
+        return bool(container >> low & 1) if isinstance(container, int) else low in container
+
+    def __len__(self):
+        return sum(_count(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __and__(self, other):
+        small, large = sorted((self.containers, other.containers), key=len)
+        result = {}
+        for high, container in small.items():
+            if high in large:
+                merged = _compact(_and(container, large[high]))
+                if merged is not None:
+                    result[high] = merged
+        return Bitmap(result)
+
+    def __or__(self, other):
+        result = {high: container if isinstance(container, int) else set(container)
+                  for high, container in self.containers.items()}
+        for high, container in other.containers.items():
+            result[high] = _compact(_or(result[high], container)) if high in result else (
+                container if isinstance(container, int) else set(container)
+            )
+        return Bitmap(result)
+
+    def __sub__(self, other):
+        result = {}
+        for high, container in self.containers.items():
+            if high in other.containers:
+                remaining = _compact(_andnot(container, other.containers[high]))
+            else:
+                remaining = container if isinstance(container, int) else set(container)
+            if remaining is not None:
+                result[high] = remaining
+        return Bitmap(result)
+
+    def copy(self):
+        return self | Bitmap()
+
+    def count_and(self, other):
+        """len(self & other) without building the result"""
+        small, large = sorted((self.containers, other.containers), key=len)
+        return sum(
+            _count(_and(container, large[high]))
+            for high, container in small.items() if high in large
+        )
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            base = high << 16
+            for low in _lows(self.containers[high]):
+                yield base | low
+
+    def descending(self):
+        for high in sorted(self.containers, reverse=True):
+            base = high << 16
+            for low in reversed(list(_lows(self.containers[high]))):
+                yield base | low
+
+
+def _bucket(value, keys):
+    if value is None or value < 0:
+        return None
+    return keys[min(int(value), len(keys) - 1)]
+
+
+def attribute_keys(property_type, status, city, state, bedrooms, bathrooms, agent_id, features):
+    """Index keys of one property"""
+    keys = [f'property_type:{property_type}', f'status:{status}']
+    if city:
+        keys.append(f'city:{city.lower()}')
+    if state:
+        keys.append(f'state:{state.lower()}')
+    bedroom_key = _bucket(bedrooms, BEDROOM_KEYS)
+    if bedroom_key is not None:
+        keys.append(f'bedrooms:{bedroom_key}')
+    bathroom_key = _bucket(bathrooms, BATHROOM_KEYS)
+    if bathroom_key is not None:
+        keys.append(f'bathrooms:{bathroom_key}')
+    if agent_id:
+        keys.append(f'agent:{agent_id}')
+    if isinstance(features, dict):
+        keys.extend(f'feature:{key}' for key, value in features.items() if value is not False)
+    return keys
+
+
+INDEXED_COLUMNS = ['id', 'property_type', 'status', 'city', 'state', 'bedrooms', 'bathrooms', 'agent_id', 'features']
+
+
+def instance_keys(instance):
+    return attribute_keys(*(getattr(instance, column) for column in INDEXED_COLUMNS[1:]))
+
+
+def instance_labels(instance):
+    """(key, original spelling) of a property's city and state"""
+    return [(f'{name}:{getattr(instance, name).lower()}', getattr(instance, name))
+            for name in ('city', 'state') if getattr(instance, name)]
+
+
+class PropertyBitmapIndex:
+    """Attribute bitmaps of all properties in this process"""
+
+    def __init__(self):
+        # Held while reading bitmaps too, since updates change them in place
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.bitmaps = {}
+            # Original spelling of normalized city and state keys
+            self.labels = {}
+            self.keys = {}  # property id -> tuple of keys
+            self.universe = Bitmap()
+            self.version = None
+            self.loaded_at = None
+
+    def _build(self):
+        from .models import Property
+
+        version = cache.get_or_set(VERSION_KEY, time.time_ns, None)
+        bitmaps, labels, keys, universe = {}, {}, {}, Bitmap()
+        rows = Property.objects.order_by().values_list(*INDEXED_COLUMNS).iterator(chunk_size=5000)
+        for id_, *values in rows:
+            row_keys = attribute_keys(*values)
+            keys[id_] = tuple(row_keys)
+            universe.add(id_)
+            for key in row_keys:
+                bitmap = bitmaps.get(key)
+                if bitmap is None:
+                    bitmap = bitmaps[key] = Bitmap()
+                bitmap.add(id_)
+            for name, label in (('city', values[2]), ('state', values[3])):
+                if label:
+                    labels.setdefault(f'{name}:{label.lower()}', label)
+
+        self.bitmaps, self.labels, self.keys, self.universe = bitmaps, labels, keys, universe
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def ensure_current(self):
+        with self.lock:
+            stale = (
+                self.version is None
+                or time.monotonic() - self.loaded_at > MAX_AGE
+                or cache.get(VERSION_KEY) != self.version
+            )
+            if stale:
+                self._build()
+
+    def _bump_version(self):
+        """Announce a change; stay current if no other process changed anything meanwhile"""
+        # add() then incr() are each atomic, so concurrent bumps never
+        # share a version; a lost counter restarts above any earlier value
+        if cache.add(VERSION_KEY, time.time_ns(), None):
+            version = None
+        else:
+            try:
+                version = cache.incr(VERSION_KEY)
+            except ValueError:
+                cache.add(VERSION_KEY, time.time_ns(), None)
+                version = None
+        if self.version is not None:
+            self.version = version if version == self.version + 1 else None
+
+    def update(self, property_id, keys, labels=()):
+        self._apply(property_id, keys, labels)
+
+    def remove(self, property_id):
+        self._apply(property_id, None)
+
+    def _apply(self, property_id, keys, labels=()):
+        """Move a property to new keys, or out of the index if keys is None"""
+        with self.lock:
+            if self.version is not None:
+                old = set(self.keys.get(property_id, ()))
+                new = set(keys or ())
+                for key in old - new:
+                    bitmap = self.bitmaps.get(key)
+                    if bitmap is not None:
+                        bitmap.discard(property_id)
+                        if not bitmap:
+                            del self.bitmaps[key]
+                for key in new - old:
+                    self.bitmaps.setdefault(key, Bitmap()).add(property_id)
+                for key, label in labels:
+                    self.labels.setdefault(key, label)
+                if keys is None:
+                    self.keys.pop(property_id, None)
+                    self.universe.discard(property_id)
+                else:
+                    self.keys[property_id] = tuple(keys)
+                    self.universe.add(property_id)
+            self._bump_version()
+
+    def invalidate(self):
+        """Make every process rebuild, after writes that bypass signals"""
+        with self.lock:
+            self._bump_version()
+            self.version = None
+
+    def bitmap(self, key):
+        return self.bitmaps.get(key) or Bitmap()
+
+    def values(self, name):
+        """(value, bitmap) for every indexed value of an attribute"""
+        prefix = f'{name}:'
+        return [(key[len(prefix):], bitmap) for key, bitmap in self.bitmaps.items() if key.startswith(prefix)]
+
+    def label(self, key):
+        return self.labels.get(key, key.split(':', 1)[1])
+
+    def evaluate(self, expression):
+        """
+        Ids matching an expression: an index key, or ('and' | 'or', expr, ...),
+        or ('not', expr); an empty 'and' matches every property
+        """
+        if isinstance(expression, str):
+            return self.bitmap(expression)
+        operator, *operands = expression
+        if operator == 'not':
+            return self.universe - self.evaluate(operands[0])
+        if operator == 'or':
+            result = Bitmap()
+            for operand in operands:
+                result = result | self.evaluate(operand)
+            return result
+        if operator == 'and':
+            result = self.universe.copy()
+            for operand in sorted((self.evaluate(operand) for operand in operands), key=len):
+                result = result & operand
+                if not result:
+                    break
+            return result
+        raise ValueError(f'Unknown operator {operator!r}')
+
+
+property_index = PropertyBitmapIndex()
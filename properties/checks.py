@@ -0,0 +1,33 @@
+"""
+System checks for the in-process property indexes and recommender
+"""
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+
+@register()
+def bitmap_index_cache_check(app_configs, **kwargs):
+    """Index version counters in a per-process cache never reach other processes"""
+    if settings.PROPERTY_BITMAP_INDEX and not settings.SHARED_CACHE and not settings.DEBUG:
+        return [Error(
+            'PROPERTY_BITMAP_INDEX needs a cache shared by all processes: with the local-memory '
+            'cache, facet counts in one process ignore changes made by the others for up to '
+            'properties.bitmaps.MAX_AGE seconds.',
+            hint='Set CACHE_URL to a shared backend (e.g. redis://host:6379/1) or PROPERTY_BITMAP_INDEX=False.',
+            id='properties.E001',
+        )]
+    return []
+
+
+@register()
+def recommender_cache_check(app_configs, **kwargs):
+    """The recommender follows other processes' changes through the same kind of counter"""
+    if not settings.SHARED_CACHE and not settings.DEBUG:
+        return [Warning(
+            'The cache is not shared by all processes: similar listings and client matches in '
+            'one process ignore listing and interest changes made by the others for up to '
+            'properties.recommendations.MAX_AGE seconds.',
+            hint='Set CACHE_URL to a shared backend (e.g. redis://host:6379/1).',
+            id='properties.W001',
+        )]
+    return []
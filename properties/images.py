@@ -0,0 +1,276 @@
+"""
+Property image derivatives.
+
+Each uploaded photo is decoded once, rotated according to its EXIF
+orientation and re-encoded as thumbnail, medium and large WebP and JPEG
+files without the EXIF block (camera details, GPS position). Its
+dimensions and a blurhash placeholder are recorded on the row. Work runs
+on a thread pool after the upload commits (Pillow releases the GIL while
+decoding and resampling); ``manage.py process_property_images`` handles
+images left pending by a restart or with ``IMAGE_PROCESSING_WORKERS=0``.
+"""
+import io
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import ExifTags, Image, ImageOps
+from real_estate_platform.response_cache import invalidate_tags
+
+logger = logging.getLogger(__name__)
+
+# Widest edge of each derivative, smallest first
+DERIVATIVE_WIDTHS = {
+    'thumbnail': 320,
+    'medium': 800,
+    'large': 1600,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_DIR = 'properties/derivatives'
+
+MAX_BULK_IMAGES = 50
+# Originals are written to storage concurrently; I/O bound, so threads suffice
+UPLOAD_THREADS = 8
+
+
+# Blurhash (https://blurha.sh), encoded from a 32px copy of the image
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+_BLURHASH_SAMPLE = 32
+
+
+def _base83(value, length):
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """Blurhash string of a PIL image"""
+    sample = image.convert('RGB')
+    sample.thumbnail((_BLURHASH_SAMPLE, _BLURHASH_SAMPLE))
+    width, height = sample.size
+    linear = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in sample.getdata()]
+
+    components = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pixel = linear[row + x]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            components.append((r * scale, g * scale, b * scale))
+
+    dc, ac = components[0], components[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(channel) for component in ac for channel in component)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += _base83(0, 1)
+
+    result += _base83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    for component in ac:
+        r, g, b = (
+            max(0, min(18, int(_sign_pow(channel / maximum, 0.5) * 9 + 9.5)))
+            for channel in component
+        )
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def _flatten(image):
+    """RGB copy for JPEG, with transparent areas on white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if fmt == 'jpeg':
+        image = _flatten(image)
+    buffer = io.BytesIO()
+    # No exif= argument: the metadata of the original is not copied
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def render_derivatives(source):
+    """
+    Decode an image file and return (width, height, blurhash, {size: (w, h, {format: bytes})})
+    """
+    image = Image.open(source)
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        width, height = height, width
+    # Let the JPEG decoder scale down while decoding
+    image.draft('RGB', (DERIVATIVE_WIDTHS['large'], DERIVATIVE_WIDTHS['large']))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+
+    # No upscaling: a size is only made if the original is larger than the size below it
+    edges = sorted(DERIVATIVE_WIDTHS.values())
+    wanted = {
+        size: edge for size, edge in DERIVATIVE_WIDTHS.items()
+        if edge == edges[0] or max(width, height) > edges[edges.index(edge) - 1]
+    }
+
+    rendered = {}
+    current = image
+    # Largest first, each size resampled from the previous one
+    for size, edge in sorted(wanted.items(), key=lambda item: -item[1]):
+        if max(current.size) > edge:
+            scale = edge / max(current.size)
+            current = current.resize(
+                (max(1, round(current.width * scale)), max(1, round(current.height * scale))),
+                Image.Resampling.LANCZOS, reducing_gap=3.0
+            )
+        rendered[size] = (current.width, current.height, {fmt: _encode(current, fmt) for fmt in FORMATS})
+
+    return width, height, blurhash(current), rendered
+
+
+def save_originals(instance, uploads):
+    """
+    Store uploaded photos for PropertyImage rows in parallel; returns, in
+    order, the stored name or the exception raised for each upload
+    """
+    field = instance._meta.get_field('image')
+
+    def save(upload):
+        try:
+            return field.storage.save(field.generate_filename(instance, upload.name), upload)
+        except Exception as error:
+            logger.exception('Could not store property image %s', upload.name)
+            return error
+
+    if len(uploads) <= 1:
+        return [save(upload) for upload in uploads]
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_THREADS, len(uploads))) as executor:
+        return list(executor.map(save, uploads))
+
+
+def delete_derivatives(storage, derivatives):
+    for variant in (derivatives or {}).values():
+        for fmt in FORMATS:
+            if variant.get(fmt):
+                storage.delete(variant[fmt])
+
+
+def process_image(image_id, force=False):
+    """
+    Generate the derivatives of one PropertyImage; returns False if it was
+    not pending (or was replaced while processing), unless ``force``
+    """
+    from .models import PropertyImage
+
+    claimable = PropertyImage.objects.filter(id=image_id)
+    if not force:
+        claimable = claimable.filter(processing_status='pending')
+    if not claimable.update(processing_status='processing'):
+        return False
+
+    image = PropertyImage.objects.get(id=image_id)
+    name = image.image.name
+    storage = image.image.storage
+    try:
+        with storage.open(name, 'rb') as source:
+            width, height, placeholder, rendered = render_derivatives(source)
+
+        derivatives = {}
+        for size, (derivative_width, derivative_height, encoded) in rendered.items():
+            derivatives[size] = {'width': derivative_width, 'height': derivative_height}
+            for fmt, content in encoded.items():
+                derivatives[size][fmt] = storage.save(
+                    f'{DERIVATIVE_DIR}/{image_id}/{size}.{fmt}', ContentFile(content)
+                )
+    except Exception:
+        logger.exception('Could not process property image %s', image_id)
+        PropertyImage.objects.filter(id=image_id, image=name).update(processing_status='failed')
+        return False
+
+    # Only store the result if the photo was not replaced meanwhile
+    updated = PropertyImage.objects.filter(id=image_id, image=name).update(
+        width=width, height=height, blurhash=placeholder,
+        derivatives=derivatives, processing_status='ready',
+    )
+    if updated:
+        delete_derivatives(storage, image.derivatives)
+        # QuerySet.update sends no signals
+        invalidate_tags('properties')
+    else:
+        delete_derivatives(storage, derivatives)
+    return bool(updated)
+
+
+class ImageWorkerPool:
+    """Thread pool processing images in the background of the web process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, image_id):
+        workers = getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2)
+        if workers <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='property-images')
+        self._executor.submit(self._run, image_id)
+
+    @staticmethod
+    def _run(image_id):
+        close_old_connections()
+        try:
+            process_image(image_id)
+        finally:
+            close_old_connections()
+
+
+worker_pool = ImageWorkerPool()
+
+
+def queue_derivatives(image_ids):
+    """Process the images once the current transaction commits"""
+    image_ids = list(image_ids)
+    transaction.on_commit(lambda: [worker_pool.submit(image_id) for image_id in image_ids])
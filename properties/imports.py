@@ -0,0 +1,311 @@
+"""
+Bulk property import and export.
+
+Import files (CSV, JSON array or JSON Lines, XLSX) are read row by row and
+handled in batches of ``BATCH_SIZE``: every row is validated against the
+model fields, missing coordinates are looked up in the local gazetteer
+(``Place``) with one query per batch, and rows are upserted on
+(agent, external_ref) with one ``INSERT ... ON CONFLICT DO UPDATE``. Rows
+that fail validation are reported with their row number and do not stop
+the import. Jobs are run by ``manage.py import_properties --loop``.
+
+Exports stream the same columns, so an export can be edited and imported
+back.
+"""
+import csv
+import io
+import itertools
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from real_estate_platform.response_cache import invalidate_tags
+from users.models import User
+from .bitmaps import property_index
+from .market import MARKET_FIELDS, market_values, record_prices
+from .models import Place, Property, PropertyImportJob
+from .recommendations import recommender
+from .saved_searches import match_listings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FIELDS = [
+    'external_ref', 'title', 'description', 'property_type', 'address', 'city',
+    'state', 'country', 'postal_code', 'latitude', 'longitude', 'price',
+    'currency', 'size_sqft', 'size_sqm', 'bedrooms', 'bathrooms', 'year_built',
+    'parking_spaces', 'status', 'features',
+]
+UPDATE_FIELDS = [name for name in IMPORT_FIELDS if name != 'external_ref'] + ['updated_at']
+EXPORT_COLUMNS = IMPORT_FIELDS + ['agent_email']
+
+_COORDINATE = Decimal('0.000001')
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return {'csv': 'csv', 'json': 'json', 'jsonl': 'json', 'ndjson': 'json', 'xlsx': 'xlsx'}.get(extension)
+
+
+def _column(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+
+def read_rows(file, file_format):
+    """Yield (row number, {column: raw value}) from an open binary file"""
+    if file_format == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+        reader.fieldnames = [_column(name) for name in reader.fieldnames or []]
+        # Row 1 is the header
+        yield from enumerate(reader, start=2)
+
+    elif file_format == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [_column(name) for name in next(rows, ())]
+            for number, values in enumerate(rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    yield number, dict(zip(header, values))
+        finally:
+            workbook.close()
+
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig')
+        first = text.read(1)
+        start = 1
+        while first.isspace():
+            start += first == '\n'
+            first = text.read(1)
+        if first == '[':
+            # A JSON array has to be parsed whole; JSON Lines streams
+            for number, item in enumerate(json.loads(first + text.read()), start=1):
+                yield number, {_column(key): value for key, value in item.items()}
+        else:
+            lines = itertools.chain([first + text.readline()], text)
+            for number, line in enumerate(lines, start=start):
+                if line.strip():
+                    yield number, {_column(key): value for key, value in json.loads(line).items()}
+
+
+def clean_row(raw):
+    """Model values for one raw row, and {field: [messages]} for invalid ones"""
+    values = {}
+    errors = {}
+    for name in IMPORT_FIELDS:
+        field = Property._meta.get_field(name)
+        value = raw.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            if field.has_default():
+                values[name] = field.get_default()
+                continue
+            if field.null:
+                values[name] = None
+                continue
+            value = ''
+        try:
+            if name == 'features' and isinstance(value, str):
+                value = json.loads(value)
+            elif name in ('latitude', 'longitude'):
+                value = Decimal(str(value)).quantize(_COORDINATE)
+            values[name] = field.clean(value, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+        except (ValueError, InvalidOperation):
+            errors[name] = ['Enter a valid value.']
+    return values, errors
+
+
+class PropertyImporter:
+    """Validates and upserts rows for one import job, a batch at a time"""
+
+    def __init__(self, job):
+        self.job = job
+        self.user = job.user
+
+    def run(self):
+        job = self.job
+        try:
+            with job.file.open('rb') as file:
+                batch = []
+                for number, raw in read_rows(file, job.file_format):
+                    batch.append((number, raw))
+                    if len(batch) >= BATCH_SIZE:
+                        self.process_batch(batch)
+                        batch = []
+                if batch:
+                    self.process_batch(batch)
+        except Exception as error:
+            logger.exception('Property import %s failed', job.id)
+            job.status = 'failed'
+            job.message = f'Import stopped after {job.processed_rows} rows: {error}'
+        else:
+            job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'message', 'finished_at'])
+        return job
+
+    def _agents(self, batch):
+        """Agent id per row: the importer, or for staff the row's ``agent_email``"""
+        emails = set()
+        if self.user.is_staff:
+            emails = {str(raw.get('agent_email') or '').strip().lower() for _, raw in batch} - {''}
+        known = dict(
+            User.objects.filter(email__in=emails).values_list('email', 'id')
+        ) if emails else {}
+        return {email.lower(): user_id for email, user_id in known.items()}
+
+    def process_batch(self, batch):
+        agents = self._agents(batch)
+        valid = []
+        errors = []
+        for number, raw in batch:
+            values, row_errors = clean_row(raw)
+            agent_id = self.user.id
+            email = str(raw.get('agent_email') or '').strip().lower()
+            if email and self.user.is_staff:
+                agent_id = agents.get(email)
+                if agent_id is None:
+                    row_errors['agent_email'] = [f'No user with email {email}.']
+            if row_errors:
+                errors.append({'row': number, 'errors': row_errors})
+            else:
+                valid.append((agent_id, values))
+
+        self._geocode(valid)
+        created, updated = self._upsert(valid)
+
+        job = self.job
+        job.processed_rows += len(batch)
+        job.created_count += created
+        job.updated_count += updated
+        job.error_count += len(errors)
+        room = MAX_REPORTED_ERRORS - len(job.errors)
+        if room > 0:
+            job.errors.extend(errors[:room])
+        job.save(update_fields=['processed_rows', 'created_count', 'updated_count', 'error_count', 'errors'])
+
+    @staticmethod
+    def _geocode(rows):
+        missing = [values for _, values in rows if values['latitude'] is None or values['longitude'] is None]
+        if not missing:
+            return
+        found = Place.lookup({(values['city'], values['state']) for values in missing})
+        for values in missing:
+            coordinates = found.get((values['city'], values['state']))
+            if coordinates:
+                values['latitude'], values['longitude'] = coordinates
+
+    @staticmethod
+    def _upsert(rows):
+        """Insert or update the rows; returns (created, updated)"""
+        keyed = {}
+        unkeyed = []
+        for agent_id, values in rows:
+            listing = Property(agent_id=agent_id, **values)
+            if values['external_ref']:
+                # A reference repeated within the batch: the last row wins
+                keyed[(agent_id, values['external_ref'])] = listing
+            else:
+                unkeyed.append(listing)
+
+        existing = {}
+        if keyed:
+            existing = {
+                (agent_id, ref): tuple(values) for agent_id, ref, *values in Property.objects.filter(
+                    agent_id__in={agent_id for agent_id, _ in keyed},
+                    external_ref__in={ref for _, ref in keyed},
+                ).values_list('agent_id', 'external_ref', *MARKET_FIELDS)
+            }
+
+        with transaction.atomic():
+            if keyed:
+                Property.objects.bulk_create(
+                    list(keyed.values()), update_conflicts=True,
+                    unique_fields=['agent', 'external_ref'], update_fields=UPDATE_FIELDS,
+                )
+            if unkeyed:
+                Property.objects.bulk_create(unkeyed)
+            # New listings and changed prices, places and sizes go into the price history
+            record_prices([
+                *(listing for key, listing in keyed.items() if existing.get(key) != market_values(listing)),
+                *unkeyed,
+            ], 'import')
+            # bulk_create sends no signals
+            transaction.on_commit(property_index.invalidate)
+            transaction.on_commit(recommender.invalidate)
+            transaction.on_commit(lambda: invalidate_tags('properties'))
+            listings = [*keyed.values(), *unkeyed]
+            transaction.on_commit(lambda: match_listings(listings))
+
+        updated = len(existing.keys() & keyed.keys())
+        return len(keyed) + len(unkeyed) - updated, updated
+
+
+def claim_next_job():
+    """Mark the oldest pending job as running, skipping jobs other workers hold"""
+    with transaction.atomic():
+        job = PropertyImportJob.objects.select_for_update(skip_locked=True) \
+            .filter(status='pending').order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def export_rows(queryset):
+    """Header then one list of values per property, read in chunks"""
+    yield EXPORT_COLUMNS
+    columns = IMPORT_FIELDS + ['agent__email']
+    for row in queryset.order_by('id').values_list(*columns).iterator(chunk_size=2000):
+        yield list(row)
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(queryset):
+    writer = csv.writer(_Echo())
+    for row in export_rows(queryset):
+        yield writer.writerow([_text(value) for value in row])
+
+
+def export_json_lines(queryset):
+    rows = export_rows(queryset)
+    header = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=str) + '\n'
+
+
+def export_xlsx(queryset, file):
+    """Write an XLSX export to an open binary file"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Properties')
+    for row in export_rows(queryset):
+        sheet.append([
+            json.dumps(value) if isinstance(value, (dict, list)) else value for value in row
+        ])
+    workbook.save(file)
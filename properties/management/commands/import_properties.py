@@ -0,0 +1,64 @@
+"""
+Management command to run property imports
+Usage: python manage.py import_properties [--loop] | import_properties FILE --user EMAIL
+"""
+import os
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from properties.imports import PropertyImporter, claim_next_job, detect_format
+from properties.models import PropertyImportJob
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Run queued property import jobs, or import a local file directly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='CSV, JSON (Lines) or XLSX file to import now')
+        parser.add_argument('--user', help='Email of the user the listings are imported for (with FILE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking for queued imports every --interval seconds')
+        parser.add_argument('--interval', type=int, default=10,
+                            help='Seconds between checks when running with --loop')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            self.run_job(self.create_job(options['file'], options['user']))
+            return
+
+        while True:
+            job = claim_next_job()
+            while job is not None:
+                self.run_job(job)
+                job = claim_next_job()
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def create_job(self, path, email):
+        file_format = detect_format(path)
+        if file_format is None:
+            raise CommandError('FILE must be a .csv, .json, .jsonl or .xlsx file')
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError('--user must be the email of an existing user')
+
+        with open(path, 'rb') as file:
+            return PropertyImportJob.objects.create(
+                user=user, file=File(file, name=os.path.basename(path)),
+                file_format=file_format, status='running',
+            )
+
+    def run_job(self, job):
+        job = PropertyImporter(job).run()
+        style = self.style.SUCCESS if job.status == 'completed' else self.style.ERROR
+        self.stdout.write(style(
+            f'Import {job.id} {job.status}: {job.processed_rows} rows, {job.created_count} created, '
+            f'{job.updated_count} updated, {job.error_count} with errors'
+        ))
+        if job.message:
+            self.stdout.write(job.message)
@@ -0,0 +1,50 @@
+"""
+Management command to load places used to geocode imported listings
+Usage: python manage.py load_gazetteer FILE.csv   (columns: name, state, country, latitude, longitude)
+"""
+import csv
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from properties.models import Place
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Load or update gazetteer places from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV with name, state, country, latitude and longitude columns')
+
+    def handle(self, *args, **options):
+        loaded = 0
+        batch = []
+        with open(options['file'], newline='', encoding='utf-8-sig') as file:
+            for row in csv.DictReader(file):
+                place = Place(
+                    name=row['name'].strip(),
+                    state=(row.get('state') or '').strip(),
+                    country=(row.get('country') or '').strip(),
+                    latitude=Decimal(row['latitude']).quantize(Decimal('0.000001')),
+                    longitude=Decimal(row['longitude']).quantize(Decimal('0.000001')),
+                )
+                # bulk_create skips save(), which fills in the keys
+                place.key = Place.normalize(place.name)
+                place.state_key = Place.normalize(place.state)
+                batch.append(place)
+                if len(batch) >= BATCH_SIZE:
+                    loaded += self.save(batch)
+                    batch = []
+        loaded += self.save(batch)
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} place(s)'))
+
+    @staticmethod
+    def save(batch):
+        # The last row wins for a place listed twice
+        unique = list({(place.key, place.state_key): place for place in batch}.values())
+        Place.objects.bulk_create(
+            unique, update_conflicts=True, unique_fields=['key', 'state_key'],
+            update_fields=['name', 'state', 'country', 'latitude', 'longitude'],
+        )
+        return len(unique)
@@ -0,0 +1,30 @@
+"""
+Management command to notify users of new listings matching their saved searches
+Usage: python manage.py notify_saved_searches [--batch-size N] [--loop]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from properties.saved_searches import DEFAULT_BATCH_SIZE, dispatch_due_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send notifications for listings that matched saved searches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Matches claimed per batch')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking for new matches every --interval seconds')
+        parser.add_argument('--interval', type=int, default=60,
+                            help='Seconds between checks when running with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = dispatch_due_notifications(batch_size=options['batch_size'])
+            if sent:
+                self.stdout.write(self.style.SUCCESS(f'Notified {sent} saved search match(es)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
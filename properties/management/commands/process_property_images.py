@@ -0,0 +1,41 @@
+"""
+Management command to generate missing property image derivatives
+Usage: python manage.py process_property_images [--all] [--retry-failed] [--loop]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from properties.images import process_image
+from properties.models import PropertyImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails, WebP/JPEG sizes and blurhashes for property images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate derivatives of every image, e.g. after changing sizes')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry images whose processing failed')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, checking for pending images every --interval seconds')
+        parser.add_argument('--interval', type=int, default=30,
+                            help='Seconds between checks when running with --loop')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            PropertyImage.objects.update(processing_status='pending')
+
+        while True:
+            if options['retry_failed']:
+                PropertyImage.objects.filter(processing_status='failed').update(processing_status='pending')
+            pending = PropertyImage.objects.filter(processing_status='pending') \
+                .order_by('id').values_list('id', flat=True)
+
+            processed = sum(1 for image_id in pending.iterator() if process_image(image_id))
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f'Processed {processed} image(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+"""
+Management command to recompute the monthly market index from the price history
+Usage: python manage.py rebuild_market_index [--backfill]
+"""
+from django.core.management.base import BaseCommand
+from django.db.models.functions import TruncMonth
+from properties.market import refresh_month, size_sqft
+from properties.models import MarketIndexPoint, Property, PropertyPrice
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Recompute every month of the market index, optionally backfilling price history first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Record the current price of listings without any history, dated their creation')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Backfilled {self.backfill()} listing price(s)')
+
+        months = sorted({
+            month.date() for month in PropertyPrice.objects.order_by()
+            .annotate(month=TruncMonth('recorded_at')).values_list('month', flat=True).distinct()
+        })
+        MarketIndexPoint.objects.exclude(month__in=months).delete()
+        points = sum(refresh_month(month) for month in months)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {points} index point(s) over {len(months)} month(s)'))
+
+    def backfill(self):
+        listings = Property.objects.filter(price_history__isnull=True).order_by('id')
+        created = 0
+        batch = []
+        for listing in listings.iterator(chunk_size=BATCH_SIZE):
+            batch.append(PropertyPrice(
+                property=listing, price=listing.price, currency=listing.currency, source='listing',
+                city=listing.city, property_type=listing.property_type,
+                size_sqft=size_sqft(listing), recorded_at=listing.created_at,
+            ))
+            if len(batch) >= BATCH_SIZE:
+                created += len(PropertyPrice.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(PropertyPrice.objects.bulk_create(batch))
+        return created
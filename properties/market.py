@@ -0,0 +1,231 @@
+"""
+Listing price history and the monthly market index.
+
+Every listing price (on creation, on each change, on import and when a
+sale completes) is appended to ``PropertyPrice`` together with the
+listing's currency, city, type and size at that moment; a listing moved
+to another city or type, or resized, is recorded again. ``MarketIndexPoint``
+holds, per city, type, currency and month, the median price and median
+price per square foot of the listings priced that month (a listing counts
+once, with its last price of the month), plus roll-ups over all cities
+and/or all types. Prices in different currencies are never mixed: every
+currency has its own cells.
+
+Appending prices marks the cells of their month stale, including the cells
+the listings counted in earlier that month, and deleting a listing marks
+the cells of every month it counted in; the cells are recomputed once the
+write commits, reading only that month's history rows. Charts and the
+market analysis report read the stored points.
+``manage.py rebuild_market_index`` recomputes everything and can backfill
+history for listings that predate it.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time
+from decimal import Decimal
+from statistics import median
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import MarketIndexPoint, Place, PropertyPrice
+
+_CENT = Decimal('0.01')
+
+# Listing fields copied into the history; a save changing one is recorded
+MARKET_FIELDS = ['price', 'currency', 'city', 'property_type', 'size_sqft', 'size_sqm']
+
+
+def month_start(moment):
+    moment = timezone.localtime(moment) if isinstance(moment, datetime) else moment
+    return date(moment.year, moment.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _bounds(month):
+    zone = timezone.get_current_timezone()
+    return (
+        datetime.combine(month, time.min, tzinfo=zone),
+        datetime.combine(_next_month(month), time.min, tzinfo=zone),
+    )
+
+
+def cell_keys(city, property_type, currency):
+    """The index cells a listing counts in: its own and the three roll-ups"""
+    city_key = Place.normalize(city)
+    return [
+        (city_key, property_type, currency), (city_key, '', currency),
+        ('', property_type, currency), ('', '', currency),
+    ]
+
+
+def market_values(listing):
+    """Values of a listing's ``MARKET_FIELDS`` (None where deferred)"""
+    return tuple(listing.__dict__.get(field) for field in MARKET_FIELDS)
+
+
+def size_sqft(listing):
+    if listing.size_sqft:
+        return listing.size_sqft
+    if listing.size_sqm:
+        return (listing.size_sqm * Decimal('10.7639')).quantize(_CENT)
+    return None
+
+
+def record_prices(entries, source):
+    """
+    Append the current price of each listing (or ``(listing, price)``
+    pairs) to the history and refresh the index cells after commit
+    """
+    now = timezone.now()
+    rows = []
+    for entry in entries:
+        listing, price = entry if isinstance(entry, tuple) else (entry, entry.price)
+        rows.append(PropertyPrice(
+            property_id=listing.pk, price=price, currency=listing.currency, source=source,
+            city=listing.city, property_type=listing.property_type,
+            size_sqft=size_sqft(listing), recorded_at=now,
+        ))
+    if not rows:
+        return
+    month = month_start(now)
+    # Cells the listings counted in so far this month, which they may leave
+    earlier = PropertyPrice.objects.filter(
+        property_id__in={row.property_id for row in rows}, recorded_at__gte=_bounds(month)[0],
+    ).values_list('city', 'property_type', 'currency').distinct()
+    cells = {key for values in earlier for key in cell_keys(*values)}
+    PropertyPrice.objects.bulk_create(rows)
+
+    cells.update(key for row in rows for key in cell_keys(row.city, row.property_type, row.currency))
+    transaction.on_commit(lambda: refresh_month(month, cells))
+
+
+def forget_listings(property_ids):
+    """
+    Refresh, after commit, every month and cell the listings counted in;
+    call before deleting them, while their history still exists
+    """
+    months = defaultdict(set)
+    rows = PropertyPrice.objects.filter(property_id__in=property_ids) \
+        .values_list('recorded_at', 'city', 'property_type', 'currency')
+    for recorded_at, *values in rows.iterator(chunk_size=5000):
+        months[month_start(recorded_at)].update(cell_keys(*values))
+
+    def refresh():
+        for month, cells in months.items():
+            refresh_month(month, cells)
+
+    if months:
+        transaction.on_commit(refresh)
+
+
+def _median(values):
+    return Decimal(median(values)).quantize(_CENT) if values else None
+
+
+def refresh_month(month, cells=None):
+    """
+    Recompute the index cells of one month from its history rows; all
+    cells of the month when ``cells`` ({(city key, type, currency)}) is None
+    """
+    start, end = _bounds(month)
+    latest = {}
+    rows = PropertyPrice.objects.filter(recorded_at__gte=start, recorded_at__lt=end) \
+        .order_by('recorded_at', 'id') \
+        .values_list('property_id', 'city', 'property_type', 'currency', 'price', 'size_sqft')
+    for property_id, *values in rows.iterator(chunk_size=5000):
+        latest[property_id] = values
+
+    prices = defaultdict(list)
+    per_sqft = defaultdict(list)
+    labels = {}
+    for city, property_type, currency, price, size in latest.values():
+        for key in cell_keys(city, property_type, currency):
+            if cells is not None and key not in cells:
+                continue
+            labels.setdefault(key[0], city if key[0] else '')
+            prices[key].append(price)
+            if size:
+                per_sqft[key].append(price / size)
+
+    points = [
+        MarketIndexPoint(
+            city_key=city_key, city=labels[city_key], property_type=property_type, currency=currency,
+            month=month, median_price=_median(values), sample_count=len(values),
+            median_price_per_sqft=_median(per_sqft[(city_key, property_type, currency)]),
+        )
+        for (city_key, property_type, currency), values in prices.items()
+    ]
+    with transaction.atomic():
+        MarketIndexPoint.objects.bulk_create(
+            points, update_conflicts=True, unique_fields=['city_key', 'property_type', 'currency', 'month'],
+            update_fields=['city', 'median_price', 'median_price_per_sqft', 'sample_count', 'updated_at'],
+        )
+        # Cells no listing counts in any more, e.g. after a listing moved city
+        existing = MarketIndexPoint.objects.filter(month=month) \
+            .values_list('id', 'city_key', 'property_type', 'currency')
+        stale = [
+            point_id for point_id, *key in existing
+            if tuple(key) not in prices and (cells is None or tuple(key) in cells)
+        ]
+        if stale:
+            MarketIndexPoint.objects.filter(id__in=stale).delete()
+    return len(points)
+
+
+def series(city='', property_type='', start=None, end=None, currency=None):
+    """
+    (currency, points oldest first) of one index series; without a
+    ``currency``, the one with the most observations in the period
+    """
+    points = MarketIndexPoint.objects.filter(city_key=Place.normalize(city), property_type=property_type or '')
+    if start:
+        points = points.filter(month__gte=start)
+    if end:
+        points = points.filter(month__lte=end)
+    if not currency:
+        currency = _main_currency(points)
+    return currency, points.filter(currency=currency).order_by('month')
+
+
+def _main_currency(points):
+    counted = points.order_by().values('currency').annotate(samples=Sum('sample_count')) \
+        .order_by('-samples', 'currency').first()
+    return counted['currency'] if counted else ''
+
+
+def _change(first, last):
+    if first is None or last is None or not first:
+        return None
+    return round(float((last - first) / first * 100), 1)
+
+
+def market_analysis(start, end):
+    """
+    Per city, type and currency: the first and last monthly medians between
+    two months and their change, from the stored index points
+    """
+    points = MarketIndexPoint.objects.filter(month__gte=start, month__lte=end).order_by('month')
+    markets = {}
+    for point in points.iterator(chunk_size=5000):
+        key = (point.city_key, point.property_type, point.currency)
+        market = markets.setdefault(key, {
+            'city': point.city, 'property_type': point.property_type, 'currency': point.currency,
+            'first_month': point.month, 'first_price_per_sqft': point.median_price_per_sqft,
+            'first_price': point.median_price, 'sample_count': 0,
+        })
+        market.update(
+            last_month=point.month, median_price=point.median_price,
+            median_price_per_sqft=point.median_price_per_sqft,
+        )
+        market['sample_count'] += point.sample_count
+
+    rows = []
+    for market in markets.values():
+        market['price_change'] = _change(market.pop('first_price'), market['median_price'])
+        market['price_per_sqft_change'] = _change(market.pop('first_price_per_sqft'), market['median_price_per_sqft'])
+        rows.append(market)
+    rows.sort(key=lambda row: (row['city'] != '', row['property_type'] != '', -row['sample_count']))
+    return rows
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:18
+
+import documents.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='propertydocument',
+            name='file',
+            field=models.FileField(storage=documents.storage.get_blob_storage, upload_to='property_documents/'),
+        ),
+    ]
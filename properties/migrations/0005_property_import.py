@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:28
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Localities previously hard-coded in add_property_coordinates.py
+SEED_PLACES = [
+    ('Abuja', 'FCT', 9.0765, 7.3986),
+    ('Maitama', 'FCT', 9.0820, 7.4920),
+    ('Asokoro', 'FCT', 9.0330, 7.5340),
+    ('Wuse', 'FCT', 9.0643, 7.4892),
+    ('Garki', 'FCT', 9.0354, 7.4870),
+    ('Gwarinpa', 'FCT', 9.1108, 7.4125),
+    ('Jabi', 'FCT', 9.0698, 7.4514),
+    ('Kubwa', 'FCT', 9.1372, 7.3378),
+    ('Lugbe', 'FCT', 8.9642, 7.3711),
+    ('Karu', 'FCT', 9.0078, 7.6328),
+    ('Nyanya', 'FCT', 8.9967, 7.5833),
+]
+
+
+def seed_places(apps, schema_editor):
+    Place = apps.get_model('properties', 'Place')
+    Place.objects.bulk_create([
+        Place(name=name, state=state, country='Nigeria', key=name.lower(), state_key=state.lower(),
+              latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude)))
+        for name, state, latitude, longitude in SEED_PLACES
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0004_property_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('key', models.CharField(db_index=True, max_length=200)),
+                ('state_key', models.CharField(blank=True, max_length=100)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+            ],
+            options={
+                'db_table': 'gazetteer',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PropertyImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='property_imports/')),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('xlsx', 'Excel')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('processed_rows', models.IntegerField(default=0)),
+                ('created_count', models.IntegerField(default=0)),
+                ('updated_count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'property_import_jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='external_ref',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='property',
+            constraint=models.UniqueConstraint(fields=('agent', 'external_ref'), name='unique_agent_external_ref'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='place',
+            unique_together={('key', 'state_key')},
+        ),
+        migrations.RunPython(seed_places, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='propertyimportjob',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='property_imports', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0007_saved_searches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketIndexPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_key', models.CharField(blank=True, max_length=100)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('property_type', models.CharField(blank=True, max_length=20)),
+                ('month', models.DateField()),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('median_price_per_sqft', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('sample_count', models.IntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'market_index',
+                'ordering': ['city_key', 'property_type', 'month'],
+                'unique_together': {('city_key', 'property_type', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PropertyPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('source', models.CharField(choices=[('listing', 'Listing Price'), ('change', 'Price Change'), ('sale', 'Sale Price'), ('import', 'Import')], default='change', max_length=10)),
+                ('city', models.CharField(max_length=100)),
+                ('property_type', models.CharField(max_length=20)),
+                ('size_sqft', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='properties.property')),
+            ],
+            options={
+                'db_table': 'property_price_history',
+                'ordering': ['-recorded_at'],
+                'indexes': [models.Index(fields=['property', '-recorded_at'], name='property_pr_propert_8196c4_idx'), models.Index(fields=['recorded_at'], name='property_pr_recorde_209885_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0008_price_history_market_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='marketindexpoint',
+            options={'ordering': ['city_key', 'property_type', 'currency', 'month']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='marketindexpoint',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='marketindexpoint',
+            name='currency',
+            field=models.CharField(default='USD', max_length=3),
+        ),
+        migrations.AlterUniqueTogether(
+            name='marketindexpoint',
+            unique_together={('city_key', 'property_type', 'currency', 'month')},
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from documents.storage import get_blob_storage
 
 
 class Property(models.Model):
@@ -62,6 +64,9 @@ class Property(models.Model):
     # Features
     features = models.JSONField(default=dict, blank=True)
 
+    # Listing reference in the agency's own system; imports upsert on it
+    external_ref = models.CharField(max_length=100, blank=True, null=True)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -70,6 +75,14 @@ class Property(models.Model):
         db_table = 'properties'
         ordering = ['-created_at']
         verbose_name_plural = 'Properties'
+        indexes = [
+            models.Index(fields=['status', 'property_type']),
+            models.Index(fields=['city']),
+            models.Index(fields=['price']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'external_ref'], name='unique_agent_external_ref'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.city}, {self.state}"
@@ -85,6 +98,21 @@ class PropertyImage(models.Model):
     order = models.IntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    # Derivatives, filled in by properties.images after upload
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES,
+                                         default='pending', db_index=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    blurhash = models.CharField(max_length=64, blank=True)
+    # {size: {'width', 'height', 'webp': name, 'jpeg': name}}
+    derivatives = models.JSONField(default=dict, blank=True)
+
     class Meta:
         db_table = 'property_images'
         ordering = ['order', '-is_primary']
@@ -92,6 +120,21 @@ class PropertyImage(models.Model):
     def __str__(self):
         return f"Image for {self.property.title}"
 
+    def derivative_url(self, size, fmt='jpeg'):
+        """URL of a derivative, falling back to the original until it is generated"""
+        variant = self.derivatives.get(size)
+        if variant and variant.get(fmt):
+            return self.image.storage.url(variant[fmt])
+        return self.image.url if self.image else None
+
+    def srcset(self, fmt='jpeg'):
+        """``srcset`` attribute value listing the derivatives by width"""
+        variants = sorted(self.derivatives.values(), key=lambda variant: variant['width'])
+        return ', '.join(
+            f"{self.image.storage.url(variant[fmt])} {variant['width']}w"
+            for variant in variants if variant.get(fmt)
+        )
+
 
 class PropertyDocument(models.Model):
     """Property documents (contracts, certificates, etc.)"""
@@ -108,7 +151,7 @@ class PropertyDocument(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='documents')
     document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPE_CHOICES)
     title = models.CharField(max_length=255)
-    file = models.FileField(upload_to='property_documents/')
+    file = models.FileField(upload_to='property_documents/', storage=get_blob_storage)
     description = models.TextField(blank=True, null=True)
     uploaded_by = models.ForeignKey('users.User', on_delete=models.SET_NULL, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -165,3 +208,232 @@ class Transaction(models.Model):
 
     def __str__(self):
         return f"Transaction for {self.property.title} - {self.status}"
+
+
+class Place(models.Model):
+    """
+    Local gazetteer entry used to fill in coordinates of imported listings;
+    names are matched case-insensitively on ``key`` and ``state_key``
+    """
+
+    name = models.CharField(max_length=200)
+    state = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+    key = models.CharField(max_length=200, db_index=True)
+    state_key = models.CharField(max_length=100, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+
+    class Meta:
+        db_table = 'gazetteer'
+        ordering = ['name']
+        unique_together = ['key', 'state_key']
+
+    def __str__(self):
+        return f"{self.name}, {self.state}" if self.state else self.name
+
+    @staticmethod
+    def normalize(value):
+        return ' '.join(str(value or '').lower().split())
+
+    def save(self, *args, **kwargs):
+        self.key = self.normalize(self.name)
+        self.state_key = self.normalize(self.state)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def lookup(cls, locations):
+        """
+        Coordinates for (city, state) pairs in one query; a city without a
+        matching state entry falls back to the only place of that name
+        """
+        keys = {cls.normalize(city) for city, _ in locations if city}
+        by_state = {}
+        by_name = {}
+        for place in cls.objects.filter(key__in=keys).only('key', 'state_key', 'latitude', 'longitude'):
+            coordinates = (place.latitude, place.longitude)
+            by_state[(place.key, place.state_key)] = coordinates
+            by_name[place.key] = None if place.key in by_name else coordinates
+
+        found = {}
+        for city, state in locations:
+            key = cls.normalize(city)
+            coordinates = by_state.get((key, cls.normalize(state))) or by_name.get(key)
+            if coordinates:
+                found[(city, state)] = coordinates
+        return found
+
+
+class PropertyImportJob(models.Model):
+    """Background import of a CSV, JSON (Lines) or XLSX file of listings"""
+
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+        ('xlsx', 'Excel'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='property_imports')
+    file = models.FileField(upload_to='property_imports/')
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+
+    # Progress, updated after every batch
+    processed_rows = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    updated_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    # First MAX_REPORTED_ERRORS row errors: [{'row': n, 'errors': {field: [messages]}}]
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'property_import_jobs'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.id} by {self.user} ({self.status})"
+
+
+class SavedSearch(models.Model):
+    """
+    A client's property search (the query string of the search page) that
+    new and changed listings are matched against
+    """
+
+    FREQUENCY_CHOICES = [
+        ('instant', 'Instant'),
+        ('daily', 'Daily Digest'),
+        ('off', 'Off'),
+    ]
+
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=200)
+    query = models.TextField(blank=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='instant')
+    last_notified_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'saved_searches'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.user})"
+
+
+class SavedSearchTerm(models.Model):
+    """
+    Reverse index row of a saved search: one per selected (city, type)
+    pair, empty meaning any, with the price bands it accepts; a listing only
+    needs to be checked against the searches that have a term matching it
+    """
+
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='terms')
+    city = models.CharField(max_length=100, blank=True)
+    property_type = models.CharField(max_length=20, blank=True)
+    min_band = models.SmallIntegerField()
+    max_band = models.SmallIntegerField()
+
+    class Meta:
+        db_table = 'saved_search_terms'
+        indexes = [
+            models.Index(fields=['city', 'property_type', 'min_band']),
+        ]
+
+    def __str__(self):
+        return f"{self.city or '*'}/{self.property_type or '*'} [{self.min_band}-{self.max_band}]"
+
+
+class SavedSearchMatch(models.Model):
+    """A listing that matched a saved search, waiting for (or included in) a notification"""
+
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='saved_search_matches')
+    matched_at = models.DateTimeField(auto_now_add=True)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'saved_search_matches'
+        ordering = ['-matched_at']
+        unique_together = ['saved_search', 'property']
+        indexes = [
+            models.Index(fields=['notified_at', 'saved_search']),
+        ]
+
+    def __str__(self):
+        return f"{self.property} for {self.saved_search}"
+
+
+class PropertyPrice(models.Model):
+    """
+    Append-only price history of a listing; city, type and size are copied
+    from the listing so the market index never has to join or rewrite it
+    """
+
+    SOURCE_CHOICES = [
+        ('listing', 'Listing Price'),
+        ('change', 'Price Change'),
+        ('sale', 'Sale Price'),
+        ('import', 'Import'),
+    ]
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='price_history')
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, default='USD')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='change')
+    city = models.CharField(max_length=100)
+    property_type = models.CharField(max_length=20)
+    size_sqft = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'property_price_history'
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['property', '-recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id}: {self.price} {self.currency} ({self.recorded_at.date()})"
+
+
+class MarketIndexPoint(models.Model):
+    """
+    Monthly market index cell: medians over the listings priced in a month,
+    per city, type and currency; an empty city or type is the roll-up over
+    all of them
+    """
+
+    city_key = models.CharField(max_length=100, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    property_type = models.CharField(max_length=20, blank=True)
+    currency = models.CharField(max_length=3, default='USD')
+    month = models.DateField()
+    median_price = models.DecimalField(max_digits=12, decimal_places=2)
+    # Null when no listing of the month has a size
+    median_price_per_sqft = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    sample_count = models.IntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'market_index'
+        ordering = ['city_key', 'property_type', 'currency', 'month']
+        unique_together = ['city_key', 'property_type', 'currency', 'month']
+
+    def __str__(self):
+        return f"{self.city or 'All cities'} / {self.property_type or 'all types'} {self.currency} {self.month:%Y-%m}"
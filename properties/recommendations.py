@@ -0,0 +1,331 @@
+"""
+Similar listings and client matching from property feature vectors.
+
+Every property is encoded as a fixed-length vector: one-hot type,
+standardized log price, log size, bedrooms and bathrooms, position relative
+to the centre of all listings, a hashed city bucket and the feature flags,
+each group weighted and the whole vector scaled to unit length. The vectors
+live in one float32 NumPy matrix per process, so the cosine similarity of a
+listing to all others is a single matrix-vector product.
+
+Clients get a profile vector too: the interest-weighted mean of the
+listings they recorded interest in (messaging.ClientPropertyInterest).
+"Clients to contact about X" ranks those profiles against X's vector.
+
+Like the search bitmap index, the matrix is built on first use, kept up to
+date from signals, and rebuilt when the shared version counter shows
+another process changed data, or after ``MAX_AGE``. Only a cache shared by
+all processes (``settings.SHARED_CACHE``) carries that counter; with the
+local-memory cache, listing and interest changes made elsewhere (another
+web worker, the import worker) show up after ``MAX_AGE``.
+"""
+import math
+import threading
+import time
+import warnings
+import zlib
+
+import numpy as np
+from django.core.cache import cache
+from .search import FEATURE_FLAGS
+
+MAX_AGE = 300
+VERSION_KEY = 'properties:recommender_version'
+
+# Only listings with these statuses are recommended
+RECOMMENDABLE_STATUSES = {'available'}
+
+PROPERTY_TYPES = ['residential', 'commercial', 'land', 'industrial', 'mixed']
+CITY_BUCKETS = 16
+# Degrees of latitude/longitude counted as one unit of distance (~55 km)
+LOCATION_SCALE = 0.5
+
+WEIGHTS = {
+    'type': 1.5,
+    'price': 1.5,
+    'size': 1.0,
+    'bedrooms': 1.0,
+    'bathrooms': 0.5,
+    'location': 1.0,
+    'city': 1.0,
+    'features': 0.5,
+}
+
+INTEREST_WEIGHTS = {'low': 0.5, 'medium': 1.0, 'high': 1.5, 'very_high': 2.0}
+
+COLUMNS = [
+    'id', 'property_type', 'status', 'price', 'size_sqft', 'size_sqm', 'bedrooms',
+    'bathrooms', 'latitude', 'longitude', 'city', 'features',
+]
+
+_SQM_TO_SQFT = 10.7639
+_TYPE_OFFSET = 0
+_NUMERIC_OFFSET = _TYPE_OFFSET + len(PROPERTY_TYPES)  # price, size, bedrooms, bathrooms
+_LOCATION_OFFSET = _NUMERIC_OFFSET + 4
+_CITY_OFFSET = _LOCATION_OFFSET + 2
+_FEATURE_OFFSET = _CITY_OFFSET + CITY_BUCKETS
+DIMENSIONS = _FEATURE_OFFSET + len(FEATURE_FLAGS)
+
+
+def _number(value):
+    return math.nan if value is None else float(value)
+
+
+def _raw(rows):
+    """Numeric columns of property rows (tuples in ``COLUMNS`` order), NaN where missing"""
+    raw = np.full((len(rows), 6), np.nan)
+    for index, (_, _, _, price, size_sqft, size_sqm, bedrooms, bathrooms, latitude, longitude, _, _) in enumerate(rows):
+        if size_sqft is None and size_sqm is not None:
+            size_sqft = float(size_sqm) * _SQM_TO_SQFT
+        raw[index] = (
+            _number(price), _number(size_sqft), _number(bedrooms),
+            _number(bathrooms), _number(latitude), _number(longitude),
+        )
+    # Prices and sizes are compared by ratio rather than difference
+    raw[:, :2] = np.log1p(np.clip(raw[:, :2], 0, None))
+    return raw
+
+
+def statistics(rows):
+    """Column means and deviations the vectors are standardized with"""
+    raw = _raw(rows)
+    with warnings.catch_warnings():
+        # A column with no values at all averages to NaN, handled below
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(raw, axis=0)
+        std = np.nanstd(raw, axis=0)
+    mean = np.nan_to_num(mean)
+    std = np.where(np.isnan(std) | (std == 0), 1.0, std)
+    return mean, std
+
+
+def encode(rows, stats):
+    """Unit feature vectors (float32, one row per property row)"""
+    mean, std = stats
+    vectors = np.zeros((len(rows), DIMENSIONS), dtype=np.float32)
+    if not rows:
+        return vectors
+
+    raw = _raw(rows)
+    numeric = np.nan_to_num((raw[:, :4] - mean[:4]) / std[:4])
+    vectors[:, _NUMERIC_OFFSET:_LOCATION_OFFSET] = np.clip(numeric, -4, 4) * [
+        WEIGHTS['price'], WEIGHTS['size'], WEIGHTS['bedrooms'], WEIGHTS['bathrooms'],
+    ]
+    location = np.nan_to_num((raw[:, 4:6] - mean[4:6]) / LOCATION_SCALE)
+    vectors[:, _LOCATION_OFFSET:_CITY_OFFSET] = np.clip(location, -4, 4) * WEIGHTS['location']
+
+    for index, (_, property_type, _, _, _, _, _, _, _, _, city, features) in enumerate(rows):
+        if property_type in PROPERTY_TYPES:
+            vectors[index, _TYPE_OFFSET + PROPERTY_TYPES.index(property_type)] = WEIGHTS['type']
+        if city:
+            # crc32 rather than hash(): the bucket must not vary between processes
+            bucket = zlib.crc32(city.strip().lower().encode()) % CITY_BUCKETS
+            vectors[index, _CITY_OFFSET + bucket] = WEIGHTS['city']
+        if isinstance(features, dict):
+            for offset, key in enumerate(FEATURE_FLAGS):
+                if key in features and features[key] is not False:
+                    vectors[index, _FEATURE_OFFSET + offset] = WEIGHTS['features']
+
+    return _normalized(vectors)
+
+
+def _normalized(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def instance_row(instance):
+    return tuple(getattr(instance, column) for column in COLUMNS)
+
+
+def _top(scores, k):
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class PropertyRecommender:
+    """Property and client profile matrices of this process"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.stats = None
+            self.ids = np.empty(0, dtype=np.int64)
+            self.positions = {}  # property id -> row
+            self.vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+            self.recommendable = np.zeros(0, dtype=bool)
+            self.size = 0
+            self.client_ids = np.empty(0, dtype=np.int64)
+            self.client_vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+            self.version = None
+            self.loaded_at = None
+
+    def _build(self):
+        from .models import Property
+
+        version = cache.get_or_set(VERSION_KEY, time.time_ns, None)
+        rows = list(Property.objects.order_by('id').values_list(*COLUMNS).iterator(chunk_size=5000))
+        self.stats = statistics(rows)
+        self.vectors = encode(rows, self.stats)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.positions = {id_: index for index, id_ in enumerate(self.ids.tolist())}
+        self.recommendable = np.array([row[2] in RECOMMENDABLE_STATUSES for row in rows], dtype=bool)
+        self.size = len(rows)
+        self._build_clients()
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    def _build_clients(self):
+        from messaging.models import ClientPropertyInterest
+
+        interests = ClientPropertyInterest.objects.exclude(status='not_interested') \
+            .values_list('client_id', 'property_obj_id', 'interest_level')
+        clients, rows, weights = [], [], []
+        for client_id, property_id, level in interests.iterator(chunk_size=5000):
+            row = self.positions.get(property_id)
+            if row is not None:
+                clients.append(client_id)
+                rows.append(row)
+                weights.append(INTEREST_WEIGHTS.get(level, 1.0))
+
+        client_ids, client_index = np.unique(np.array(clients, dtype=np.int64), return_inverse=True)
+        profiles = np.zeros((len(client_ids), DIMENSIONS), dtype=np.float32)
+        if rows:
+            weighted = self.vectors[np.array(rows)] * np.array(weights, dtype=np.float32)[:, None]
+            np.add.at(profiles, client_index, weighted)
+        self.client_ids = client_ids
+        self.client_vectors = _normalized(profiles)
+
+    def ensure_current(self):
+        with self.lock:
+            stale = (
+                self.version is None
+                or time.monotonic() - self.loaded_at > MAX_AGE
+                or cache.get(VERSION_KEY) != self.version
+            )
+            if stale:
+                self._build()
+
+    def _bump_version(self):
+        """Announce a change; stay current if no other process changed anything meanwhile"""
+        # Atomic as in PropertyBitmapIndex._bump_version
+        if cache.add(VERSION_KEY, time.time_ns(), None):
+            version = None
+        else:
+            try:
+                version = cache.incr(VERSION_KEY)
+            except ValueError:
+                cache.add(VERSION_KEY, time.time_ns(), None)
+                version = None
+        if self.version is not None:
+            self.version = version if version == self.version + 1 else None
+
+    def update(self, row):
+        """Add or re-encode one property (a tuple in ``COLUMNS`` order)"""
+        with self.lock:
+            if self.version is not None:
+                # New listings are standardized with the statistics of the last build
+                vector = encode([row], self.stats)[0]
+                position = self.positions.get(row[0])
+                if position is None:
+                    position = self.size
+                    if position == len(self.vectors):
+                        self._grow()
+                    self.ids[position] = row[0]
+                    self.positions[row[0]] = position
+                    self.size += 1
+                self.vectors[position] = vector
+                self.recommendable[position] = row[2] in RECOMMENDABLE_STATUSES
+            self._bump_version()
+
+    def _grow(self):
+        capacity = max(2 * len(self.vectors), 64)
+        vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        recommendable = np.zeros(capacity, dtype=bool)
+        recommendable[:self.size] = self.recommendable[:self.size]
+        self.vectors, self.ids, self.recommendable = vectors, ids, recommendable
+
+    def remove(self, property_id):
+        with self.lock:
+            position = self.positions.pop(property_id, None) if self.version is not None else None
+            if position is not None:
+                # Move the last row into the gap
+                last = self.size - 1
+                if position != last:
+                    moved = int(self.ids[last])
+                    self.ids[position] = moved
+                    self.vectors[position] = self.vectors[last]
+                    self.recommendable[position] = self.recommendable[last]
+                    self.positions[moved] = position
+                self.recommendable[last] = False
+                self.size = last
+            self._bump_version()
+
+    def refresh_client(self, client_id):
+        """Recompute one client's profile after their interests changed"""
+        from messaging.models import ClientPropertyInterest
+
+        with self.lock:
+            if self.version is not None:
+                interests = ClientPropertyInterest.objects.filter(client_id=client_id) \
+                    .exclude(status='not_interested').values_list('property_obj_id', 'interest_level')
+                profile = np.zeros(DIMENSIONS, dtype=np.float32)
+                for property_id, level in interests:
+                    row = self.positions.get(property_id)
+                    if row is not None:
+                        profile += self.vectors[row] * INTEREST_WEIGHTS.get(level, 1.0)
+                profile = _normalized(profile[None, :])[0]
+
+                index = int(np.searchsorted(self.client_ids, client_id))
+                known = index < len(self.client_ids) and self.client_ids[index] == client_id
+                if known:
+                    self.client_vectors[index] = profile
+                elif profile.any():
+                    self.client_ids = np.insert(self.client_ids, index, client_id)
+                    self.client_vectors = np.insert(self.client_vectors, index, profile, axis=0)
+            self._bump_version()
+
+    def invalidate(self):
+        """Make every process rebuild, after writes that bypass signals"""
+        with self.lock:
+            self._bump_version()
+            self.version = None
+
+    def similar(self, property_id, k=6):
+        """[(property id, similarity)] of the k recommendable listings closest to one property"""
+        self.ensure_current()
+        with self.lock:
+            position = self.positions.get(property_id)
+            if position is None:
+                return []
+            scores = self.vectors[:self.size] @ self.vectors[position]
+            scores[~self.recommendable[:self.size]] = -np.inf
+            scores[position] = -np.inf
+            top = _top(scores, k)
+            top = top[np.isfinite(scores[top])]
+            return list(zip(self.ids[top].tolist(), scores[top].tolist()))
+
+    def matching_clients(self, property_id, k=20):
+        """[(client id, similarity)] of the k clients whose interests best fit one property"""
+        self.ensure_current()
+        with self.lock:
+            position = self.positions.get(property_id)
+            if position is None or not len(self.client_ids):
+                return []
+            scores = self.client_vectors @ self.vectors[position]
+            top = _top(scores, k)
+            top = top[scores[top] > 0]
+            return list(zip(self.client_ids[top].tolist(), scores[top].tolist()))
+
+
+recommender = PropertyRecommender()
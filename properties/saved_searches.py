@@ -0,0 +1,230 @@
+"""
+Saved searches and the notifications of listings that match them.
+
+Matching runs the other way round from searching: a new or changed listing
+is looked up in ``SavedSearchTerm``, a reverse index holding one row per
+(city, type) selection of every saved search with the price bands it
+accepts, so only the searches that could match are loaded and checked in
+full with ``PropertySearch.matches``. The cost follows the number of
+candidate searches, not the number of saved searches. Listings are matched
+in batches (one per save, one per import batch) once the write commits.
+
+Only saves that change a field searches look at (``MATCHED_FIELDS``) are
+matched again.
+
+Matches are queued as ``SavedSearchMatch`` rows and turned into one
+notification per saved search by ``manage.py notify_saved_searches``,
+immediately or as a daily digest; pending matches are claimed with
+``SELECT ... FOR UPDATE SKIP LOCKED`` like appointment reminders. That
+command runs in its own process (the Procfile notifier), so its
+notifications reach open event streams only through a broker shared by all
+processes (``REALTIME_BROKER`` = PostgresBroker, see notifications.W001);
+with the default LocalBroker they are seen on the next fetch.
+"""
+import copy
+import itertools
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+from notifications.models import Notification
+from notifications.realtime import publish, user_channel
+from notifications.serializers import NotificationSerializer
+from .models import SavedSearch, SavedSearchMatch, SavedSearchTerm
+from .search import PropertySearch
+
+# Price bands double in width: band n holds prices in [2**n, 2**(n + 1))
+MAX_BAND = 63
+DEFAULT_BATCH_SIZE = 500
+DIGEST_INTERVAL = timedelta(days=1)
+# Listings named in a notification message; the rest are counted
+LISTED_IN_MESSAGE = 3
+
+
+# Listing fields PropertySearch.matches reads (agent_id for agents' own
+# listings); a save changing none of them cannot change any match
+MATCHED_FIELDS = [
+    'property_type', 'status', 'city', 'state', 'bedrooms', 'bathrooms', 'size_sqft',
+    'year_built', 'price', 'features', 'agent_id', 'title', 'address', 'description',
+]
+
+
+def matched_values(listing):
+    """Values of a listing's ``MATCHED_FIELDS`` (None where deferred), copied"""
+    return copy.deepcopy(tuple(listing.__dict__.get(field) for field in MATCHED_FIELDS))
+
+
+def price_band(price):
+    if price is None or price < 1:
+        return 0
+    return min(int(math.log2(price)), MAX_BAND)
+
+
+def parse_query(query):
+    return QueryDict((query or '').lstrip('?'))
+
+
+def search_terms(saved_search):
+    """Reverse index rows of a saved search (unsaved)"""
+    search = PropertySearch(parse_query(saved_search.query))
+    cities = sorted({city.lower() for city in search.selected.get('city', [])}) or ['']
+    types = search.selected.get('property_type') or ['']
+    min_price = search.ranges.get('price__gte')
+    max_price = search.ranges.get('price__lte')
+    min_band = price_band(min_price) if min_price is not None else 0
+    max_band = price_band(max_price) if max_price is not None else MAX_BAND
+    return [
+        SavedSearchTerm(saved_search=saved_search, city=city, property_type=property_type,
+                        min_band=min_band, max_band=max_band)
+        for city, property_type in itertools.product(cities, types)
+    ]
+
+
+def index_saved_search(saved_search):
+    with transaction.atomic():
+        saved_search.terms.all().delete()
+        SavedSearchTerm.objects.bulk_create(search_terms(saved_search))
+
+
+def _matches(search, listing):
+    # Unless a search asks for other statuses, only listings on the market match
+    if 'status' not in search.selected and listing.status != 'available':
+        return False
+    return search.matches(listing)
+
+
+def candidate_searches(listings):
+    """{property id: {ids of the saved searches whose terms accept it}}"""
+    bands = {listing.pk: price_band(listing.price) for listing in listings}
+    terms = SavedSearchTerm.objects.filter(
+        city__in={listing.city.lower() for listing in listings} | {''},
+        property_type__in={listing.property_type for listing in listings} | {''},
+        min_band__lte=max(bands.values()),
+        max_band__gte=min(bands.values()),
+    ).values_list('city', 'property_type', 'saved_search_id', 'min_band', 'max_band')
+
+    by_key = defaultdict(list)
+    for city, property_type, *accepted in terms:
+        by_key[(city, property_type)].append(accepted)
+
+    candidates = {}
+    for listing in listings:
+        band = bands[listing.pk]
+        found = {
+            saved_search_id
+            for key in itertools.product(('', listing.city.lower()), ('', listing.property_type))
+            for saved_search_id, min_band, max_band in by_key.get(key, ())
+            if min_band <= band <= max_band
+        }
+        if found:
+            candidates[listing.pk] = found
+    return candidates
+
+
+def match_listings(listings):
+    """Queue notifications for the saved searches the listings now match; returns the matches found"""
+    listings = [listing for listing in listings if listing.pk]
+    if not listings:
+        return 0
+    candidates = candidate_searches(listings)
+    if not candidates:
+        return 0
+
+    saved_searches = SavedSearch.objects.exclude(frequency='off') \
+        .in_bulk(set().union(*candidates.values()))
+    searches = {
+        saved_search_id: PropertySearch(parse_query(saved_search.query))
+        for saved_search_id, saved_search in saved_searches.items()
+    }
+    matches = []
+    for listing in listings:
+        for saved_search_id in candidates.get(listing.pk, ()):
+            saved_search = saved_searches.get(saved_search_id)
+            # Agents are not told about their own listings
+            if saved_search and saved_search.user_id != listing.agent_id \
+                    and _matches(searches[saved_search_id], listing):
+                matches.append(SavedSearchMatch(saved_search=saved_search, property=listing))
+    # A listing already matched (and maybe notified) is not queued again
+    SavedSearchMatch.objects.bulk_create(matches, ignore_conflicts=True)
+    return len(matches)
+
+
+def due_matches(now):
+    """Pending matches of instant searches and of digests that are due"""
+    return SavedSearchMatch.objects.filter(notified_at__isnull=True).filter(
+        Q(saved_search__frequency='instant')
+        | Q(saved_search__frequency='daily', saved_search__last_notified_at__isnull=True)
+        | Q(saved_search__frequency='daily', saved_search__last_notified_at__lte=now - DIGEST_INTERVAL)
+    )
+
+
+def _notification(saved_search, listings):
+    titles = ', '.join(listing.title for listing in listings[:LISTED_IN_MESSAGE])
+    more = len(listings) - LISTED_IN_MESSAGE
+    if more > 0:
+        titles += f' and {more} more'
+    count = len(listings)
+    return Notification(
+        user_id=saved_search.user_id,
+        type='property',
+        title=f'{count} new listing{"s" if count != 1 else ""} for "{saved_search.name}"',
+        message=titles,
+        priority='medium',
+        related_id=saved_search.id,
+        related_type='saved_search',
+    )
+
+
+def dispatch_notification_batch(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """
+    Claim one batch of due matches and send one notification per saved
+    search. Returns the number of matches notified.
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        claimed_ids = list(
+            due_matches(now)
+            .select_for_update(skip_locked=True, of=('self',))
+            # Keep the matches of one search together, so a digest is not split
+            .order_by('saved_search_id', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not claimed_ids:
+            return 0
+
+        grouped = defaultdict(list)
+        claimed = SavedSearchMatch.objects.filter(id__in=claimed_ids) \
+            .select_related('saved_search', 'property').order_by('matched_at')
+        for match in claimed:
+            grouped[match.saved_search].append(match.property)
+
+        created = Notification.objects.bulk_create([
+            _notification(saved_search, listings) for saved_search, listings in grouped.items()
+        ])
+        SavedSearchMatch.objects.filter(id__in=claimed_ids).update(notified_at=now)
+        SavedSearch.objects.filter(id__in=[saved_search.id for saved_search in grouped]) \
+            .update(last_notified_at=now)
+
+    # bulk_create skips post_save, so push the new notifications here. This
+    # runs in the notifier process: only a shared broker carries them to
+    # the web processes holding the streams
+    for notification in created:
+        if notification.pk:
+            publish([user_channel(notification.user_id)], 'notification',
+                    NotificationSerializer(notification).data)
+    return len(claimed_ids)
+
+
+def dispatch_due_notifications(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Process batches until no due matches are left; returns the total notified"""
+    total = 0
+    while True:
+        sent = dispatch_notification_batch(batch_size, now)
+        total += sent
+        if sent < batch_size:
+            return total
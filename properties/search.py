@@ -0,0 +1,317 @@
+"""
+Faceted property search.
+
+Filters come from query parameters: multi-valued facets (``property_type``,
+``status``, ``city``, ``state``, ``bedrooms`` buckets, comma separated or
+repeated), ranges (``min_price``/``max_price`` and the like), ``features``
+flags that must all be present, and free text ``q``.
+
+Facet counts are disjunctive: the counts of a facet apply every filter
+except that facet's own selection, so ticking "Residential" still shows
+how many commercial listings match. All fixed-value facets and the total
+are counted in one aggregate query with ``COUNT(*) FILTER (...)``; cities
+and states take one grouped query each.
+
+With ``PROPERTY_BITMAP_INDEX`` on, facet selections and counts are instead
+answered from the in-process bitmap index (properties.bitmaps): the
+database is only asked for the ids matching ranges and text, if any, and
+for the rows of the requested page.
+"""
+import itertools
+import operator
+import re
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+
+from django.conf import settings
+from django.db.models import Count, Q
+from .bitmaps import Bitmap, property_index
+from .models import Property
+
+# Feature flags counted as facets; any other key can still be filtered on
+FEATURE_FLAGS = [
+    'pool', 'generator', 'security', 'parking', 'furnished', 'garden',
+    'gym', 'air_conditioning', 'balcony', 'elevator', 'borehole', 'bq',
+]
+
+BEDROOM_BUCKETS = [
+    ('0', Q(bedrooms=0)),
+    ('1', Q(bedrooms=1)),
+    ('2', Q(bedrooms=2)),
+    ('3', Q(bedrooms=3)),
+    ('4', Q(bedrooms=4)),
+    ('5+', Q(bedrooms__gte=5)),
+]
+
+RANGE_FILTERS = {
+    'price': 'price',
+    'bedrooms': 'bedrooms',
+    'bathrooms': 'bathrooms',
+    'size': 'size_sqft',
+    'year_built': 'year_built',
+}
+
+ORDERINGS = ['price', '-price', 'listing_date', '-listing_date', 'created_at', '-created_at']
+
+OPEN_FACET_LIMIT = 20
+MAX_PAGE_SIZE = 100
+# Matches up to this many are sorted by the database as an id list; larger
+# result sets sorted on anything but creation go through the plain query
+INDEX_ID_LIMIT = 5000
+
+_FEATURE_KEY = re.compile(r'^\w{1,50}$')
+
+
+def feature_q(key):
+    """Listings having ``key`` in features with any value but false"""
+    return Q(features__has_key=key) & ~Q(**{f'features__{key}': False})
+
+
+def bedroom_bucket(bedrooms):
+    if bedrooms is None or bedrooms < 0:
+        return None
+    return '5+' if bedrooms >= 5 else str(bedrooms)
+
+
+def _values(params, name):
+    values = []
+    for value in params.getlist(name):
+        values.extend(part.strip() for part in value.split(',') if part.strip())
+    return values
+
+
+def _number(value):
+    try:
+        return Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+
+
+class PropertySearch:
+    """Parsed search parameters, with the querysets and facet counts they select"""
+
+    CHOICE_FACETS = {
+        'property_type': Property.PROPERTY_TYPE_CHOICES,
+        'status': Property.STATUS_CHOICES,
+    }
+    OPEN_FACETS = ['city', 'state']
+
+    def __init__(self, params, queryset=None, agent_id=None):
+        self.queryset = Property.objects.all() if queryset is None else queryset
+        self.agent_id = agent_id
+        # The index knows nothing of filters already applied to the queryset
+        self.use_index = (
+            getattr(settings, 'PROPERTY_BITMAP_INDEX', False) and not self.queryset.query.has_filters()
+        )
+        self.selected = {}
+        for name in [*self.CHOICE_FACETS, *self.OPEN_FACETS, 'bedrooms']:
+            values = _values(params, name)
+            if values:
+                self.selected[name] = values
+        self.features = [key for key in _values(params, 'features') if _FEATURE_KEY.match(key)]
+        self.ranges = {}
+        for name, field in RANGE_FILTERS.items():
+            for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+                number = _number(params.get(f'{bound}_{name}'))
+                if number is not None:
+                    self.ranges[f'{field}__{lookup}'] = number
+        self.text = (params.get('q') or '').strip()
+        ordering = params.get('ordering')
+        self.ordering = ordering if ordering in ORDERINGS else '-created_at'
+
+    def facet_q(self, name):
+        """Condition for the selection of one facet"""
+        values = self.selected.get(name)
+        if not values:
+            return Q()
+        if name == 'bedrooms':
+            conditions = [bucket for value, bucket in BEDROOM_BUCKETS if value in values]
+        elif name in self.OPEN_FACETS:
+            conditions = [Q(**{f'{name}__iexact': value}) for value in values]
+        else:
+            return Q(**{f'{name}__in': values})
+        return reduce(operator.or_, conditions) if conditions else Q(pk__in=[])
+
+    def facets_q(self, exclude=None):
+        condition = Q()
+        for name in self.selected:
+            if name != exclude:
+                condition &= self.facet_q(name)
+        for key in self.features:
+            condition &= feature_q(key)
+        return condition
+
+    def base(self):
+        """Listings matching the filters that are not facets"""
+        queryset = self.queryset.filter(**self.ranges)
+        if self.agent_id is not None:
+            queryset = queryset.filter(agent_id=self.agent_id)
+        if self.text:
+            queryset = queryset.filter(
+                Q(title__icontains=self.text) | Q(address__icontains=self.text) |
+                Q(city__icontains=self.text) | Q(description__icontains=self.text)
+            )
+        return queryset
+
+    def results(self):
+        return self.base().filter(self.facets_q()).order_by(self.ordering, '-id')
+
+    def matches(self, listing):
+        """Whether one property passes every filter, checked in Python"""
+        for name, values in self.selected.items():
+            value = getattr(listing, name)
+            if name == 'bedrooms':
+                value = bedroom_bucket(value)
+            elif name in self.OPEN_FACETS:
+                value = (value or '').lower()
+                values = [selected.lower() for selected in values]
+            if value not in values:
+                return False
+        features = listing.features if isinstance(listing.features, dict) else {}
+        if any(features.get(key, False) is False for key in self.features):
+            return False
+        for lookup, bound in self.ranges.items():
+            field, comparison = lookup.rsplit('__', 1)
+            value = getattr(listing, field)
+            if value is None or (value < bound if comparison == 'gte' else value > bound):
+                return False
+        if self.agent_id is not None and listing.agent_id != self.agent_id:
+            return False
+        if self.text:
+            text = self.text.lower()
+            fields = [listing.title, listing.address, listing.city, listing.description]
+            return any(text in (value or '').lower() for value in fields)
+        return True
+
+    def page(self, start, size):
+        """Properties from ``start`` in the chosen ordering, at most ``size``"""
+        if self.use_index:
+            return self._index_page(start, size)
+        return list(self.results()[start:start + size])
+
+    def counts(self):
+        """Total matches and facet counts, as {'count': n, 'facets': {...}}"""
+        if self.use_index:
+            return self._index_counts()
+        base = self.base()
+        aggregates = {'count': Count('id', filter=self.facets_q())}
+        for name, choices in self.CHOICE_FACETS.items():
+            others = self.facets_q(exclude=name)
+            for value, _ in choices:
+                aggregates[f'{name}:{value}'] = Count('id', filter=others & Q(**{name: value}))
+        others = self.facets_q(exclude='bedrooms')
+        for value, bucket in BEDROOM_BUCKETS:
+            aggregates[f'bedrooms:{value}'] = Count('id', filter=others & bucket)
+        everything = self.facets_q()
+        for key in FEATURE_FLAGS:
+            aggregates[f'features:{key}'] = Count('id', filter=everything & feature_q(key))
+        counted = base.aggregate(**aggregates)
+
+        facets = {}
+        for name, choices in self.CHOICE_FACETS.items():
+            facets[name] = [
+                {'value': value, 'label': label, 'count': counted[f'{name}:{value}']}
+                for value, label in choices
+            ]
+        facets['bedrooms'] = [
+            {'value': value, 'label': value, 'count': counted[f'bedrooms:{value}']}
+            for value, _ in BEDROOM_BUCKETS
+        ]
+        facets['features'] = [
+            {'value': key, 'label': key.replace('_', ' ').capitalize(), 'count': counted[f'features:{key}']}
+            for key in FEATURE_FLAGS
+        ]
+        for name in self.OPEN_FACETS:
+            grouped = (
+                base.filter(self.facets_q(exclude=name))
+                .values(name).annotate(count=Count('id'))
+                .order_by('-count', name)[:OPEN_FACET_LIMIT]
+            )
+            facets[name] = [
+                {'value': row[name], 'label': row[name], 'count': row['count']} for row in grouped
+            ]
+        return {'count': counted['count'], 'facets': facets}
+
+    # Bitmap index
+
+    def _index_base(self):
+        """Bitmap of the listings matching the filters that are not facets"""
+        index = property_index
+        base = index.universe
+        if self.agent_id is not None:
+            base = base & index.bitmap(f'agent:{self.agent_id}')
+        if self.ranges or self.text:
+            base = base & Bitmap.from_ids(self.base().order_by().values_list('id', flat=True))
+        return base
+
+    def _index_facet(self, name):
+        """Bitmap of one facet's selection"""
+        values = self.selected[name]
+        if name in self.OPEN_FACETS:
+            values = [value.lower() for value in values]
+        return property_index.evaluate(('or', *(f'{name}:{value}' for value in values)))
+
+    def _index_match(self, base, exclude=None):
+        bitmaps = [self._index_facet(name) for name in self.selected if name != exclude]
+        bitmaps.extend(property_index.bitmap(f'feature:{key}') for key in self.features)
+        for bitmap in sorted(bitmaps, key=len):
+            base = base & bitmap
+            if not base:
+                break
+        return base
+
+    def _index_counts(self):
+        index = property_index
+        index.ensure_current()
+        with index.lock:
+            base = self._index_base()
+            everything = self._index_match(base)
+            facets = {}
+            for name, choices in self.CHOICE_FACETS.items():
+                others = self._index_match(base, exclude=name)
+                facets[name] = [
+                    {'value': value, 'label': label, 'count': others.count_and(index.bitmap(f'{name}:{value}'))}
+                    for value, label in choices
+                ]
+            others = self._index_match(base, exclude='bedrooms')
+            facets['bedrooms'] = [
+                {'value': value, 'label': value, 'count': others.count_and(index.bitmap(f'bedrooms:{value}'))}
+                for value, _ in BEDROOM_BUCKETS
+            ]
+            facets['features'] = [
+                {
+                    'value': key, 'label': key.replace('_', ' ').capitalize(),
+                    'count': everything.count_and(index.bitmap(f'feature:{key}')),
+                }
+                for key in FEATURE_FLAGS
+            ]
+            for name in self.OPEN_FACETS:
+                others = self._index_match(base, exclude=name)
+                counted = [
+                    (others.count_and(bitmap), index.label(f'{name}:{value}'))
+                    for value, bitmap in index.values(name)
+                ]
+                counted = sorted(
+                    (item for item in counted if item[0]), key=lambda item: (-item[0], item[1])
+                )[:OPEN_FACET_LIMIT]
+                facets[name] = [{'value': label, 'label': label, 'count': count} for count, label in counted]
+            self._matches = everything
+        return {'count': len(everything), 'facets': facets}
+
+    def _index_page(self, start, size):
+        if getattr(self, '_matches', None) is None:
+            property_index.ensure_current()
+            with property_index.lock:
+                self._matches = self._index_match(self._index_base())
+        matches = self._matches
+
+        if self.ordering in ('created_at', '-created_at'):
+            # Ids are handed out in creation order, so the bitmap is already sorted
+            ids = matches.descending() if self.ordering == '-created_at' else iter(matches)
+            ids = list(itertools.islice(ids, start, start + size))
+            rows = self.queryset.in_bulk(ids)
+            return [rows[id_] for id_ in ids if id_ in rows]
+        if len(matches) > INDEX_ID_LIMIT:
+            return list(self.results()[start:start + size])
+        queryset = self.queryset.filter(id__in=list(matches)).order_by(self.ordering, '-id')
+        return list(queryset[start:start + size])
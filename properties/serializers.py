@@ -1,14 +1,48 @@
 from rest_framework import serializers
-from .models import Property, PropertyImage, PropertyDocument, Transaction
+from .models import Property, PropertyImage, PropertyDocument, PropertyImportJob, SavedSearch, Transaction
+from .imports import detect_format
+from .saved_searches import parse_query
+
+
+def _absolute(request, url):
+    if url and request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def _srcset(request, image, fmt):
+    """srcset with absolute URLs when serializing for a request"""
+    srcset = image.srcset(fmt)
+    if not srcset or request is None:
+        return srcset
+    return ', '.join(
+        f'{_absolute(request, url)} {width}'
+        for url, width in (candidate.rsplit(' ', 1) for candidate in srcset.split(', '))
+    )
 
 
 class PropertyImageSerializer(serializers.ModelSerializer):
     """Serializer for PropertyImage model"""
-    
+
+    thumbnail = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    webp_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = PropertyImage
-        fields = ['id', 'image', 'caption', 'is_primary', 'order', 'uploaded_at']
-        read_only_fields = ['id', 'uploaded_at']
+        fields = ['id', 'image', 'caption', 'is_primary', 'order', 'uploaded_at',
+                  'processing_status', 'width', 'height', 'blurhash',
+                  'thumbnail', 'srcset', 'webp_srcset']
+        read_only_fields = ['id', 'uploaded_at', 'processing_status', 'width', 'height', 'blurhash']
+
+    def get_thumbnail(self, obj):
+        return _absolute(self.context.get('request'), obj.derivative_url('thumbnail'))
+
+    def get_srcset(self, obj):
+        return _srcset(self.context.get('request'), obj, 'jpeg')
+
+    def get_webp_srcset(self, obj):
+        return _srcset(self.context.get('request'), obj, 'webp')
 
 
 class PropertyDocumentSerializer(serializers.ModelSerializer):
@@ -47,19 +81,42 @@ class PropertyListSerializer(serializers.ModelSerializer):
     
     agent_name = serializers.CharField(source='agent.full_name', read_only=True)
     primary_image = serializers.SerializerMethodField()
+    primary_image_srcset = serializers.SerializerMethodField()
+    primary_image_blurhash = serializers.SerializerMethodField()
     
     class Meta:
         model = Property
         fields = ['id', 'title', 'property_type', 'city', 'state', 'price', 
                   'currency', 'size_sqft', 'bedrooms', 'bathrooms', 'status', 
-                  'agent_name', 'primary_image', 'listing_date']
-    
+                  'agent_name', 'primary_image', 'primary_image_srcset',
+                  'primary_image_blurhash', 'listing_date']
+
+    def _primary(self, obj):
+        """Primary (or first) image, picked from prefetched images when available"""
+        if not hasattr(obj, '_primary_image'):
+            if 'images' in getattr(obj, '_prefetched_objects_cache', {}):
+                images = list(obj.images.all())
+                obj._primary_image = next((image for image in images if image.is_primary),
+                                          images[0] if images else None)
+            else:
+                obj._primary_image = obj.images.filter(is_primary=True).first() or obj.images.first()
+        return obj._primary_image
+
     def get_primary_image(self, obj):
-        primary = obj.images.filter(is_primary=True).first()
-        if primary:
-            return primary.image.url if primary.image else None
-        first_image = obj.images.first()
-        return first_image.image.url if first_image and first_image.image else None
+        # Card-sized derivative rather than the original upload
+        primary = self._primary(obj)
+        if primary and primary.image:
+            return primary.derivative_url('medium') if 'medium' in primary.derivatives \
+                else primary.derivative_url('thumbnail')
+        return None
+
+    def get_primary_image_srcset(self, obj):
+        primary = self._primary(obj)
+        return primary.srcset('webp') if primary else ''
+
+    def get_primary_image_blurhash(self, obj):
+        primary = self._primary(obj)
+        return primary.blurhash if primary else ''
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -79,3 +136,44 @@ class TransactionSerializer(serializers.ModelSerializer):
                   'updated_at']
         read_only_fields = ['id', 'commission_amount', 'created_at', 'updated_at']
 
+
+
+class PropertyImportJobSerializer(serializers.ModelSerializer):
+    """Serializer for PropertyImportJob model"""
+
+    file = serializers.FileField(write_only=True)
+
+    class Meta:
+        model = PropertyImportJob
+        fields = ['id', 'file', 'file_format', 'status', 'processed_rows',
+                  'created_count', 'updated_count', 'error_count', 'errors',
+                  'message', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = [field for field in fields if field != 'file']
+
+    def validate_file(self, value):
+        if detect_format(value.name) is None:
+            raise serializers.ValidationError('Upload a .csv, .json, .jsonl or .xlsx file.')
+        return value
+
+    def create(self, validated_data):
+        validated_data['file_format'] = detect_format(validated_data['file'].name)
+        return super().create(validated_data)
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    """Serializer for SavedSearch model; ``query`` is the search page's query string"""
+
+    match_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SavedSearch
+        fields = ['id', 'name', 'query', 'frequency', 'match_count',
+                  'last_notified_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'last_notified_at', 'created_at', 'updated_at']
+
+    def validate_query(self, value):
+        params = parse_query(value).copy()
+        # Paging and sorting have no meaning for matching
+        for name in ['page', 'page_size', 'ordering', 'mine']:
+            params.pop(name, None)
+        return params.urlencode()
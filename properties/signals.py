@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from real_estate_platform.response_cache import invalidate_on_change
+from .bitmaps import instance_keys, instance_labels, property_index
+from .images import delete_derivatives, queue_derivatives
+from .market import forget_listings, market_values, record_prices
+from .models import Property, PropertyDocument, PropertyImage, SavedSearch, Transaction
+from .recommendations import instance_row, recommender
+from .saved_searches import index_saved_search, match_listings, matched_values
+
+for model in (Property, PropertyImage, PropertyDocument):
+    invalidate_on_change(model, 'properties')
+invalidate_on_change(Transaction, 'transactions')
+
+
+@receiver(post_save, sender=Property)
+def index_property(sender, instance, **kwargs):
+    property_id, keys, labels = instance.pk, instance_keys(instance), instance_labels(instance)
+    row = instance_row(instance)
+
+    def update():
+        property_index.update(property_id, keys, labels)
+        recommender.update(row)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_init, sender=Property)
+def remember_price(sender, instance, **kwargs):
+    instance._loaded_market_values = market_values(instance)
+
+
+@receiver(post_save, sender=Property)
+def record_price(sender, instance, created, **kwargs):
+    """Append new listings, and changed prices, places and sizes, to the price history"""
+    values = market_values(instance)
+    if created:
+        record_prices([instance], 'listing')
+    elif values != instance._loaded_market_values:
+        record_prices([instance], 'change')
+    instance._loaded_market_values = values
+
+
+@receiver(pre_delete, sender=Property)
+def forget_prices(sender, instance, **kwargs):
+    """The listing's history is deleted with it: refresh the index cells it counted in"""
+    forget_listings([instance.pk])
+
+
+@receiver(post_init, sender=Transaction)
+def remember_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Transaction)
+def record_sale_price(sender, instance, **kwargs):
+    """A completed sale is a price observation of its listing"""
+    if instance.status == 'completed' and instance._loaded_status != 'completed':
+        record_prices([(instance.property, instance.sale_price)], 'sale')
+    instance._loaded_status = instance.status
+
+
+@receiver(post_init, sender=Property)
+def remember_matched_values(sender, instance, **kwargs):
+    instance._loaded_matched_values = matched_values(instance)
+
+
+@receiver(post_save, sender=Property)
+def match_saved_searches(sender, instance, created, **kwargs):
+    """Match new listings, and changed ones when a field searches read changed"""
+    values = matched_values(instance)
+    if created or values != instance._loaded_matched_values:
+        transaction.on_commit(lambda: match_listings([instance]))
+    instance._loaded_matched_values = values
+
+
+@receiver(post_save, sender=SavedSearch)
+def index_search_terms(sender, instance, **kwargs):
+    index_saved_search(instance)
+
+
+@receiver(post_delete, sender=Property)
+def unindex_property(sender, instance, **kwargs):
+    property_id = instance.pk
+
+    def remove():
+        property_index.remove(property_id)
+        recommender.remove(property_id)
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_init, sender=PropertyImage)
+def remember_image(sender, instance, **kwargs):
+    """Remember the stored photo to notice replacements"""
+    instance._loaded_image = instance.__dict__.get('image')
+
+
+@receiver(pre_save, sender=PropertyImage)
+def reset_derivatives(sender, instance, **kwargs):
+    """A new photo needs new derivatives"""
+    if instance.pk and instance.image.name == instance._loaded_image:
+        return
+    if instance.pk:
+        # The worker updates rows directly, so the instance may not know its derivatives
+        stale = PropertyImage.objects.filter(pk=instance.pk).values_list('derivatives', flat=True).first()
+        if stale:
+            storage = instance.image.storage
+            transaction.on_commit(lambda: delete_derivatives(storage, stale))
+    instance.processing_status = 'pending'
+    instance.width = instance.height = None
+    instance.blurhash = ''
+    instance.derivatives = {}
+
+
+@receiver(post_save, sender=PropertyImage)
+def queue_image_processing(sender, instance, **kwargs):
+    if instance.processing_status == 'pending' and instance.image.name != instance._loaded_image:
+        queue_derivatives([instance.pk])
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=PropertyImage)
+def remove_derivatives(sender, instance, **kwargs):
+    storage = instance.image.storage
+    derivatives = instance.derivatives
+    transaction.on_commit(lambda: delete_derivatives(storage, derivatives))
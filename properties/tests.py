@@ -1,3 +1,918 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.test import SimpleTestCase, TestCase, override_settings
+from openpyxl import Workbook, load_workbook
+from PIL import ExifTags, Image
+from messaging.models import ClientPropertyInterest
+from users.models import User
+from . import images
+from .bitmaps import ARRAY_LIMIT, Bitmap, property_index
+from .imports import EXPORT_COLUMNS, PropertyImporter
+from .market import month_start, series
+from .models import (
+    MarketIndexPoint, Property, PropertyImage, PropertyImportJob, PropertyPrice, SavedSearch, SavedSearchMatch
+)
+from .recommendations import (
+    COLUMNS, INTEREST_WEIGHTS, RECOMMENDABLE_STATUSES, VERSION_KEY, encode, recommender,
+)
+from .search import BEDROOM_BUCKETS, FEATURE_FLAGS, PropertySearch, bedroom_bucket
+from .serializers import PropertyImageSerializer
+
+
+def photo(name='photo.jpg', size=(2000, 1000), color=(200, 120, 40), fmt='JPEG', orientation=None):
+    """An encoded in-memory image as an upload"""
+    image = Image.new('RGB', size, color)
+    buffer = io.BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = orientation
+        image.save(buffer, fmt, exif=exif)
+    else:
+        image.save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class BitmapTests(SimpleTestCase):
+    def sets(self):
+        """Id sets spanning several containers, each sparse in one and dense in another"""
+        rng = random.Random(7)
+        sparse = lambda high, n: {(high << 16) | low for low in rng.sample(range(65536), n)}
+        dense = lambda high: sparse(high, ARRAY_LIMIT + 500)
+        return [
+            sparse(0, 300) | dense(1) | {65535, 65536},
+            dense(0) | sparse(1, 200) | sparse(3, 10) | {65535},
+            sparse(1, 50) | dense(2),
+            set(),
+        ]
+
+    def assertBitmap(self, bitmap, ids):
+        self.assertEqual(list(bitmap), sorted(ids))
+        self.assertEqual(len(bitmap), len(ids))
+        self.assertEqual(list(bitmap.descending()), sorted(ids, reverse=True))
+
+    def test_containers_switch_representation(self):
+        bitmap = Bitmap.from_ids(range(ARRAY_LIMIT))
+        self.assertIsInstance(bitmap.containers[0], set)
+        bitmap.add(ARRAY_LIMIT)
+        self.assertIsInstance(bitmap.containers[0], int)
+        for id_ in range(ARRAY_LIMIT + 1):
+            bitmap.discard(id_)
+        self.assertBitmap(bitmap, set())
+
+    def test_operations_match_sets(self):
+        for a in self.sets():
+            for b in self.sets():
+                left, right = Bitmap.from_ids(a), Bitmap.from_ids(b)
+                self.assertBitmap(left & right, a & b)
+                self.assertBitmap(left | right, a | b)
+                self.assertBitmap(left - right, a - b)
+                self.assertEqual(left.count_and(right), len(a & b))
+                # Operands are left untouched
+                self.assertBitmap(left, a)
+                self.assertBitmap(right, b)
+
+    def test_membership_across_container_boundary(self):
+        bitmap = Bitmap.from_ids([65535, 65536, 131072])
+        self.assertIn(65535, bitmap)
+        self.assertIn(65536, bitmap)
+        self.assertNotIn(65537, bitmap)
+        bitmap.discard(65536)
+        self.assertBitmap(bitmap, {65535, 131072})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PROPERTY_BITMAP_INDEX=True)
+class BitmapIndexParityTests(TestCase):
+    """The bitmap index answers search counts exactly like the aggregate queries"""
+
+    def setUp(self):
+        cache.clear()
+        property_index.clear()
+        self.agents = [
+            User.objects.create_user(
+                email=f'agent{n}@example.com', username=f'agent{n}', password='pass', role='agent'
+            )
+            for n in range(2)
+        ]
+        rng = random.Random(11)
+        cities = [('Douala', 'Littoral'), ('Yaounde', 'Centre'), ('Kribi', 'South')]
+        features = ['pool', 'generator', 'parking', 'garden']
+        for n in range(60):
+            city, state = rng.choice(cities)
+            Property.objects.create(
+                title=f'Listing {n}', description='', address=f'{n} Main Street',
+                city=city, state=state, price=rng.randrange(10, 500) * 1000,
+                property_type=rng.choice(['residential', 'commercial', 'land']),
+                status=rng.choice(['available', 'sold', 'pending']),
+                bedrooms=rng.choice([None, 0, 1, 2, 3, 4, 6]),
+                features={key: True for key in features if rng.random() < 0.4},
+                agent=rng.choice(self.agents),
+            )
+        self.addCleanup(property_index.clear)
+
+    def assertParity(self, query, agent_id=None):
+        params = QueryDict(mutable=True)
+        for name, value in query.items():
+            params.setlist(name, value if isinstance(value, list) else [value])
+        indexed = PropertySearch(params, agent_id=agent_id)
+        self.assertTrue(indexed.use_index)
+        with self.settings(PROPERTY_BITMAP_INDEX=False):
+            queried = PropertySearch(params, agent_id=agent_id)
+            self.assertFalse(queried.use_index)
+            expected = queried.counts()
+            expected_page = queried.page(0, 10)
+        self.assertEqual(indexed.counts(), expected, query)
+        self.assertEqual(indexed.page(0, 10), expected_page, query)
+
+    def test_facet_counts_match_queries(self):
+        for params in [
+            {},
+            {'property_type': 'residential'},
+            {'status': 'available', 'bedrooms': '2'},
+            {'bedrooms': '5+', 'features': 'pool'},
+            {'city': 'douala', 'features': ['pool', 'garden']},
+            {'city': ['Douala', 'Kribi'], 'state': 'Littoral', 'min_price': '100000'},
+            {'q': 'listing 1', 'property_type': ['land', 'commercial']},
+        ]:
+            self.assertParity(params)
+        self.assertParity({'status': 'sold'}, agent_id=self.agents[0].pk)
+
+    def test_counts_follow_changes(self):
+        self.assertParity({'city': 'Douala'})
+        listing = Property.objects.filter(city='Douala').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.city, listing.state = 'Kribi', 'South'
+            listing.save()
+        self.assertParity({'city': 'Douala'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Property.objects.filter(city='Kribi').first().delete()
+        self.assertParity({'city': 'Kribi'})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RecommenderParityTests(TestCase):
+    """Similar listings and client matches equal a brute-force scan of every row"""
+
+    def setUp(self):
+        cache.clear()
+        recommender.clear()
+        self.addCleanup(recommender.clear)
+        agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        rng = random.Random(5)
+        cities = ['Douala', 'Yaounde', 'Kribi', 'Limbe']
+        self.listings = [
+            Property.objects.create(
+                title=f'Listing {n}', description='', address=f'{n} Main Street',
+                city=rng.choice(cities), state='Littoral', price=rng.randrange(10_000, 900_000),
+                property_type=rng.choice(['residential', 'commercial', 'land']),
+                status=rng.choice(['available', 'available', 'sold']),
+                bedrooms=rng.choice([None, 1, 2, 3, 4]),
+                size_sqm=rng.choice([None, Decimal(rng.randrange(40, 400))]),
+                latitude=Decimal(f'{rng.uniform(3.8, 4.2):.6f}'),
+                longitude=Decimal(f'{rng.uniform(9.5, 11.6):.6f}'),
+                features={key: True for key in ['pool', 'garden', 'gym'] if rng.random() < 0.4},
+                agent=agent,
+            )
+            for n in range(40)
+        ]
+        self.clients = [
+            User.objects.create_user(
+                email=f'client{n}@example.com', username=f'client{n}', password='pass', role='client'
+            )
+            for n in range(6)
+        ]
+        for client in self.clients:
+            for listing in rng.sample(self.listings, 3):
+                ClientPropertyInterest.objects.create(
+                    client=client, property_obj=listing,
+                    interest_level=rng.choice(list(INTEREST_WEIGHTS)),
+                    status=rng.choice(['interested', 'negotiating', 'not_interested']),
+                )
+
+    def vectors(self):
+        """Vector of every listing, encoded with the statistics of the recommender's build"""
+        rows = list(Property.objects.order_by('id').values_list(*COLUMNS))
+        vectors = encode(rows, recommender.stats)
+        return {row[0]: (row, [float(value) for value in vector]) for row, vector in zip(rows, vectors)}
+
+    def brute_similar(self, property_id, k):
+        vectors = self.vectors()
+        target = vectors[property_id][1]
+        scores = [
+            (sum(a * b for a, b in zip(vector, target)), id_)
+            for id_, (row, vector) in vectors.items()
+            if id_ != property_id and row[2] in RECOMMENDABLE_STATUSES
+        ]
+        return sorted(scores, reverse=True)[:k]
+
+    def brute_clients(self, property_id, k):
+        vectors = self.vectors()
+        target = vectors[property_id][1]
+        profiles = {}
+        interests = ClientPropertyInterest.objects.exclude(status='not_interested')
+        for interest in interests:
+            profile = profiles.setdefault(interest.client_id, [0.0] * len(target))
+            weight = INTEREST_WEIGHTS[interest.interest_level]
+            for index, value in enumerate(vectors[interest.property_obj_id][1]):
+                profile[index] += value * weight
+        scores = []
+        for client_id, profile in profiles.items():
+            norm = sum(value * value for value in profile) ** 0.5
+            score = sum(a * b for a, b in zip(profile, target)) / (norm or 1)
+            if score > 0:
+                scores.append((score, client_id))
+        return sorted(scores, reverse=True)[:k]
+
+    def assertMatches(self, found, expected):
+        self.assertEqual([id_ for id_, _ in found], [id_ for _, id_ in expected])
+        for (_, score), (expected_score, _) in zip(found, expected):
+            self.assertAlmostEqual(score, expected_score, places=4)
+
+    def assertParity(self):
+        for listing in self.listings[:10]:
+            self.assertMatches(recommender.similar(listing.pk, 5), self.brute_similar(listing.pk, 5))
+            self.assertMatches(recommender.matching_clients(listing.pk, 4), self.brute_clients(listing.pk, 4))
+
+    def test_results_match_brute_force(self):
+        self.assertParity()
+
+    def test_results_follow_changes(self):
+        self.assertParity()
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = self.listings[:2]
+            first.status = 'sold'
+            first.save()
+            second.price, second.features = second.price * 3, {'pool': True}
+            second.save()
+            self.listings[2].delete()
+            self.listings[2:3] = []
+            ClientPropertyInterest.objects.create(
+                client=self.clients[0], property_obj=self.listings[5], interest_level='very_high'
+            )
+        # Updated in place: still current, no rebuild needed
+        self.assertEqual(recommender.version, cache.get(VERSION_KEY))
+        self.assertParity()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SavedSearchMatchingTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        client = User.objects.create_user(
+            email='client@example.com', username='client', password='pass', role='client'
+        )
+        self.saved_search = SavedSearch.objects.create(
+            user=client, name='Douala houses', query='city=Douala&property_type=residential&max_price=200000'
+        )
+
+    def create_listing(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Property.objects.create(**{
+                'title': 'House', 'description': '', 'property_type': 'residential',
+                'address': '1 Main Street', 'city': 'Douala', 'state': 'Littoral',
+                'price': 150000, 'agent': self.agent, **fields,
+            })
+
+    def test_new_listing_is_matched(self):
+        listing = self.create_listing()
+        self.assertTrue(SavedSearchMatch.objects.filter(saved_search=self.saved_search, property=listing).exists())
+        self.assertFalse(SavedSearchMatch.objects.filter(property=self.create_listing(city='Kribi')).exists())
+
+    def test_only_searchable_changes_are_matched_again(self):
+        listing = self.create_listing(price=300000)
+        self.assertFalse(SavedSearchMatch.objects.exists())
+        with mock.patch('properties.signals.match_listings') as match:
+            with self.captureOnCommitCallbacks(execute=True):
+                listing.parking_spaces = 2
+                listing.save()
+                Property.objects.get(pk=listing.pk).save()
+            match.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                listing.features['pool'] = True
+                listing.save()
+            match.assert_called_once()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.price = 180000
+            listing.save()
+        self.assertTrue(SavedSearchMatch.objects.filter(property=listing).exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MarketIndexTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.month = month_start(timezone.now())
+
+    def create_listing(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Property.objects.create(**{
+                'title': 'House', 'description': '', 'property_type': 'residential',
+                'address': '1 Main Street', 'city': 'Douala', 'state': 'Littoral',
+                'price': 100000, 'agent': self.agent, **fields,
+            })
+
+    def save(self, listing, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(listing, name, value)
+            listing.save()
+
+    def point(self, city='', property_type='', currency='USD'):
+        return MarketIndexPoint.objects.filter(
+            city_key=city.lower(), property_type=property_type, currency=currency, month=self.month
+        ).first()
+
+    def test_medians_per_cell(self):
+        self.create_listing(price=100000, size_sqft=1000)
+        listing = self.create_listing(price=300000, size_sqft=1000)
+        self.create_listing(price=500000, property_type='commercial')
+        self.assertEqual(self.point('douala', 'residential').median_price, 200000)
+        self.assertEqual(self.point('douala', 'residential').median_price_per_sqft, 200)
+        self.assertEqual(self.point().median_price, 300000)
+        self.assertEqual(self.point().sample_count, 3)
+
+        # The last price of the month counts, once
+        self.save(listing, price=500000)
+        self.assertEqual(self.point('douala', 'residential').median_price, 300000)
+        self.assertEqual(self.point('douala', 'residential').sample_count, 2)
+        self.assertEqual(PropertyPrice.objects.filter(property=listing).count(), 2)
+
+    def test_moved_listing_leaves_its_old_cells(self):
+        listing = self.create_listing()
+        self.save(listing, city='Kribi', property_type='commercial')
+        self.assertEqual(PropertyPrice.objects.filter(property=listing, source='change').count(), 1)
+        self.assertIsNone(self.point('douala', 'residential'))
+        self.assertIsNone(self.point('douala'))
+        self.assertIsNone(self.point('', 'residential'))
+        self.assertEqual(self.point('kribi', 'commercial').sample_count, 1)
+        self.assertEqual(self.point().sample_count, 1)
+
+    def test_resized_listing_is_recorded(self):
+        listing = self.create_listing(size_sqft=1000)
+        self.save(listing, size_sqft=2000)
+        self.assertEqual(self.point().median_price_per_sqft, 50)
+        # Other fields are not price observations
+        self.save(listing, title='Renovated house')
+        self.assertEqual(PropertyPrice.objects.filter(property=listing).count(), 2)
+
+    def test_deleted_listing_leaves_the_index(self):
+        kept = self.create_listing(price=100000)
+        listing = self.create_listing(price=300000, city='Kribi')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertIsNone(self.point('kribi'))
+        self.assertEqual(self.point().median_price, kept.price)
+        self.assertEqual(self.point().sample_count, 1)
+
+    def test_currencies_are_not_mixed(self):
+        self.create_listing(price=100000)
+        self.create_listing(price=60000000, currency='XAF')
+        self.create_listing(price=80000000, currency='XAF')
+        self.assertEqual(self.point().median_price, 100000)
+        self.assertEqual(self.point(currency='XAF').median_price, 70000000)
+
+        currency, points = series()
+        self.assertEqual((currency, [point.median_price for point in points]), ('XAF', [70000000]))
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        response = client.get('/api/properties/market-index/', {'currency': 'usd'})
+        self.assertEqual(response.data['currency'], 'USD')
+        self.assertEqual(response.data['points'][0][2], 100000)
+        response = client.get('/api/properties/market-analysis/')
+        self.assertEqual(response.data['summary']['currency'], 'XAF')
+        self.assertEqual({row['currency'] for row in response.data['markets']}, {'USD', 'XAF'})
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Row ids restart in every test, and so would the derivative names
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.property = Property.objects.create(
+            title='House', description='', property_type='residential', address='1 Main St',
+            city='Douala', state='Littoral', price=100000, agent=agent
+        )
+
+    def create(self, upload):
+        return PropertyImage.objects.create(property=self.property, image=upload)
+
+    def test_derivative_sizes_and_urls(self):
+        image = self.create(photo())
+        self.assertEqual(image.processing_status, 'pending')
+        self.assertEqual(image.derivative_url('medium'), image.image.url)
+
+        self.assertTrue(images.process_image(image.id))
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertEqual((image.width, image.height), (2000, 1000))
+        self.assertEqual(
+            {size: (variant['width'], variant['height']) for size, variant in image.derivatives.items()},
+            {'thumbnail': (320, 160), 'medium': (800, 400), 'large': (1600, 800)}
+        )
+        for size, variant in image.derivatives.items():
+            for fmt, pil_format in [('webp', 'WEBP'), ('jpeg', 'JPEG')]:
+                self.assertEqual(variant[fmt], f'{images.DERIVATIVE_DIR}/{image.id}/{size}.{fmt}')
+                with default_storage.open(variant[fmt]) as stored:
+                    decoded = Image.open(stored)
+                    self.assertEqual((decoded.format, decoded.size), (pil_format, (variant['width'], variant['height'])))
+                    self.assertNotIn(ExifTags.Base.Orientation, decoded.getexif())
+
+        data = PropertyImageSerializer(image).data
+        self.assertEqual(data['thumbnail'], f'/media/{images.DERIVATIVE_DIR}/{image.id}/thumbnail.jpeg')
+        self.assertEqual(data['webp_srcset'], ', '.join(
+            f'/media/{images.DERIVATIVE_DIR}/{image.id}/{size}.webp {width}w'
+            for size, width in [('thumbnail', 320), ('medium', 800), ('large', 1600)]
+        ))
+
+    def test_small_photos_are_not_upscaled(self):
+        image = self.create(photo(size=(500, 250)))
+        images.process_image(image.id)
+        image.refresh_from_db()
+        self.assertEqual(
+            {size: (variant['width'], variant['height']) for size, variant in image.derivatives.items()},
+            {'thumbnail': (320, 160), 'medium': (500, 250)}
+        )
+
+    def test_exif_orientation(self):
+        image = self.create(photo(size=(400, 200), orientation=6))
+        images.process_image(image.id)
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (200, 400))
+        self.assertEqual(image.derivatives['thumbnail']['width'], 160)
+        self.assertEqual(image.derivatives['thumbnail']['height'], 320)
+
+    def test_blurhash(self):
+        image = self.create(photo('flat.png', size=(64, 48), fmt='PNG'))
+        images.process_image(image.id)
+        image.refresh_from_db()
+        # 4x3 components: one size character, one maximum, four DC and 2 per AC component
+        self.assertEqual(len(image.blurhash), 1 + 1 + 4 + 2 * 11)
+        self.assertEqual(image.blurhash[0], images._base83(3 + 2 * 9, 1))
+        # The DC component is the average colour
+        self.assertEqual(image.blurhash[2:6], images._base83((200 << 16) + (120 << 8) + 40, 4))
+        self.assertEqual(image.blurhash, images.blurhash(Image.new('RGB', (64, 48), (200, 120, 40))))
+
+    def test_processing_status_transitions(self):
+        image = self.create(photo(size=(400, 200)))
+        seen = []
+        render = images.render_derivatives
+
+        def recording_render(source):
+            seen.append(PropertyImage.objects.get(id=image.id).processing_status)
+            return render(source)
+
+        with mock.patch.object(images, 'render_derivatives', recording_render):
+            self.assertTrue(images.process_image(image.id))
+            # Claimed once: a second worker finds it no longer pending
+            self.assertFalse(images.process_image(image.id))
+        self.assertEqual(seen, ['processing'])
+        self.assertEqual(PropertyImage.objects.get(id=image.id).processing_status, 'ready')
+
+        broken = self.create(SimpleUploadedFile('broken.jpg', b'not an image'))
+        with self.assertLogs('properties.images', 'ERROR'):
+            self.assertFalse(images.process_image(broken.id))
+        broken.refresh_from_db()
+        self.assertEqual((broken.processing_status, broken.derivatives), ('failed', {}))
+
+        # Forced reprocessing of a failed or ready image
+        self.assertTrue(images.process_image(image.id, force=True))
+
+    def test_replacing_the_photo_removes_old_derivatives(self):
+        image = self.create(photo())
+        images.process_image(image.id)
+        image = PropertyImage.objects.get(id=image.id)
+        old = [variant[fmt] for variant in image.derivatives.values() for fmt in images.FORMATS]
+
+        image.image = photo('other.jpg', size=(600, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        image.refresh_from_db()
+        self.assertEqual((image.processing_status, image.width, image.blurhash, image.derivatives),
+                         ('pending', None, '', {}))
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+        images.process_image(image.id)
+        image.refresh_from_db()
+        self.assertEqual(set(image.derivatives), {'thumbnail', 'medium'})
+        current = [variant[fmt] for variant in image.derivatives.values() for fmt in images.FORMATS]
+        self.assertTrue(all(default_storage.exists(name) for name in current))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in current))
+
+    def test_replaced_while_processing_keeps_the_new_photo(self):
+        image = self.create(photo(size=(400, 200)))
+        render = images.render_derivatives
+
+        def replacing_render(source):
+            result = render(source)
+            PropertyImage.objects.filter(id=image.id).update(image='properties/newer.jpg')
+            return result
+
+        with mock.patch.object(images, 'render_derivatives', replacing_render):
+            self.assertFalse(images.process_image(image.id))
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives, {})
+        self.assertFalse(os.listdir(os.path.join(self.media_root, images.DERIVATIVE_DIR, str(image.id))))
+
+
+@override_settings(IMAGE_PROCESSING_WORKERS=0, SECURE_SSL_REDIRECT=False)
+class BulkImageUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.owner = User.objects.create_user(
+            email='owner@example.com', username='owner', password='pass', role='client'
+        )
+        self.property = Property.objects.create(
+            title='House', description='', property_type='residential', address='1 Main St',
+            city='Douala', state='Littoral', price=100000, agent=self.agent, owner=self.owner
+        )
+        self.url = f'/api/properties/{self.property.id}/images/bulk/'
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def upload(self, files, captions=None):
+        data = {'images': files}
+        if captions is not None:
+            data['captions'] = captions
+        return self.api.post(self.url, data, format='multipart')
+
+    def test_per_file_status_and_gallery_order(self):
+        response = self.upload(
+            [photo('front.jpg', size=(40, 30)), SimpleUploadedFile('notes.txt', b'not an image'),
+             photo('garden.png', size=(40, 30), fmt='PNG')],
+            captions=['Front', 'Notes', '']
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        results = response.data['results']
+        self.assertEqual([result['filename'] for result in results], ['front.jpg', 'notes.txt', 'garden.png'])
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created'])
+        self.assertTrue(results[1]['errors'])
+        self.assertEqual(results[0]['image']['caption'], 'Front')
+        self.assertIsNone(results[2]['image']['caption'])
+        self.assertEqual(results[0]['image']['processing_status'], 'pending')
+
+        # The first image of an empty gallery becomes primary
+        self.assertEqual(
+            list(self.property.images.order_by('order').values_list('order', 'is_primary')),
+            [(0, True), (1, False)]
+        )
+
+        # Later uploads are appended and leave the primary alone
+        self.upload([photo('hall.jpg', size=(40, 30)), photo('roof.jpg', size=(40, 30))])
+        self.assertEqual(
+            list(self.property.images.order_by('order').values_list('order', 'is_primary')),
+            [(0, True), (1, False), (2, False), (3, False)]
+        )
+
+    def test_partial_and_total_failure(self):
+        storage = PropertyImage._meta.get_field('image').storage
+        save = storage._save
+
+        def failing_save(name, content):
+            if 'broken' in name:
+                raise OSError('disk full')
+            return save(name, content)
+
+        with mock.patch.object(storage, '_save', failing_save), self.assertLogs('properties.images', 'ERROR'):
+            response = self.upload([photo('broken.jpg', size=(40, 30)), photo('fine.jpg', size=(40, 30))])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']], ['error', 'created'])
+        self.assertEqual(response.data['results'][0]['errors'], ['The file could not be stored.'])
+        self.assertEqual(self.property.images.count(), 1)
+
+        response = self.upload([SimpleUploadedFile('a.txt', b'text'), SimpleUploadedFile('b.txt', b'text')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['created'], response.data['failed']), (0, 2))
+        self.assertEqual(self.property.images.count(), 1)
+
+        self.assertEqual(self.upload([]).status_code, 400)
+
+    def test_only_the_listing_agent_or_owner_can_upload(self):
+        other_agent = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='agent'
+        )
+        self.api.force_authenticate(other_agent)
+        response = self.upload([photo(size=(40, 30))])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.property.images.exists())
+
+        self.api.force_authenticate(self.owner)
+        self.assertEqual(self.upload([photo(size=(40, 30))]).status_code, 201)
+
+        admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass', role='admin'
+        )
+        self.api.force_authenticate(admin)
+        self.assertEqual(self.upload([photo(size=(40, 30))]).status_code, 201)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ImportExportTests(TestCase):
+    HEADER = 'External Ref,Title,Description,Property Type,Address,City,State,Price,Bedrooms,Features\n'
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', password='pass', role='admin', is_staff=True
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.agent)
+
+    def run_import(self, content, file_format='csv', user=None):
+        job = PropertyImportJob.objects.create(
+            user=user or self.agent, file=ContentFile(content, name=f'listings.{file_format}'),
+            file_format=file_format, status='running'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            return PropertyImporter(job).run()
+
+    def test_row_errors_do_not_stop_the_import(self):
+        job = self.run_import((
+            self.HEADER +
+            'A1,Villa,Sea view,residential,1 Beach Rd,Kribi,South,250000,4,"{""pool"": true}"\n'
+            'A2,,Flat,residential,2 Main St,Douala,Littoral,abc,2,\n'
+            'A3,Castle,Towers,castle,3 Hill Rd,Buea,Southwest,900000,,\n'
+            ',Shop,Corner shop,commercial,4 Market St,Douala,Littoral,70000,,\n'
+        ).encode())
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_rows, job.created_count, job.updated_count, job.error_count), (4, 2, 0, 2))
+        # Rows are numbered as in the file, the header being row 1
+        self.assertEqual([error['row'] for error in job.errors], [3, 4])
+        self.assertEqual(set(job.errors[0]['errors']), {'title', 'price'})
+        self.assertEqual(set(job.errors[1]['errors']), {'property_type'})
+
+        villa = Property.objects.get(external_ref='A1')
+        self.assertEqual((villa.agent, villa.price, villa.bedrooms, villa.features),
+                         (self.agent, Decimal('250000'), 4, {'pool': True}))
+        self.assertTrue(Property.objects.filter(title='Shop', external_ref__isnull=True).exists())
+
+    def test_upsert_by_reference(self):
+        self.run_import((
+            self.HEADER +
+            'A1,Villa,Sea view,residential,1 Beach Rd,Kribi,South,250000,4,\n'
+            'A2,Flat,Two rooms,residential,2 Main St,Douala,Littoral,80000,2,\n'
+        ).encode())
+        villa_id = Property.objects.get(external_ref='A1').id
+
+        # JSON Lines, with the same reference twice in one batch: the last row wins
+        job = self.run_import('\n'.join(json.dumps(row) for row in [
+            {'external_ref': 'A1', 'title': 'Villa', 'description': 'Sea view', 'property_type': 'residential',
+             'address': '1 Beach Rd', 'city': 'Kribi', 'state': 'South', 'price': 240000},
+            {'external_ref': 'A1', 'title': 'Villa', 'description': 'Sea view', 'property_type': 'residential',
+             'address': '1 Beach Rd', 'city': 'Kribi', 'state': 'South', 'price': 230000},
+            {'external_ref': 'A3', 'title': 'Plot', 'description': 'Land', 'property_type': 'land',
+             'address': '5 Road', 'city': 'Limbe', 'state': 'Southwest', 'price': 30000},
+        ]).encode(), file_format='json')
+        self.assertEqual((job.created_count, job.updated_count, job.error_count), (1, 1, 0))
+        villa = Property.objects.get(external_ref='A1')
+        self.assertEqual((villa.id, villa.price), (villa_id, Decimal('230000')))
+
+        # The same reference from another agent is another listing
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='agent'
+        )
+        self.run_import((
+            self.HEADER + 'A1,Villa,Sea view,residential,1 Beach Rd,Kribi,South,500000,,\n'
+        ).encode(), user=other)
+        self.assertEqual(Property.objects.filter(external_ref='A1').count(), 2)
+        self.assertEqual(Property.objects.get(id=villa_id).price, Decimal('230000'))
+
+        # Staff import for the agent named in the row
+        job = self.run_import((
+            'external_ref,title,description,property_type,address,city,state,price,agent_email\n'
+            'A2,Flat,Two rooms,residential,2 Main St,Douala,Littoral,85000,agent@example.com\n'
+            'A9,Flat,Two rooms,residential,9 Main St,Douala,Littoral,85000,nobody@example.com\n'
+        ).encode(), user=self.staff)
+        self.assertEqual((job.created_count, job.updated_count), (0, 1))
+        self.assertEqual(job.errors, [{'row': 3, 'errors': {'agent_email': ['No user with email nobody@example.com.']}}])
+        self.assertEqual(Property.objects.get(agent=self.agent, external_ref='A2').price, Decimal('85000'))
+
+    def test_xlsx_import(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['External Ref', 'Title', 'Description', 'Property Type', 'Address', 'City', 'State', 'Price'])
+        sheet.append(['X1', 'Office', 'Open plan', 'commercial', '7 Avenue', 'Yaounde', 'Centre', 120000])
+        sheet.append([None] * 8)
+        sheet.append(['X2', 'Office', 'Open plan', 'commercial', '8 Avenue', 'Yaounde', 'Centre', -5])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        job = self.run_import(buffer.getvalue(), file_format='xlsx')
+        self.assertEqual((job.processed_rows, job.created_count, job.error_count), (2, 1, 1))
+        self.assertEqual(job.errors[0]['row'], 4)
+        self.assertEqual(Property.objects.get(external_ref='X1').price, Decimal('120000'))
+
+    def export(self, file_format, **params):
+        response = self.api.get('/api/properties/export/', {'file_format': file_format, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="properties.{"jsonl" if file_format == "json" else file_format}"')
+        return b''.join(response.streaming_content)
+
+    def create_listings(self):
+        Property.objects.create(
+            title='Villa', description='Sea view', property_type='residential', address='1 Beach Rd',
+            city='Kribi', state='South', price=250000, agent=self.agent, external_ref='A1',
+            bedrooms=4, features={'pool': True}
+        )
+        Property.objects.create(
+            title='Shop', description='Corner', property_type='commercial', address='4 Market St',
+            city='Douala', state='Littoral', price=70000, agent=self.agent, status='sold'
+        )
+        # Not the agent's: staff only
+        Property.objects.create(
+            title='Plot', description='Land', property_type='land', address='5 Road',
+            city='Limbe', state='Southwest', price=30000, agent=self.staff
+        )
+
+    def test_csv_export(self):
+        self.create_listings()
+        rows = list(csv.DictReader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual([row['title'] for row in rows], ['Villa', 'Shop'])
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(
+            (rows[0]['external_ref'], rows[0]['price'], rows[0]['bedrooms'], rows[0]['features'], rows[0]['agent_email']),
+            ('A1', '250000.00', '4', '{"pool": true}', 'agent@example.com')
+        )
+        self.assertEqual((rows[1]['external_ref'], rows[1]['bedrooms']), ('', ''))
+
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', status='sold').decode())))
+        self.assertEqual([row['title'] for row in rows], ['Shop'])
+
+        self.api.force_authenticate(self.staff)
+        rows = list(csv.DictReader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual([row['title'] for row in rows], ['Villa', 'Shop', 'Plot'])
+
+    def test_json_lines_export(self):
+        self.create_listings()
+        rows = [json.loads(line) for line in self.export('json').decode().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(
+            (rows[0]['title'], rows[0]['price'], rows[0]['bedrooms'], rows[0]['features'], rows[0]['latitude']),
+            ('Villa', '250000.00', 4, {'pool': True}, None)
+        )
+
+    def test_xlsx_export(self):
+        self.create_listings()
+        workbook = load_workbook(io.BytesIO(self.export('xlsx')), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        workbook.close()
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        villa = dict(zip(EXPORT_COLUMNS, rows[1]))
+        self.assertEqual(
+            (villa['title'], Decimal(str(villa['price'])), villa['bedrooms'], villa['features'], villa['agent_email']),
+            ('Villa', Decimal('250000'), 4, '{"pool": true}', 'agent@example.com')
+        )
+        self.assertEqual(len(rows), 3)
+
+    def test_export_imports_back(self):
+        self.create_listings()
+        job = self.run_import(self.export('csv'))
+        # The keyed listing is updated in place; one without a reference cannot be matched
+        self.assertEqual((job.created_count, job.updated_count, job.error_count), (1, 1, 0))
+        self.assertEqual(Property.objects.filter(agent=self.agent, external_ref='A1').count(), 1)
+
+    def test_unknown_export_format(self):
+        response = self.api.get('/api/properties/export/', {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PROPERTY_BITMAP_INDEX=False, SECURE_SSL_REDIRECT=False)
+class SearchFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        rng = random.Random(7)
+        Property.objects.bulk_create([
+            Property(
+                title=f'Listing {n}', description='', property_type=rng.choice(['residential', 'commercial', 'land']),
+                status=rng.choice(['available', 'sold', 'pending']), address=f'{n} Main St',
+                city=rng.choice(['Douala', 'Yaounde', 'Kribi']), state=rng.choice(['Littoral', 'Centre']),
+                price=rng.randrange(10, 100) * 5000, bedrooms=rng.choice([None, 0, 1, 2, 3, 4, 5, 7]),
+                features={key: True for key in ['pool', 'garden', 'gym'] if rng.random() < 0.4},
+                agent=self.agent,
+            )
+            for n in range(200)
+        ])
+        self.listings = list(Property.objects.all())
+
+    def search(self, **params):
+        query = QueryDict(mutable=True)
+        for name, value in params.items():
+            query.setlist(name, value if isinstance(value, list) else [value])
+        return PropertySearch(query)
+
+    def expected(self, params):
+        """Disjunctive counts worked out listing by listing"""
+        search = self.search(**params)
+        expected = {'count': sum(search.matches(listing) for listing in self.listings)}
+
+        def others(name):
+            without = self.search(**{key: value for key, value in params.items() if key != name})
+            return [listing for listing in self.listings if without.matches(listing)]
+
+        for name, choices in PropertySearch.CHOICE_FACETS.items():
+            pool = others(name)
+            expected[name] = {value: sum(getattr(listing, name) == value for listing in pool) for value, _ in choices}
+        pool = others('bedrooms')
+        expected['bedrooms'] = {
+            value: sum(bedroom_bucket(listing.bedrooms) == value for listing in pool) for value, _ in BEDROOM_BUCKETS
+        }
+        matching = [listing for listing in self.listings if search.matches(listing)]
+        expected['features'] = {key: sum(bool(listing.features.get(key)) for listing in matching)
+                                for key in FEATURE_FLAGS}
+        for name in PropertySearch.OPEN_FACETS:
+            values = [getattr(listing, name) for listing in others(name)]
+            expected[name] = {value: values.count(value) for value in set(values)}
+        return expected
+
+    def actual(self, counts):
+        facets = counts['facets']
+        actual = {'count': counts['count']}
+        for name in [*PropertySearch.CHOICE_FACETS, 'bedrooms', 'features', *PropertySearch.OPEN_FACETS]:
+            actual[name] = {item['value']: item['count'] for item in facets[name]}
+        return actual
+
+    def test_counts_with_combined_filters(self):
+        for params in [
+            {},
+            {'property_type': 'residential'},
+            {'property_type': ['residential', 'land'], 'city': 'Douala'},
+            {'status': 'available', 'bedrooms': ['2', '5+'], 'min_price': '150000'},
+            {'city': 'douala,kribi', 'state': 'Littoral', 'features': 'pool', 'max_price': '300000'},
+            {'property_type': 'commercial', 'status': 'sold', 'bedrooms': '0', 'features': ['pool', 'gym']},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.actual(self.search(**params).counts()), self.expected(params))
+
+    def test_selected_facet_keeps_its_alternatives(self):
+        counts = self.search(property_type='residential').counts()
+        types = {item['value']: item['count'] for item in counts['facets']['property_type']}
+        self.assertEqual(counts['count'], types['residential'])
+        self.assertEqual(sum(types.values()), len(self.listings))
+
+    def test_one_aggregate_and_one_grouped_query_per_open_facet(self):
+        search = self.search(property_type='residential', city='Douala', bedrooms='3', features='pool',
+                             min_price='100000')
+        # Total, types, statuses, bedrooms and features in one aggregate; cities and states grouped
+        with self.assertNumQueries(1 + len(PropertySearch.OPEN_FACETS)):
+            search.counts()
+
+        api = APIClient()
+        api.force_authenticate(self.agent)
+        # Plus the page and its images
+        with self.assertNumQueries(3 + len(PropertySearch.OPEN_FACETS)):
+            response = api.get('/api/properties/search/', {'city': 'Douala', 'features': 'garden'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), min(response.data['count'], 20))
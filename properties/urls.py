@@ -2,12 +2,25 @@ from django.urls import path
 from .views import (
     PropertyListCreateView,
     PropertyDetailView,
+    PropertySearchView,
+    SavedSearchListCreateView,
+    SavedSearchDetailView,
+    SavedSearchMatchesView,
+    SimilarPropertiesView,
+    MatchingClientsView,
     PropertyImageListCreateView,
+    PropertyImageBulkUploadView,
     PropertyImageDetailView,
     PropertyDocumentListCreateView,
     PropertyDocumentDetailView,
     TransactionListCreateView,
     TransactionDetailView,
+    PropertyImportListCreateView,
+    PropertyImportDetailView,
+    export_properties,
+    market_analysis_report,
+    market_index,
+    property_price_history,
     my_properties,
     my_transactions
 )
@@ -17,9 +30,30 @@ urlpatterns = [
     path('', PropertyListCreateView.as_view(), name='property-list-create'),
     path('<int:pk>/', PropertyDetailView.as_view(), name='property-detail'),
     path('my-properties/', my_properties, name='my-properties'),
+    path('search/', PropertySearchView.as_view(), name='property-search'),
+
+    # Price history and market index
+    path('<int:pk>/price-history/', property_price_history, name='property-price-history'),
+    path('market-index/', market_index, name='market-index'),
+    path('market-analysis/', market_analysis_report, name='market-analysis'),
+
+    # Saved searches
+    path('saved-searches/', SavedSearchListCreateView.as_view(), name='saved-search-list-create'),
+    path('saved-searches/<int:pk>/', SavedSearchDetailView.as_view(), name='saved-search-detail'),
+    path('saved-searches/<int:pk>/matches/', SavedSearchMatchesView.as_view(), name='saved-search-matches'),
+
+    # Recommendations
+    path('<int:pk>/similar/', SimilarPropertiesView.as_view(), name='property-similar'),
+    path('<int:pk>/matching-clients/', MatchingClientsView.as_view(), name='property-matching-clients'),
+
+    # Bulk import / export
+    path('imports/', PropertyImportListCreateView.as_view(), name='property-import-list-create'),
+    path('imports/<int:pk>/', PropertyImportDetailView.as_view(), name='property-import-detail'),
+    path('export/', export_properties, name='property-export'),
     
     # Property Images
     path('<int:property_id>/images/', PropertyImageListCreateView.as_view(), name='property-image-list-create'),
+    path('<int:property_id>/images/bulk/', PropertyImageBulkUploadView.as_view(), name='property-image-bulk-upload'),
     path('images/<int:pk>/', PropertyImageDetailView.as_view(), name='property-image-detail'),
     
     # Property Documents
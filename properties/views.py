@@ -1,22 +1,41 @@
-from rest_framework import generics, filters, status
+from rest_framework import generics, filters, serializers, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Property, PropertyImage, PropertyDocument, Transaction
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.shortcuts import get_object_or_404
+from django.http import FileResponse, StreamingHttpResponse
+import tempfile
+from datetime import date
+from real_estate_platform.conditional import ConditionalGetMixin
+from real_estate_platform.response_cache import CachedResponseMixin, invalidate_tags
+from .images import MAX_BULK_IMAGES, queue_derivatives, save_originals
+from .imports import export_csv, export_json_lines, export_xlsx
+from .market import market_analysis, month_start, series
+from .recommendations import recommender
+from .search import MAX_PAGE_SIZE, PropertySearch
+from .models import Property, PropertyImage, PropertyDocument, PropertyImportJob, SavedSearch, Transaction
 from .serializers import (
     PropertySerializer,
     PropertyListSerializer,
     PropertyImageSerializer,
     PropertyDocumentSerializer,
+    PropertyImportJobSerializer,
+    SavedSearchSerializer,
     TransactionSerializer
 )
 
 
-class PropertyListCreateView(generics.ListCreateAPIView):
+class PropertyListCreateView(ConditionalGetMixin, CachedResponseMixin, generics.ListCreateAPIView):
     """List and create properties"""
 
-    queryset = Property.objects.all()
+    cache_tags = ('properties', 'users')
+    queryset = Property.objects.select_related('agent').prefetch_related('images')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['property_type', 'status', 'city', 'state', 'agent']
@@ -32,14 +51,156 @@ class PropertyListCreateView(generics.ListCreateAPIView):
         serializer.save(agent=self.request.user)
 
 
-class PropertyDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PropertySearchView(generics.GenericAPIView):
+    """
+    Faceted search: one page of matching properties together with the
+    facet counts for the current filters (see properties.search)
+    """
+
+    serializer_class = PropertyListSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = Property.objects.select_related('agent').prefetch_related('images')
+        agent_id = request.user.id if request.query_params.get('mine') else None
+        search = PropertySearch(request.query_params, queryset, agent_id=agent_id)
+
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': 'page and page_size must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        counts = search.counts()
+        start = (page - 1) * page_size
+        results = search.page(start, page_size)
+        return Response({
+            'count': counts['count'],
+            'page': page,
+            'page_size': page_size,
+            'results': self.get_serializer(results, many=True).data,
+            'facets': counts['facets'],
+        })
+
+
+class PropertyDetailView(ConditionalGetMixin, CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a property"""
 
+    cache_tags = ('properties', 'users')
     queryset = Property.objects.all()
     serializer_class = PropertySerializer
     permission_classes = [IsAuthenticated]
 
 
+class SavedSearchListCreateView(generics.ListCreateAPIView):
+    """List and save the current user's searches"""
+
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).annotate(match_count=Count('matches'))
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class SavedSearchDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """Retrieve, update, or delete a saved search"""
+
+    serializer_class = SavedSearchSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).annotate(match_count=Count('matches'))
+
+
+class SavedSearchMatchesView(generics.ListAPIView):
+    """Listings that matched a saved search, most recent match first"""
+
+    serializer_class = PropertyListSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        saved_search = get_object_or_404(SavedSearch, pk=self.kwargs['pk'], user=self.request.user)
+        return Property.objects.filter(saved_search_matches__saved_search=saved_search) \
+            .select_related('agent').prefetch_related('images') \
+            .order_by('-saved_search_matches__matched_at')
+
+
+def _can_edit_listing(user, property_obj):
+    """The listing's agent and owner, and administrators, may change it"""
+    return user.id in (property_obj.agent_id, property_obj.owner_id) or user.is_staff or user.role == 'admin'
+
+
+def _limit(request, default, maximum):
+    try:
+        return min(max(int(request.query_params.get('limit', default)), 1), maximum)
+    except ValueError:
+        return default
+
+
+class SimilarPropertiesView(generics.GenericAPIView):
+    """Available listings most like a property, best first (see properties.recommendations)"""
+
+    serializer_class = PropertyListSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        matches = recommender.similar(pk, _limit(request, 6, 24))
+        if not matches and not Property.objects.filter(pk=pk).exists():
+            return Response({'error': 'Property not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        properties = Property.objects.select_related('agent').prefetch_related('images') \
+            .in_bulk([property_id for property_id, _ in matches])
+        results = []
+        for property_id, score in matches:
+            if property_id in properties:
+                data = self.get_serializer(properties[property_id]).data
+                data['similarity'] = round(score, 4)
+                results.append(data)
+        return Response(results)
+
+
+class MatchingClientsView(generics.GenericAPIView):
+    """
+    Clients whose recorded interests best fit a property, for its agent to
+    contact; each with any interest they already recorded in the property
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        from messaging.models import ClientPropertyInterest
+        from users.models import User
+
+        property_obj = get_object_or_404(Property, pk=pk)
+        if property_obj.agent_id != request.user.id and not (request.user.is_staff or request.user.role == 'admin'):
+            return Response({'error': 'Only the listing agent can see matching clients'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        matches = recommender.matching_clients(pk, _limit(request, 20, 100))
+        client_ids = [client_id for client_id, _ in matches]
+        clients = User.objects.in_bulk(client_ids)
+        recorded = dict(
+            ClientPropertyInterest.objects.filter(property_obj=property_obj, client_id__in=client_ids)
+            .values_list('client_id', 'status')
+        )
+        return Response([
+            {
+                'client': {
+                    'id': client_id,
+                    'full_name': clients[client_id].full_name,
+                    'email': clients[client_id].email,
+                    'phone': clients[client_id].phone,
+                },
+                'similarity': round(score, 4),
+                'interest_status': recorded.get(client_id),
+            }
+            for client_id, score in matches if client_id in clients
+        ])
+
+
 class PropertyImageListCreateView(generics.ListCreateAPIView):
     """List and create property images"""
 
@@ -55,6 +216,94 @@ class PropertyImageListCreateView(generics.ListCreateAPIView):
         serializer.save(property_id=property_id)
 
 
+class PropertyImageBulkUploadView(generics.GenericAPIView):
+    """
+    Upload many images of a property in one multipart request (``images``,
+    with optional ``captions`` in the same order); returns a status per file
+    """
+
+    serializer_class = PropertyImageSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, property_id):
+        property_obj = get_object_or_404(Property, pk=property_id)
+        if not _can_edit_listing(request.user, property_obj):
+            return Response({'error': 'Only the listing agent or owner can upload images'},
+                            status=status.HTTP_403_FORBIDDEN)
+        uploads = request.FILES.getlist('images')
+        captions = request.data.getlist('captions')
+        if not uploads:
+            return Response({'error': 'No images provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(uploads) > MAX_BULK_IMAGES:
+            return Response({'error': f'At most {MAX_BULK_IMAGES} images per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = [{'filename': upload.name} for upload in uploads]
+        image_field = serializers.ImageField()
+        accepted = []
+        for index, upload in enumerate(uploads):
+            try:
+                image_field.run_validation(upload)
+            except ValidationError as error:
+                results[index].update(status='error', errors=error.detail)
+            except DjangoValidationError as error:
+                results[index].update(status='error', errors=error.messages)
+            else:
+                accepted.append(index)
+
+        stored = save_originals(PropertyImage(property=property_obj), [uploads[index] for index in accepted])
+        saved = []
+        for index, name in zip(accepted, stored):
+            if isinstance(name, Exception):
+                results[index].update(status='error', errors=['The file could not be stored.'])
+            else:
+                saved.append((index, name))
+
+        images = []
+        if saved:
+            try:
+                images = self._create_images(property_id, saved, captions)
+            except Exception:
+                storage = PropertyImage._meta.get_field('image').storage
+                for _, name in saved:
+                    storage.delete(name)
+                raise
+
+        serialized = self.get_serializer(images, many=True).data
+        for (index, _), data in zip(saved, serialized):
+            results[index].update(status='created', image=data)
+
+        return Response(
+            {'created': len(images), 'failed': len(uploads) - len(images), 'results': results},
+            status=status.HTTP_201_CREATED if images else status.HTTP_400_BAD_REQUEST
+        )
+
+    @staticmethod
+    def _create_images(property_id, saved, captions):
+        """Insert the rows, appending to the gallery order under a lock on the property"""
+        with transaction.atomic():
+            property_obj = Property.objects.select_for_update().get(pk=property_id)
+            current = PropertyImage.objects.filter(property=property_obj).aggregate(
+                last=Max('order'), primaries=Count('id', filter=Q(is_primary=True))
+            )
+            start = 0 if current['last'] is None else current['last'] + 1
+            images = PropertyImage.objects.bulk_create([
+                PropertyImage(
+                    property=property_obj,
+                    image=name,
+                    caption=captions[index] if index < len(captions) and captions[index] else None,
+                    order=start + position,
+                    is_primary=not current['primaries'] and position == 0,
+                )
+                for position, (index, name) in enumerate(saved)
+            ])
+            queue_derivatives(image.id for image in images)
+            # bulk_create sends no signals
+            transaction.on_commit(lambda: invalidate_tags('properties'))
+        return images
+
+
 class PropertyImageDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a property image"""
 
@@ -86,9 +335,10 @@ class PropertyDocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
 
-class TransactionListCreateView(generics.ListCreateAPIView):
+class TransactionListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """List and create transactions"""
 
+    cache_tags = ('properties', 'transactions', 'users')
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
@@ -100,9 +350,10 @@ class TransactionListCreateView(generics.ListCreateAPIView):
         serializer.save(agent=self.request.user)
 
 
-class TransactionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class TransactionDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, or delete a transaction"""
 
+    cache_tags = ('properties', 'transactions', 'users')
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
@@ -113,7 +364,7 @@ class TransactionDetailView(generics.RetrieveUpdateDestroyAPIView):
 def my_properties(request):
     """Get properties for the current user"""
 
-    properties = Property.objects.filter(agent=request.user)
+    properties = Property.objects.filter(agent=request.user).select_related('agent').prefetch_related('images')
     serializer = PropertyListSerializer(properties, many=True)
     return Response(serializer.data)
 
@@ -126,3 +377,141 @@ def my_transactions(request):
     transactions = Transaction.objects.filter(agent=request.user)
     serializer = TransactionSerializer(transactions, many=True)
     return Response(serializer.data)
+
+
+class PropertyImportListCreateView(generics.ListCreateAPIView):
+    """Upload a listings file to import in the background, and list past imports"""
+
+    serializer_class = PropertyImportJobSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def get_queryset(self):
+        return PropertyImportJob.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class PropertyImportDetailView(generics.RetrieveAPIView):
+    """Progress and row errors of an import"""
+
+    serializer_class = PropertyImportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return PropertyImportJob.objects.filter(user=self.request.user)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_properties(request):
+    """
+    Export properties as CSV, JSON Lines or XLSX (``?file_format=``), in the
+    columns the importer reads; staff export all listings, agents their own
+    """
+    properties = Property.objects.all() if request.user.is_staff else Property.objects.filter(agent=request.user)
+    for field in ['status', 'property_type', 'city', 'state']:
+        if request.query_params.get(field):
+            properties = properties.filter(**{field: request.query_params[field]})
+
+    file_format = request.query_params.get('file_format', 'csv')
+    if file_format == 'csv':
+        response = StreamingHttpResponse(export_csv(properties), content_type='text/csv')
+    elif file_format == 'json':
+        response = StreamingHttpResponse(export_json_lines(properties), content_type='application/x-ndjson')
+        file_format = 'jsonl'
+    elif file_format == 'xlsx':
+        # XLSX is a zip archive and cannot be streamed; build it on disk
+        file = tempfile.TemporaryFile()
+        export_xlsx(properties, file)
+        file.seek(0)
+        response = FileResponse(
+            file, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    else:
+        return Response({'error': 'file_format must be csv, json or xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+
+    response['Content-Disposition'] = f'attachment; filename="properties.{file_format}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def property_price_history(request, pk):
+    """Price history of a listing as [recorded_at, price, source] points, oldest first"""
+
+    property_obj = get_object_or_404(Property, pk=pk)
+    points = property_obj.price_history.order_by('recorded_at').values_list('recorded_at', 'price', 'source')
+    return Response({
+        'property': property_obj.id,
+        'currency': property_obj.currency,
+        'points': [[recorded_at.isoformat(), float(price), source] for recorded_at, price, source in points],
+    })
+
+
+def _month(value):
+    """First day of the month of a 'YYYY-MM' or 'YYYY-MM-DD' parameter"""
+    if not value:
+        return None
+    try:
+        return month_start(date.fromisoformat(value if len(value) > 7 else f'{value}-01'))
+    except ValueError:
+        raise ValidationError({'month': f'{value!r} is not a YYYY-MM month'})
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def market_index(request):
+    """
+    One monthly market index series (``city`` and ``property_type``, both
+    optional for the roll-ups, ``start``/``end`` as YYYY-MM, ``currency``
+    defaulting to the most observed one), as compact rows
+    """
+
+    city = request.query_params.get('city', '')
+    property_type = request.query_params.get('property_type', '')
+    currency, points = series(city, property_type, _month(request.query_params.get('start')),
+                              _month(request.query_params.get('end')),
+                              request.query_params.get('currency', '').upper())
+    return Response({
+        'city': city,
+        'property_type': property_type,
+        'currency': currency,
+        'columns': ['month', 'median_price_per_sqft', 'median_price', 'sample_count'],
+        'points': [
+            [point.month.strftime('%Y-%m'), _float(point.median_price_per_sqft),
+             _float(point.median_price), point.sample_count]
+            for point in points
+        ],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def market_analysis_report(request):
+    """Market analysis report: change of the index per city and type between two months"""
+
+    today = month_start(date.today())
+    end = _month(request.query_params.get('end')) or today
+    start = _month(request.query_params.get('start')) or date(end.year - 1, end.month, 1)
+    markets = market_analysis(start, end)
+    # One overall row per currency; markets are sorted by observations
+    overall = next((row for row in markets if not row['city'] and not row['property_type']), None)
+    return Response({
+        'start': start.strftime('%Y-%m'),
+        'end': end.strftime('%Y-%m'),
+        'summary': {
+            'currency': overall and overall['currency'],
+            'median_price': overall and overall['median_price'],
+            'median_price_per_sqft': overall and overall['median_price_per_sqft'],
+            'price_change': overall and overall['price_change'],
+            'price_per_sqft_change': overall and overall['price_per_sqft_change'],
+            'markets': sum(1 for row in markets if row['city'] and row['property_type']),
+        },
+        'markets': markets,
+    })
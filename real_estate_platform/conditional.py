@@ -0,0 +1,87 @@
+"""
+Conditional GET (ETag, Last-Modified) for DRF list and detail endpoints.
+
+``ConditionalGetMixin`` answers ``If-None-Match`` and ``If-Modified-Since``
+with 304 before anything is serialized. The state a response is validated
+against is cheap to read:
+
+- a list: the row count and latest ``updated_at`` of the filtered
+  queryset, in one aggregate query
+- a detail: the object's ``updated_at``
+
+combined with the versions of the view's ``cache_tags`` (see
+response_cache), which move when related rows change that ``updated_at``
+does not see: a user's name, a listing's photos, a read cursor. Views that
+also use ``CachedResponseMixin`` already name every tag their data depends
+on, so the tag versions alone validate them and a 304 needs no query,
+as long as every worker sees the same versions (``cache_available``).
+
+ETags are weak (the representation is not hashed) and vary with the user
+and the renderer. Only details send Last-Modified: deleting a row does not
+move a list's latest ``updated_at``.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+from .response_cache import CachedResponseMixin, cache_available, tag_versions
+
+
+class ConditionalGetMixin:
+    """Conditional ``list`` and ``retrieve``; list it before CachedResponseMixin"""
+
+    cache_tags = ()
+    last_modified_field = 'updated_at'
+
+    def validated_by_tags(self):
+        return isinstance(self, CachedResponseMixin) and cache_available()
+
+    def conditional_queryset(self):
+        """Rows a list's ETag is computed from"""
+        return self.filter_queryset(self.get_queryset())
+
+    def make_etag(self, request, *state):
+        parts = [
+            request.user.pk, request.accepted_renderer.format,
+            *state, *tag_versions(self.cache_tags),
+        ]
+        return f'W/"{hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()}"'
+
+    def conditional_response(self, request, etag, respond, last_modified=None):
+        """304 (or 412) when the client's copy is current, else ``respond()``"""
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        parent = super().list
+        state = ()
+        if not self.validated_by_tags():
+            state = self.conditional_queryset().order_by().aggregate(
+                count=Count('pk'), last_modified=Max(self.last_modified_field)
+            ).values()
+        return self.conditional_response(
+            request, self.make_etag(request, *state), lambda: parent(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.validated_by_tags():
+            parent = super().retrieve
+            return self.conditional_response(
+                request, self.make_etag(request, sorted(kwargs.items())),
+                lambda: parent(request, *args, **kwargs)
+            )
+        instance = self.get_object()
+        modified = getattr(instance, self.last_modified_field)
+        return self.conditional_response(
+            request, self.make_etag(request, instance.pk, modified),
+            lambda: Response(self.get_serializer(instance).data), modified
+        )
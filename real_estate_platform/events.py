@@ -0,0 +1,33 @@
+"""
+ASGI entry of the events process, serving only the Server-Sent Events
+stream (notifications.views.event_stream).
+
+Streams hold a connection open per client, which an ASGI server handles
+cheaply. Everything else stays on the WSGI workers (wsgi.py): under ASGI,
+Django buffers synchronous streaming responses whole, so document downloads
+and property exports would be read into memory. The front server routes the
+stream path to this process, see DEPLOYMENT_GUIDE.md.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'real_estate_platform.settings')
+
+django_application = get_asgi_application()
+
+from django.urls import reverse  # noqa: E402 (needs the app registry)
+
+STREAM_PATHS = {reverse('notification-stream')}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] not in STREAM_PATHS:
+        await send({
+            'type': 'http.response.start', 'status': 404,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+        })
+        await send({'type': 'http.response.body', 'body': b'Served by the web process'})
+        return
+    await django_application(scope, receive, send)
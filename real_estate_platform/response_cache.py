@@ -0,0 +1,218 @@
+"""
+Cache of DRF GET responses for read-heavy, slow-changing endpoints.
+
+A cached view keeps the data of its successful GET responses in the
+default cache under a key made of the absolute URL (host included, since
+serializers build absolute media URLs) with its query sorted, the caller's
+scope and the current version of every tag the view reads:
+
+- ``public``: everyone allowed in sees the same data
+- ``role``: the data depends on the user's role or staff flag
+- ``user``: the data is per user
+
+Tags name groups of models (``properties``, ``materials``, ``users`` ...).
+Apps register their models with ``invalidate_on_change``; once a save or
+delete commits, the tag versions are bumped, so keys built afterwards are
+new and the old entries are never read again and simply expire. Writes that
+send no signals (``bulk_create``, ``QuerySet.update``) call
+``invalidate_tags`` themselves.
+
+Tag versions only reach every web worker through a shared cache
+(``settings.SHARED_CACHE``); with the per-process local-memory cache and
+more than one worker (``settings.WEB_CONCURRENCY``) responses are not
+cached, see ``cache_available``.
+
+Hits and misses are counted per view in the same cache, see
+``cache_stats`` and ``api/cache-stats/``.
+"""
+import functools
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+KEY_PREFIX = 'api-cache'
+
+# Names of the views using the cache, for the metrics
+CACHED_VIEWS = set()
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def _new_version():
+    # A tag version evicted from the cache restarts above every value it
+    # could have reached, so entries of the lost version are never reused
+    return time.time_ns()
+
+
+def cache_available():
+    """Whether every web worker sees the tag versions bumped by the others"""
+    return settings.SHARED_CACHE or settings.WEB_CONCURRENCY <= 1
+
+
+def tag_versions(tags):
+    """Current version of each tag, in order"""
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = cache.get_or_set(key, _new_version, None)
+    return [versions[key] for key in keys]
+
+
+def invalidate_tags(*tags):
+    """Retire every cached response that depends on one of the tags"""
+    for tag in tags:
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            cache.set(_tag_key(tag), _new_version(), None)
+
+
+def invalidate_on_change(model, *tags, ignore_fields=()):
+    """
+    Invalidate ``tags`` after rows of ``model`` are saved or deleted; saves
+    limited to ``ignore_fields`` (e.g. ``last_login``) leave them alone
+    """
+    ignored = set(ignore_fields)
+
+    def changed(sender, instance, update_fields=None, **kwargs):
+        if update_fields and ignored.issuperset(update_fields):
+            return
+        transaction.on_commit(lambda: invalidate_tags(*tags))
+
+    uid = f'response_cache:{model._meta.label}:{",".join(tags)}'
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=uid)
+
+
+def _stats_key(view_name, outcome):
+    return f'{KEY_PREFIX}:{outcome}:{view_name}'
+
+
+def _count(view_name, outcome):
+    key = _stats_key(view_name, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def cache_stats():
+    """Hits, misses and hit rate of every cached view"""
+    names = sorted(CACHED_VIEWS)
+    counted = cache.get_many([
+        _stats_key(name, outcome) for name in names for outcome in ('hits', 'misses')
+    ])
+    stats = []
+    for name in names:
+        hits = counted.get(_stats_key(name, 'hits'), 0)
+        misses = counted.get(_stats_key(name, 'misses'), 0)
+        stats.append({
+            'view': name, 'hits': hits, 'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        })
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([
+        _stats_key(name, outcome) for name in CACHED_VIEWS for outcome in ('hits', 'misses')
+    ])
+
+
+def cache_response(method):
+    """Serve a GET handler of a ``CachedResponseMixin`` view from the cache"""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: method(self, request, *args, **kwargs))
+    return wrapper
+
+
+class CachedResponseMixin:
+    """
+    Caches ``list`` and ``retrieve``; views overriding those (or adding GET
+    actions) decorate them with ``cache_response``
+    """
+
+    cache_tags = ()
+    cache_scope = 'public'
+    # Seconds; None uses settings.API_CACHE_TIMEOUT, 0 disables the cache
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        CACHED_VIEWS.add(cls.__name__)
+
+    def cache_scope_key(self, request):
+        user = request.user
+        if self.cache_scope == 'user':
+            return f'user:{user.pk}'
+        if self.cache_scope == 'role':
+            return f'role:{getattr(user, "role", "anonymous")}:{int(user.is_staff)}'
+        return 'public'
+
+    def response_cache_key(self, request):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        parts = [
+            self.cache_scope_key(request),
+            request.build_absolute_uri(request.path),
+            query,
+            *map(str, tag_versions(self.cache_tags)),
+        ]
+        digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        return f'{KEY_PREFIX}:{type(self).__name__}:{digest}'
+
+    def cached_response(self, request, respond):
+        timeout = settings.API_CACHE_TIMEOUT if self.cache_timeout is None else self.cache_timeout
+        if not timeout or not cache_available():
+            return respond()
+
+        name = type(self).__name__
+        # Tag versions are read before the database, so data read while a
+        # write commits is stored under the version that write retires
+        key = self.response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count(name, 'hits')
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(name, 'misses')
+        response = respond()
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class ResponseCacheStatsView(generics.GenericAPIView):
+    """Hit and miss counts of the cached views (staff); DELETE resets them"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
+
+    def delete(self, request):
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
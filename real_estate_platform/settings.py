@@ -103,7 +103,10 @@ TEMPLATES = [
     },
 ]
 
+# The API runs on WSGI; only the event stream is served over ASGI, by the
+# events process (real_estate_platform.events)
 WSGI_APPLICATION = 'real_estate_platform.wsgi.application'
+ASGI_APPLICATION = 'real_estate_platform.asgi.application'
 
 
 # Database
@@ -210,6 +213,47 @@ CORS_ALLOW_CREDENTIALS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads generating property image derivatives in each web process
+# (0 leaves them to `manage.py process_property_images`)
+IMAGE_PROCESSING_WORKERS = env.int('IMAGE_PROCESSING_WORKERS', default=2)
+
+# Cache used by the API response cache, dashboards and index version
+# counters. The local-memory default is per process, for development only:
+# anything running more than one process (web workers, the Procfile worker
+# and notifier) needs a shared backend, e.g. CACHE_URL=redis://host:6379/1,
+# so that invalidations reach every process.
+CACHES = {'default': env.cache('CACHE_URL', default='locmemcache://')}
+SHARED_CACHE = not CACHES['default']['BACKEND'].endswith(('.LocMemCache', '.DummyCache'))
+
+# Answer property search facets from an in-memory bitmap index per process
+# instead of aggregate queries (see properties.bitmaps). Processes learn of
+# each other's writes through the cache, so this needs SHARED_CACHE
+# (enforced by the properties.E001 check outside DEBUG).
+PROPERTY_BITMAP_INDEX = env.bool('PROPERTY_BITMAP_INDEX', default=SHARED_CACHE)
+
+# Partial files of chunked document uploads (kept outside MEDIA_ROOT)
+CHUNKED_UPLOAD_DIR = env('CHUNKED_UPLOAD_DIR', default=str(BASE_DIR / 'tmp' / 'uploads'))
+
+# How document downloads are transferred once permissions are checked:
+# 'django' streams them from the app, 'x-accel-redirect' (nginx) and
+# 'x-sendfile' (Apache, lighttpd) hand the file over to the front server
+FILE_DOWNLOAD_BACKEND = env('FILE_DOWNLOAD_BACKEND', default='django')
+# nginx location marked `internal` whose alias is MEDIA_ROOT
+FILE_DOWNLOAD_ACCEL_PREFIX = env('FILE_DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+
+# Web worker processes; gunicorn reads the same variable for --workers
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', default=1)
+
+# Seconds cached API responses are kept (0 turns the response cache off);
+# entries are retired as soon as their models change, this only bounds how
+# long writes that bypass signals can go unnoticed. Without SHARED_CACHE the
+# response cache (and tag-only ETags) is off when WEB_CONCURRENCY > 1: one
+# worker's invalidations would leave the others serving stale data.
+API_CACHE_TIMEOUT = env.int('API_CACHE_TIMEOUT', default=60)
+
+# Per-user document storage quota in bytes (0 disables the limit)
+DOCUMENT_STORAGE_QUOTA = env.int('DOCUMENT_STORAGE_QUOTA', default=0)
+
 # Static Files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
@@ -222,6 +266,17 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='RIVERHEDGE PARTNERS <noreply@riverhedgepartners.com>')
 
+# Real-time event delivery (Server-Sent Events)
+# PostgresBroker relays events between all processes (web workers, the
+# Procfile worker and notifier, reminder commands) with LISTEN/NOTIFY.
+# LocalBroker only reaches streams served by the publishing process and is
+# the default for single-process development on SQLite only.
+REALTIME_BROKER = env('REALTIME_BROKER', default=(
+    'notifications.realtime.PostgresBroker'
+    if 'postgresql' in DATABASES['default']['ENGINE']
+    else 'notifications.realtime.LocalBroker'
+))
+
 # Frontend URL for email links
 FRONTEND_URL = env('FRONTEND_URL', default='http://localhost:5173')
 
@@ -0,0 +1,173 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from materials.models import Material
+from messaging.models import Conversation, Message
+from properties.models import Property, Transaction
+from rest_framework.test import APIClient
+from users.models import User
+from .response_cache import cache_stats, invalidate_tags, tag_versions
+
+
+class TagVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidate_moves_only_its_tags(self):
+        before = tag_versions(['materials', 'properties'])
+        self.assertEqual(tag_versions(['materials', 'properties']), before)
+        invalidate_tags('materials')
+        after = tag_versions(['materials', 'properties'])
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1], before[1])
+
+    def test_lost_version_restarts_above_old_values(self):
+        before, = tag_versions(['materials'])
+        cache.clear()
+        invalidate_tags('materials')
+        self.assertGreater(tag_versions(['materials'])[0], before)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, API_CACHE_TIMEOUT=60)
+class CachedResponseTests(TestCase):
+    url = '/api/materials/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            email='user@example.com', username='user', password='pass', role='client'
+        ))
+        Material.objects.create(name='Cement', category='structural', unit='bag')
+
+    def names(self, response):
+        results = response.data['results'] if 'results' in response.data else response.data
+        return [material['name'] for material in results]
+
+    def test_hit_until_the_model_changes(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        # The query string is part of the key, in any order
+        self.assertEqual(self.client.get(self.url, {'search': 'cem', 'ordering': 'name'})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'{self.url}?ordering=name&search=cem')['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Material.objects.create(name='Sand', category='structural', unit='ton')
+        third = self.client.get(self.url)
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertIn('Sand', self.names(third))
+        stats = next(row for row in cache_stats() if row['view'] == 'MaterialListCreateView')
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+
+    def test_writes_without_signals_need_invalidate_tags(self):
+        self.client.get(self.url)
+        Material.objects.update(name='Lime')
+        self.assertNotIn('Lime', self.names(self.client.get(self.url)))
+        invalidate_tags('materials')
+        self.assertIn('Lime', self.names(self.client.get(self.url)))
+
+    def test_zero_timeout_disables_the_cache(self):
+        with self.settings(API_CACHE_TIMEOUT=0):
+            self.client.get(self.url)
+            self.assertNotIn('X-Cache', self.client.get(self.url))
+
+    @override_settings(SHARED_CACHE=False, WEB_CONCURRENCY=4)
+    def test_per_process_cache_is_refused_with_several_workers(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Cache', response)
+        # ETags fall back to the rows, since tag versions differ per worker
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Material.objects.create(name='Sand', category='structural', unit='ton')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(SHARED_CACHE=True, WEB_CONCURRENCY=4)
+    def test_shared_cache_serves_several_workers(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, API_CACHE_TIMEOUT=60)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(
+            email='agent@example.com', username='agent', password='pass', role='agent'
+        )
+        self.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', role='client'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.agent)
+        self.listing = Property.objects.create(
+            title='House', description='', property_type='residential', address='1 Main Street',
+            city='Douala', state='Littoral', price=100000, agent=self.agent,
+        )
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_list_304_until_rows_or_tags_change(self):
+        url = '/api/properties/transactions/'
+        transaction = Transaction.objects.create(
+            property=self.listing, buyer=self.buyer, agent=self.agent, sale_price=90000
+        )
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response), 304)
+        # The ETag varies with the user
+        other = APIClient()
+        other.force_authenticate(self.buyer)
+        self.assertEqual(other.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        # A write that skips signals and updated_at is announced through its tag
+        Transaction.objects.filter(pk=transaction.pk).update(notes='Signed')
+        invalidate_tags('transactions')
+        self.assertEqual(self.revalidate(url, response), 200)
+
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.buyer.pk).get().save()
+        self.assertEqual(self.revalidate(url, response), 200)
+
+    def test_detail_last_modified(self):
+        transaction = Transaction.objects.create(
+            property=self.listing, buyer=self.buyer, agent=self.agent, sale_price=90000
+        )
+        url = f'/api/properties/transactions/{transaction.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(int(transaction.updated_at.timestamp())))
+        self.assertEqual(self.revalidate(url, response), 304)
+        since = http_date((transaction.updated_at + timedelta(seconds=1)).timestamp())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 304)
+        since = http_date((transaction.updated_at - timedelta(seconds=1)).timestamp())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_cached_view_304_from_tags(self):
+        url = f'/api/properties/{self.listing.pk}/'
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response), 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.save()
+        self.assertEqual(self.revalidate(url, response), 200)
+
+    def test_conversation_list_304(self):
+        url = '/api/messaging/conversations/'
+        conversation = Conversation.objects.create(subject='Deal', created_by=self.agent)
+        conversation.participants.add(self.agent, self.buyer)
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.revalidate(url, response), 304)
+        # Validated against the plain rows, not the annotated inbox
+        self.assertFalse(any('"messages"' in query['sql'] for query in queries))
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=conversation, sender=self.buyer, message='Hello')
+        self.assertEqual(self.revalidate(url, response), 200)
@@ -21,6 +21,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from .response_cache import ResponseCacheStatsView
 
 # API Documentation
 schema_view = get_schema_view(
@@ -55,6 +56,7 @@ urlpatterns = [
     path('api/search/', include('search.urls')),
     path('api/appointments/', include('appointments.urls')),
     path('api/messaging/', include('messaging.urls')),
+    path('api/cache-stats/', ResponseCacheStatsView.as_view(), name='cache-stats'),
 ]
 
 # Serve media files in development
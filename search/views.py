@@ -44,7 +44,7 @@ def global_search(request):
             Q(address__icontains=query) |
             Q(city__icontains=query) |
             Q(state__icontains=query)
-        )[:limit]
+        ).select_related('agent').prefetch_related('images')[:limit]
         results['properties'] = {
             'count': properties.count(),
             'data': PropertyListSerializer(properties, many=True, context={'request': request}).data
@@ -101,13 +101,7 @@ def global_search(request):
         )
 
         # Filter by user permissions
-        if not request.user.is_staff:
-            documents = documents.filter(
-                Q(uploaded_by=request.user) |
-                Q(is_public=True) |
-                Q(related_property__agent=request.user) |
-                Q(related_transaction__agent=request.user)
-            ).distinct()
+        documents = documents.visible_to(request.user)
 
         documents = documents[:limit]
         results['documents'] = {
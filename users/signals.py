@@ -0,0 +1,8 @@
+"""
+Django signals retiring cached responses that show user names when a user
+changes; the activity middleware's ``last_login`` writes are ignored
+"""
+from django.contrib.auth import get_user_model
+from real_estate_platform.response_cache import invalidate_on_change
+
+invalidate_on_change(get_user_model(), 'users', ignore_fields=['last_login'])